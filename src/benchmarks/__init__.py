@@ -0,0 +1,7 @@
+# Benchmark suite for the hot paths of the simulation: the RK4 step, particle updates, field evaluation, whole runs and data file I/O
+# Run from the src folder with
+#   python -m benchmarks [--quick] [--output results.json] [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.2]
+# Results (timings, particle-steps per second, peak traced memory per call) are saved as JSON and compared against a stored baseline, exiting with status 1 if any benchmark slowed down by more than the tolerance
+# Rates are machine specific, so no baseline is committed; to check a change for regressions, first save a baseline of the unchanged code on the machine the comparisons are run on with
+#   python -m benchmarks --save-baseline
+# which writes benchmarks/baseline.json (or the --baseline path), then rerun python -m benchmarks after the change to compare against it
@@ -0,0 +1,30 @@
+import argparse
+import sys
+import os
+from benchmarks import harness, suite
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Times the particle push, field evaluation, data generation and data I/O, and compares the rates against a stored baseline")
+parser.add_argument("--quick", action="store_true", help="leave out the largest particle counts and shorten runs")
+parser.add_argument("--output", help="path of a JSON file to save the results to")
+parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json"), help="path of the baseline JSON file to compare against")
+parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline instead of comparing against it")
+parser.add_argument("--tolerance", type=float, default=0.2, help="fraction by which a rate may fall below its baseline before it counts as a regression")
+parser.add_argument("--repeats", type=int, default=3, help="number of timing rounds per benchmark (the best is kept)")
+parser.add_argument("--min-time", type=float, default=0.2, help="minimum duration in s of each timing round")
+args = parser.parse_args()
+
+results = harness.run(suite.benchmarks(args.quick), args.repeats, args.min_time)
+if args.output:
+    harness.save(args.output, results)
+if args.save_baseline:
+    harness.save(args.baseline, results)
+    print("Saved baseline to " + args.baseline)
+elif os.path.exists(args.baseline):
+    regressions = harness.compare(results, harness.load(args.baseline), args.tolerance)
+    for regression in regressions:
+        print("REGRESSION {name}: {rate:.4g} {unit}/s against baseline {baseline_rate:.4g} {unit}/s ({slowdown:.2f}x slower)".format(**regression))
+    if regressions:
+        sys.exit(1)
+    print("No regressions beyond {:.0%} of the baseline".format(args.tolerance))
+else:
+    print("No baseline at " + args.baseline + "; run with --save-baseline to create one")
@@ -0,0 +1,92 @@
+import numpy as np
+import platform
+import tracemalloc
+import contextlib
+import time
+import json
+import io
+import os
+import utility
+
+# Timing, memory measurement and baseline comparison for the benchmark suite
+
+def environment():
+    """Returns dictionary describing the machine and library versions the benchmarks ran with
+    """
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "platform" : platform.platform(),
+        "processor" : platform.processor(),
+        "cpu_count" : os.cpu_count(),
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "numba" : numba_version,
+    }
+
+def measure(function, repeats=3, min_time=0.2):
+    """Returns dictionary of the best time per call of function in s over repeats rounds of at least min_time s each, and of the peak memory traced during one further call in bytes
+    function is called once first to warm up (e.g. compile kernels and fill caches); anything it prints is discarded
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        best = np.inf
+        for _ in range(repeats):
+            calls = 0
+            start = time.perf_counter()
+            while True:
+                function()
+                calls += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = min(best, elapsed / calls)
+        tracemalloc.start() # traced separately as tracing slows allocations down
+        function()
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"seconds" : best, "peak_traced_bytes" : peak_traced}
+
+def run(benchmarks, repeats=3, min_time=0.2, report=print):
+    """Runs benchmarks and returns dictionary of results by benchmark name
+    Args:
+        benchmarks: list of tuples (name, setup) with setup a function returning tuple (function, work, unit) of the function to time, the amount of work one call does and its unit (e.g. "particle-steps")
+        report: function called with a line of text describing each result as it is measured
+    Each result holds the time per call in s, the work rate in units per s and the peak traced memory of a call in bytes
+    (the peak RSS of the process is left out, as it only ever grows over the suite and so would mostly report the largest benchmark run before)
+    """
+    results = {}
+    for (name, setup) in benchmarks:
+        with contextlib.redirect_stdout(io.StringIO()): # discards progress printed while preparing data
+            function, work, unit = setup()
+        result = measure(function, repeats, min_time)
+        result.update({"work" : work, "unit" : unit, "rate" : work / result["seconds"]})
+        results[name] = result
+        report("{:45s} {:12.4g} s/call {:12.4g} {}/s  peak traced {:8.1f} MB".format(name, result["seconds"], result["rate"], unit, result["peak_traced_bytes"] / 2**20))
+        del function # frees the benchmark's data before setting up the next one
+    return results
+
+def save(path, results):
+    """Saves results with a description of the environment as JSON to path
+    """
+    with utility.atomic_write(path, "w") as f:
+        json.dump({"environment" : environment(), "time" : time.strftime("%Y-%m-%d %H:%M:%S"), "results" : results}, f, indent=1)
+
+def load(path):
+    """Returns dictionary of results by benchmark name saved to path by save
+    """
+    with open(path, "r") as f:
+        return json.load(f)["results"]
+
+def compare(results, baseline, tolerance=0.2):
+    """Returns list of dictionaries describing the benchmarks whose rate fell below the baseline rate by more than the fraction tolerance
+    Benchmarks missing from either results or baseline are skipped
+    """
+    regressions = []
+    for (name, result) in results.items():
+        if name in baseline and result["rate"] < (1 - tolerance) * baseline[name]["rate"]:
+            regressions.append({"name" : name, "rate" : result["rate"], "baseline_rate" : baseline[name]["rate"], "slowdown" : baseline[name]["rate"] / result["rate"], "unit" : result["unit"]})
+    return regressions
@@ -0,0 +1,133 @@
+import numpy as np
+import tempfile
+import os
+import em
+import utility
+import sampler
+import compiled
+from simulation import Simulation
+
+# Benchmark definitions; each is a tuple (name, setup) with setup returning tuple (function, work, unit), see harness.run
+# Particle counts and numbers of steps are kept small enough for the whole suite to run in a few minutes (or seconds with quick)
+
+field_batch_size = 10**4 # positions per batched field evaluation
+scalar_calls = 100 # calls per timing of per particle methods (Particle.update, field_B)
+
+def benchmark_fields():
+    """Returns dictionary of an instance of every em field type by name, with ITER like toroidal parameters
+    """
+    B_vector = np.array((0, 0, 1), utility.dtype)
+    E_vector = np.array((0, 0, -1e3), utility.dtype)
+    G_vector = np.array((0, 0, -9.8), utility.dtype)
+    tokamak = em.Tokamak_Field(utility.dtype(16), utility.dtype(1e6), utility.dtype(2), utility.dtype(6), E_vector, G_vector)
+    return {
+        "Uniform_B_Field" : em.Uniform_B_Field(B_vector),
+        "EB_Field" : em.EB_Field(B_vector, E_vector),
+        "GB_Field" : em.GB_Field(B_vector, G_vector),
+        "Toroidal_B_Field" : em.Toroidal_B_Field(utility.dtype(16), utility.dtype(1e6), utility.dtype(2), utility.dtype(6)),
+        "Tokamak_Field" : tokamak,
+        "Coil_Field" : em.Coil_Field(utility.dtype(16), utility.dtype(1e6), utility.dtype(2), utility.dtype(6)),
+        "Coil_Tokamak_Field" : em.Coil_Tokamak_Field(utility.dtype(16), utility.dtype(1e6), utility.dtype(2), utility.dtype(6), E_vector, G_vector),
+        "Gridded_Field" : em.Gridded_Field(tokamak, (1.5, -2.5), (6.5, 2.5), (51, 51), axisymmetric=True, cache_folder=None),
+    }
+
+def tokamak_settings(particle_num, steps, seed=0):
+    """Returns simulation settings of particle_num deuterium ions drawn on the cylindric shell in an ITER like tokamak field, run for steps steps with no trajectory recording
+    """
+    rng = np.random.default_rng(seed)
+    timestep = 1e-11
+    return {
+        "field" : em.Tokamak_Field(utility.dtype(16), utility.dtype(1e6), utility.dtype(2), utility.dtype(6), np.array((0, 0, -1e3), utility.dtype), np.array((0, 0, -9.8), utility.dtype)),
+        "timestep" : timestep,
+        "simulation_time" : steps * timestep,
+        "electron_positions" : None,
+        "electron_velocities" : None,
+        "deuterium_positions" : sampler.shell_positions(rng, particle_num),
+        "deuterium_velocities" : sampler.maxwellian_velocities(rng, particle_num, utility.deuterium_mass, 1e8),
+        "recording" : {"mode" : "none"},
+    }
+
+def rk4_setup(particle_num):
+    """Times utility.two_eq_rk4 advancing particle_num particles gyrating in a uniform B field by a step
+    """
+    def setup():
+        rng = np.random.default_rng(0)
+        positions = rng.normal(size=(particle_num, 3))
+        velocities = rng.normal(size=(particle_num, 3))
+        B = np.array((0, 0, 1), utility.dtype)
+        charge_to_mass = utility.elementary_charge / utility.deuterium_mass
+        get_v = lambda x, v: v
+        get_a = lambda x, v: charge_to_mass * utility.cross_batch(v, B[None, :])
+        return (lambda: utility.two_eq_rk4(positions, get_v, velocities, get_a, 1e-9), particle_num, "particle-steps")
+    return setup
+
+def particle_update_setup():
+    """Times Particle.update advancing a single deuterium ion in a tokamak field
+    """
+    def setup():
+        field = benchmark_fields()["Tokamak_Field"]
+        particle = em.Deuterium_Ion(position=np.array((4, 0, 0), utility.dtype), velocity=np.array((1e5, 1e5, 1e5), utility.dtype), field=field)
+        def function():
+            for _ in range(scalar_calls):
+                particle.update(1e-12)
+        return (function, scalar_calls, "particle-steps")
+    return setup
+
+def field_B_setup(name, batch):
+    """Times the field_B method (or field_B_batch if batch) of the field named name
+    """
+    def setup():
+        field = benchmark_fields()[name]
+        rng = np.random.default_rng(0)
+        positions = sampler.torus_positions(rng, field_batch_size if batch else scalar_calls)
+        if batch:
+            out = np.empty(positions.shape, utility.dtype)
+            return (lambda: field.field_B_batch(positions, out), len(positions), "evaluations")
+        def function():
+            for position in positions:
+                field.field_B(position)
+        return (function, len(positions), "evaluations")
+    return setup
+
+def generate_data_setup(particle_num, steps, backend="python"):
+    """Times Simulation.generate_data on particle_num particles over steps steps with the given backend
+    """
+    def setup():
+        sim = Simulation()
+        sim.load_settings(tokamak_settings(particle_num, steps), backend)
+        return (sim.generate_data, particle_num * steps, "particle-steps")
+    return setup
+
+def io_setup(particle_num, steps):
+    """Times Simulation.output_data followed by Simulation.load_data of a run recording the trajectories of particle_num particles over steps steps
+    """
+    def setup():
+        sim = Simulation()
+        sim.load_settings(dict(tokamak_settings(particle_num, steps), recording={"mode" : "all"}))
+        sim.generate_data()
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, "benchmark.pkl")
+        def function():
+            try:
+                sim.output_data(absolute_path=path)
+                sim.load_data(absolute_path=path)
+            finally:
+                os.remove(path)
+        return (function, sim.data["data"].nbytes, "bytes")
+    return setup
+
+def benchmarks(quick=False):
+    """Returns list of (name, setup) tuples of the benchmark suite; quick leaves out the largest particle counts
+    """
+    particle_nums = [10**i for i in range(4 if quick else 6)] # 1 ... 10^5
+    steps = 5 if quick else 20
+    suite = [("two_eq_rk4/N={}".format(n), rk4_setup(n)) for n in (1, 10**3, 10**5)]
+    suite.append(("Particle.update", particle_update_setup()))
+    for name in benchmark_fields():
+        suite.append(("field_B/" + name, field_B_setup(name, False)))
+        suite.append(("field_B_batch/" + name, field_B_setup(name, True)))
+    suite += [("generate_data/python/N={}".format(n), generate_data_setup(n, steps)) for n in particle_nums]
+    if compiled.available:
+        suite += [("generate_data/numba/N={}".format(n), generate_data_setup(n, steps, "numba")) for n in particle_nums]
+    suite.append(("output_data+load_data", io_setup(100, 100 if quick else 1000)))
+    return suite
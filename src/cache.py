@@ -0,0 +1,120 @@
+import utility
+import hashlib
+import pickle
+import json
+import os
+
+# Content-addressed cache of simulation results, so that rerunning a notebook or sweep with unchanged settings loads the stored results instead of recomputing them
+# Enabled by the optional "result_cache" entry of the simulation settings dictionary: {"folder" : path, "max_bytes" : n}
+#   folder: cache directory ("Result Cache" by default)
+#   max_bytes: size cap of the cache directory (10 GB by default); the least recently used results are evicted once it is exceeded
+# Results are keyed by a hash of everything that determines them: the settings (field type and parameters, particle initial conditions, timestep, integrator, recording policy, ...),
+# the backend and the source code of the modules that compute them, so any change to that code invalidates the cached results
+# Runs streaming their trajectories to disk (the "stream_output" setting) are not cached, as their results live in the streamed files
+
+default_folder = "Result Cache"
+default_max_bytes = 10 * 1024**3
+ignored_settings = ("result_cache", "checkpoint", "instrumentation") # settings which don't change the results
+ignored_field_parameters = ("cache_folder",) # field parameters which don't change the fields (where Gridded_Field caches its sampled grids)
+code_modules = ("em", "simulation", "recording", "compiled", "pic", "coulomb", "instrumentation", "utility") # modules whose source code determines the results
+
+_code_version = None
+
+def code_version():
+    """Returns hash of the source code of code_modules, computed once per process
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for module in code_modules:
+            with open(os.path.join(folder, module + ".py"), "rb") as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def without_ignored_field_parameters(description):
+    """Returns copy of the JSON compatible description with the ignored_field_parameters left out of every field description (see em.Field.to_dict) within it
+    """
+    if isinstance(description, dict):
+        if "name" in description and isinstance(description.get("parameters"), dict):
+            description = dict(description, parameters={name : value for (name, value) in description["parameters"].items() if name not in ignored_field_parameters})
+        return {name : without_ignored_field_parameters(value) for (name, value) in description.items()}
+    if isinstance(description, list):
+        return [without_ignored_field_parameters(item) for item in description]
+    return description
+
+def settings_key(settings, backend="python"):
+    """Returns hash identifying the results of a simulation with the given settings dictionary and backend
+    """
+    description = utility.json_compatible({
+        "settings" : without_ignored_field_parameters(utility.json_compatible({name : value for (name, value) in settings.items() if name not in ignored_settings})),
+        "backend" : backend,
+        "code_version" : code_version(),
+    })
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+class Result_Cache:
+    """
+    Directory of pickled simulation data dictionaries named by their settings keys, with least recently used eviction beyond max_bytes
+    A result's file modification time records when it was last used
+    """
+    def __init__(self, folder=default_folder, max_bytes=default_max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Returns Result_Cache described by the "result_cache" settings dictionary entry
+        """
+        return cls(settings.get("folder", default_folder), settings.get("max_bytes", default_max_bytes))
+
+    def path(self, key):
+        return os.path.join(self.folder, key + ".pkl")
+
+    def get(self, key):
+        """Returns the data dictionary stored under key, or None if there is none
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError): # missing, or evicted while being read
+            return None
+        try:
+            os.utime(path) # marks the result as most recently used
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Stores the data dictionary under key, then evicts least recently used results until the cache is within max_bytes
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(key)
+        with utility.atomic_write(path) as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Deletes least recently used results until the cache is within max_bytes, never deleting the file at path keep
+        """
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.folder, name)))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,44 @@
+import pickle
+import utility
+import time
+
+# Periodic checkpointing of running simulations, so that long runs can be resumed with Simulation.resume after being killed
+# Configured by the optional "checkpoint" entry of the simulation settings dictionary: {"path" : checkpoint file path, "every_steps" : n, "every_seconds" : t}
+# A checkpoint is saved whenever at least n steps or at least t wall clock seconds have passed since the last one (either may be left out)
+
+class Checkpointer:
+    """
+    Decides when checkpoints of a running simulation are due and saves them
+    """
+    def __init__(self, policy=None, steps_completed=0):
+        policy = policy or {}
+        self.path = policy.get("path")
+        self.every_steps = policy.get("every_steps")
+        self.every_seconds = policy.get("every_seconds")
+        self.last_step = steps_completed # number of steps completed at the last checkpoint
+        self.last_time = time.monotonic() # wall clock time of the last checkpoint
+
+    def due(self, steps_completed):
+        """Returns whether a checkpoint should be saved now that steps_completed steps are completed
+        """
+        if self.path is None:
+            return False
+        if self.every_steps and steps_completed - self.last_step >= self.every_steps:
+            return True
+        if self.every_seconds and time.monotonic() - self.last_time >= self.every_seconds:
+            return True
+        return False
+
+    def save(self, checkpoint, steps_completed):
+        """Saves the checkpoint (a picklable object) to self.path, replacing the previous checkpoint only once the new one is fully written
+        """
+        with utility.atomic_write(self.path) as f:
+            pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        self.last_step = steps_completed
+        self.last_time = time.monotonic()
+
+def load(path):
+    """Returns the checkpoint saved at path
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,294 @@
+import numpy as np
+import utility
+
+# Optional compiled backend: fuses the Lorentz + E + gravity RK4 (or adaptive Dormand-Prince 5(4)) step for the built in field types into a single kernel looping over the whole particle batch and all time steps
+# Numba is an optional dependency; if it is missing, available is False and simulations fall back to the pure Python (NumPy) path
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+# Names of the field types whose fields the compiled kernel knows how to evaluate
+supported_fields = ("Field", "Uniform_B_Field", "EB_Field", "GB_Field", "Toroidal_B_Field", "Tokamak_Field")
+
+def jit(**options):
+    """Returns a decorator compiling a function with numba.njit using the given options, or leaving it unchanged if numba is not installed
+    """
+    def decorator(function):
+        if numba is None:
+            return function
+        return numba.njit(**options)(function)
+    return decorator
+
+prange = numba.prange if numba is not None else range
+
+def supports(settings):
+    """Returns whether the compiled kernels can run a simulation with the given settings; they need a built in field type, the RK4 or RK45 integrator (see runners) and no interaction between particles (space charge or Coulomb)
+    """
+    return settings["field"].name in supported_fields and settings.get("integrator", "rk4") in runners and "space_charge" not in settings and "coulomb" not in settings
+
+def field_parameters(field):
+    """Returns tuple (B_vector, E_vector, G_vector, toroidal) describing field for the compiled kernel
+    toroidal is a float array (flag, strength_factor, inner_radius, outer_radius, z_top, z_bot); when flag is 1 the toroidal B field is used in place of B_vector
+    """
+    B_vector = np.array(getattr(field, "B_vector", utility.zero_vec), utility.dtype)
+    E_vector = np.array(getattr(field, "E_vector", utility.zero_vec), utility.dtype)
+    G_vector = np.array(getattr(field, "G_vector", utility.zero_vec), utility.dtype)
+    if field.name in ("Toroidal_B_Field", "Tokamak_Field"):
+        toroidal = np.array((1, field.strength_factor, field.inner_radius, field.outer_radius, field.z_top, field.z_bot), utility.dtype)
+    else:
+        toroidal = np.zeros(6, utility.dtype)
+    return (B_vector, E_vector, G_vector, toroidal)
+
+# Dormand-Prince tableau of utility as arrays for the compiled kernel; row i of dormand_prince_a holds the coefficients of stage i
+dormand_prince_a = np.zeros((7, 7), utility.dtype)
+for (stage, coefficients) in enumerate(utility.dormand_prince_a):
+    dormand_prince_a[stage, :len(coefficients)] = coefficients
+dormand_prince_b = np.array(utility.dormand_prince_b, utility.dtype)
+dormand_prince_e = np.array(utility.dormand_prince_e, utility.dtype)
+
+@jit(inline="always")
+def _field_B(px, py, pz, B_vector, toroidal):
+    """Returns B field components at position (px, py, pz); mirrors em.Toroidal_B_Field.field_B_batch for toroidal fields
+    """
+    if toroidal[0] == 0:
+        return (B_vector[0], B_vector[1], B_vector[2])
+    r = np.sqrt(px*px + py*py)
+    if _contains(px, py, pz, toroidal):
+        scale = toroidal[1] / r
+        return (-(scale * py) / r, (scale * px) / r, 0.0)
+    return (0.0, 0.0, 0.0)
+
+@jit(inline="always")
+def _contains(px, py, pz, toroidal):
+    """Returns whether position (px, py, pz) lies within the toroidal field region; mirrors em.Toroidal_B_Field.contains
+    """
+    r = np.sqrt(px*px + py*py)
+    return r > toroidal[2] and r < toroidal[3] and pz < toroidal[4] and pz > toroidal[5]
+
+@jit(inline="always")
+def _boundary_crossing(x0, y0, z0, x1, y1, z1, toroidal):
+    """Returns tuple (fraction, face) of the fraction along the straight segment from (x0, y0, z0) inside the toroidal field region to (x1, y1, z1) outside it at which it first leaves the region,
+    and the code of the face crossed there (index into em.region_faces); mirrors em.Toroidal_B_Field.boundary_crossings
+    """
+    dx, dy, dz = x1 - x0, y1 - y0, z1 - z0
+    fraction = np.inf
+    face = -1
+    a = dx*dx + dy*dy
+    if a > 0:
+        b = 2 * (x0*dx + y0*dy)
+        c = x0*x0 + y0*y0
+        inner_discriminant = b*b - 4 * a * (c - toroidal[2]**2)
+        if inner_discriminant >= 0:
+            inner = (-b - np.sqrt(inner_discriminant)) / (2 * a)
+            if inner >= 0 and inner < fraction:
+                fraction, face = inner, 0
+        outer_discriminant = b*b - 4 * a * (c - toroidal[3]**2)
+        outer = (-b + np.sqrt(max(outer_discriminant, 0.0))) / (2 * a)
+        if outer < fraction:
+            fraction, face = outer, 1
+    if dz > 0 and (toroidal[4] - z0) / dz < fraction:
+        fraction, face = (toroidal[4] - z0) / dz, 2
+    elif dz < 0 and (toroidal[5] - z0) / dz < fraction:
+        fraction, face = (toroidal[5] - z0) / dz, 3
+    return (min(max(fraction, 0.0), 1.0), face)
+
+@jit(inline="always")
+def _acceleration(px, py, pz, vx, vy, vz, charge, mass, B_vector, E_vector, G_vector, toroidal):
+    """Returns acceleration components of a particle; mirrors em.Particle_Batch.total_force divided by mass
+    """
+    bx, by, bz = _field_B(px, py, pz, B_vector, toroidal)
+    fx = charge * ((vy * bz) - (vz * by))
+    fy = charge * ((vz * bx) - (vx * bz))
+    fz = charge * ((vx * by) - (vy * bx))
+    fx += charge * E_vector[0]
+    fy += charge * E_vector[1]
+    fz += charge * E_vector[2]
+    fx += mass * G_vector[0]
+    fy += mass * G_vector[1]
+    fz += mass * G_vector[2]
+    return (fx / mass, fy / mass, fz / mass)
+
+@jit(inline="always")
+def _record(trajectory, i, step, record_interval, window, px, py, pz):
+    """Records the position (px, py, pz) of particle i at the start of step if the recording policy (see rk4_kernel) records it
+    """
+    if record_interval != 0 and step % record_interval == 0:
+        slot = step % window if window != 0 else step // record_interval
+        trajectory[i, slot, 0] = px
+        trajectory[i, slot, 1] = py
+        trajectory[i, slot, 2] = pz
+
+@jit(inline="always")
+def _record_escape(i, step, x0, y0, z0, u0, v0, w0, px, py, pz, vx, vy, vz, times, h, toroidal, escape_times, escape_steps, escape_states):
+    """Returns whether particle i first left the toroidal field region in step, going from kinematics (x0, y0, z0, u0, v0, w0) to (px, py, pz, vx, vy, vz);
+    if so fills in its escape time, step and state (see rk4_kernel)
+    """
+    if toroidal[0] == 0 or not np.isnan(escape_times[i]) or _contains(px, py, pz, toroidal):
+        return False
+    fraction, face = _boundary_crossing(x0, y0, z0, px, py, pz, toroidal)
+    escape_times[i] = times[step] - (1 - fraction) * h
+    escape_steps[i] = step
+    escape_states[i, 0] = x0 + fraction * (px - x0)
+    escape_states[i, 1] = y0 + fraction * (py - y0)
+    escape_states[i, 2] = z0 + fraction * (pz - z0)
+    escape_states[i, 3] = u0 + fraction * (vx - u0)
+    escape_states[i, 4] = v0 + fraction * (vy - v0)
+    escape_states[i, 5] = w0 + fraction * (vz - w0)
+    escape_states[i, 6] = face
+    return True
+
+@jit(parallel=True, cache=True, nogil=True) # releases the GIL so that threads (e.g. job queue heartbeats) keep running during long kernel calls
+def rk4_kernel(positions, velocities, charges, masses, B_vector, E_vector, G_vector, toroidal, times, start, stop, h, trajectory, record_interval, window, escape_times, escape_steps, escape_states, retire):
+    """Advances all particles over the time steps start to stop - 1 with RK4, recording positions and confinement escape times
+    Args:
+        positions, velocities: (N, 3) arrays of initial particle kinematics; overwritten with the final kinematics
+        charges, masses: (N,) arrays of particle charges and masses
+        B_vector, E_vector, G_vector, toroidal: field description as returned by field_parameters
+        times: (steps,) array of simulation times at the end of each step
+        start, stop: range of step indices to advance over
+        h: timestep in s
+        trajectory: (N, records, 3) array filled with particle positions at the start of the recorded steps
+        record_interval, window: recording policy as in recording.Trajectory_Recorder; positions are recorded every record_interval steps (never if 0), into a ring buffer of length window if window is nonzero
+        escape_times: (N,) array of the time each particle escaped the toroidal field region, NaN if it hasn't (yet); filled in as particles escape,
+            interpolating their positions linearly over the step in which they crossed the region boundary
+        escape_steps: (N,) integer array filled with the index of the step in which each particle escaped during this call, -1 for the others
+        escape_states: (N, 7) array filled with the position, velocity (interpolated linearly over the step) and boundary face code (index into em.region_faces) at the escape of each particle escaping during this call
+        retire: if True particles are no longer advanced or recorded after they escape
+    """
+    for i in prange(positions.shape[0]):
+        if retire and not np.isnan(escape_times[i]):
+            continue
+        q = charges[i]
+        m = masses[i]
+        px, py, pz = positions[i, 0], positions[i, 1], positions[i, 2]
+        vx, vy, vz = velocities[i, 0], velocities[i, 1], velocities[i, 2]
+        for step in range(start, stop):
+            _record(trajectory, i, step, record_interval, window, px, py, pz)
+            x0, y0, z0, u0, v0, w0 = px, py, pz, vx, vy, vz
+            # Same sequence of operations as utility.two_eq_rk4 with x as position and y as velocity
+            j1x, j1y, j1z = _acceleration(px, py, pz, vx, vy, vz, q, m, B_vector, E_vector, G_vector, toroidal)
+            k1x, k1y, k1z = vx, vy, vz
+            k2x, k2y, k2z = vx + h*j1x/2, vy + h*j1y/2, vz + h*j1z/2
+            j2x, j2y, j2z = _acceleration(px + h*k1x/2, py + h*k1y/2, pz + h*k1z/2, k2x, k2y, k2z, q, m, B_vector, E_vector, G_vector, toroidal)
+            k3x, k3y, k3z = vx + h*j2x/2, vy + h*j2y/2, vz + h*j2z/2
+            j3x, j3y, j3z = _acceleration(px + h*k2x/2, py + h*k2y/2, pz + h*k2z/2, k3x, k3y, k3z, q, m, B_vector, E_vector, G_vector, toroidal)
+            k4x, k4y, k4z = vx + h*j3x, vy + h*j3y, vz + h*j3z
+            j4x, j4y, j4z = _acceleration(px + h*k3x, py + h*k3y, pz + h*k3z, k4x, k4y, k4z, q, m, B_vector, E_vector, G_vector, toroidal)
+            px = px + (h/6) * (k1x + 2*k2x + 2*k3x + k4x)
+            py = py + (h/6) * (k1y + 2*k2y + 2*k3y + k4y)
+            pz = pz + (h/6) * (k1z + 2*k2z + 2*k3z + k4z)
+            vx = vx + (h/6) * (j1x + 2*j2x + 2*j3x + j4x)
+            vy = vy + (h/6) * (j1y + 2*j2y + 2*j3y + j4y)
+            vz = vz + (h/6) * (j1z + 2*j2z + 2*j3z + j4z)
+            # Records the first time the particle leaves the toroidal field region
+            if _record_escape(i, step, x0, y0, z0, u0, v0, w0, px, py, pz, vx, vy, vz, times, h, toroidal, escape_times, escape_steps, escape_states) and retire:
+                break
+        positions[i, 0], positions[i, 1], positions[i, 2] = px, py, pz
+        velocities[i, 0], velocities[i, 1], velocities[i, 2] = vx, vy, vz
+
+@jit(inline="always")
+def _dormand_prince_step(state, h, q, m, B_vector, E_vector, G_vector, toroidal, derivatives, stage_state, result, error):
+    """Fills result with the kinematics (position then velocity components) of a particle after a Dormand-Prince 5(4) step of h from state, and error with the estimate of its local error;
+    mirrors utility.two_eq_dormand_prince; derivatives (7, 6) and stage_state (6,) are scratch arrays
+    """
+    for stage in range(7):
+        for c in range(6):
+            total = 0.0
+            for previous in range(stage):
+                if dormand_prince_a[stage, previous] != 0:
+                    total += dormand_prince_a[stage, previous] * derivatives[previous, c]
+            stage_state[c] = state[c] + h * total
+        ax, ay, az = _acceleration(stage_state[0], stage_state[1], stage_state[2], stage_state[3], stage_state[4], stage_state[5], q, m, B_vector, E_vector, G_vector, toroidal)
+        derivatives[stage, 0], derivatives[stage, 1], derivatives[stage, 2] = stage_state[3], stage_state[4], stage_state[5]
+        derivatives[stage, 3], derivatives[stage, 4], derivatives[stage, 5] = ax, ay, az
+    for c in range(6):
+        total = 0.0
+        error_total = 0.0
+        for stage in range(7):
+            if dormand_prince_b[stage] != 0:
+                total += dormand_prince_b[stage] * derivatives[stage, c]
+            if dormand_prince_e[stage] != 0:
+                error_total += dormand_prince_e[stage] * derivatives[stage, c]
+        result[c] = state[c] + h * total
+        error[c] = h * error_total
+
+@jit(inline="always")
+def _norm(vector, offset):
+    """Returns the length of the 3 vector held in vector[offset:offset + 3]
+    """
+    return np.sqrt(vector[offset]**2 + vector[offset + 1]**2 + vector[offset + 2]**2)
+
+@jit(parallel=True, cache=True, nogil=True)
+def rk45_kernel(positions, velocities, charges, masses, B_vector, E_vector, G_vector, toroidal, times, start, stop, h, trajectory, record_interval, window, escape_times, escape_steps, escape_states, retire, step_sizes, rtol, atol):
+    """Advances all particles over the time steps start to stop - 1 with adaptive Dormand-Prince 5(4) substeps, recording positions and confinement escape times; mirrors em.Particle_Batch.step_rk45
+    Args as for rk4_kernel, and:
+        step_sizes: (N,) array of the internal step size of each particle, carried over between steps and calls; updated in place
+        rtol, atol: relative and absolute error tolerances of each internal step
+    """
+    tiny = np.finfo(np.float64).tiny
+    for i in prange(positions.shape[0]):
+        if retire and not np.isnan(escape_times[i]):
+            continue
+        q = charges[i]
+        m = masses[i]
+        state = np.empty(6)
+        state[0], state[1], state[2] = positions[i, 0], positions[i, 1], positions[i, 2]
+        state[3], state[4], state[5] = velocities[i, 0], velocities[i, 1], velocities[i, 2]
+        derivatives = np.empty((7, 6))
+        stage_state = np.empty(6)
+        result = np.empty(6)
+        error = np.empty(6)
+        for step in range(start, stop):
+            _record(trajectory, i, step, record_interval, window, state[0], state[1], state[2])
+            x0, y0, z0, u0, v0, w0 = state[0], state[1], state[2], state[3], state[4], state[5]
+            remaining = h # time left for the particle to reach the end of the timestep
+            while remaining > 0:
+                substep = min(step_sizes[i], remaining)
+                _dormand_prince_step(state, substep, q, m, B_vector, E_vector, G_vector, toroidal, derivatives, stage_state, result, error)
+                # Error relative to tolerance, taking the worse of the position and velocity errors
+                position_scale = atol + rtol * max(_norm(state, 0), _norm(result, 0))
+                velocity_scale = atol + rtol * max(_norm(state, 3), _norm(result, 3))
+                relative_error = max(_norm(error, 0) / max(position_scale, tiny), _norm(error, 3) / max(velocity_scale, tiny))
+                if np.isnan(relative_error):
+                    relative_error = np.inf
+                if relative_error <= 1 or substep <= h * 1e-12: # steps far smaller than h are accepted regardless to guarantee progress
+                    state[:] = result
+                    remaining = 0.0 if substep == remaining else remaining - substep
+                step_sizes[i] = substep * min(max(0.9 * max(relative_error, 1e-10) ** -0.2, 0.2), 5.0)
+            # Records the first time the particle leaves the toroidal field region
+            if _record_escape(i, step, x0, y0, z0, u0, v0, w0, state[0], state[1], state[2], state[3], state[4], state[5], times, h, toroidal, escape_times, escape_steps, escape_states) and retire:
+                break
+        positions[i, 0], positions[i, 1], positions[i, 2] = state[0], state[1], state[2]
+        velocities[i, 0], velocities[i, 1], velocities[i, 2] = state[3], state[4], state[5]
+
+def run_rk4(particle_batch, timestep, times, start, stop, recorder, escape_times, retire=False):
+    """Runs the compiled RK4 kernel on a em.Particle_Batch instance in place over the steps start to stop - 1, recording positions into the buffer of recorder (a recording.Trajectory_Recorder)
+    escape_times is a (N,) array of escape times (NaN where the particle hasn't escaped) which is updated in place
+    If retire is True escaped particles are skipped rather than advanced; they are left in the batch, holding their kinematics at the step they escaped
+    Returns tuple (escape_steps, escape_states) of (N,) array of the index of the step in which each particle escaped over these steps, -1 for the others,
+    and (N, 7) array of the position, velocity and boundary face code at their escape (see rk4_kernel)
+    """
+    escape_steps = np.full(len(escape_times), -1, np.int64)
+    escape_states = np.zeros((len(escape_times), 7), utility.dtype)
+    rk4_kernel(particle_batch.positions, particle_batch.velocities, particle_batch.charges, particle_batch.masses, *field_parameters(particle_batch.field), np.asarray(times, utility.dtype), start, stop, utility.dtype(timestep), recorder.buffer, recorder.interval, recorder.window, escape_times, escape_steps, escape_states, retire)
+    particle_batch.escaped |= ~np.isnan(escape_times)
+    return (escape_steps, escape_states)
+
+def run_rk45(particle_batch, timestep, times, start, stop, recorder, escape_times, retire=False):
+    """Runs the compiled adaptive Dormand-Prince kernel on a em.Particle_Batch instance in place as run_rk4 does, using the tolerances in its integrator_options
+    The internal step sizes of the particles are carried over between calls in particle_batch.step_sizes, as with em.Particle_Batch.step_rk45
+    """
+    if particle_batch.step_sizes is None:
+        particle_batch.step_sizes = np.full(len(particle_batch), timestep, utility.dtype)
+    escape_steps = np.full(len(escape_times), -1, np.int64)
+    escape_states = np.zeros((len(escape_times), 7), utility.dtype)
+    rtol = particle_batch.integrator_options.get("rtol", 1e-6)
+    atol = particle_batch.integrator_options.get("atol", 0)
+    rk45_kernel(particle_batch.positions, particle_batch.velocities, particle_batch.charges, particle_batch.masses, *field_parameters(particle_batch.field), np.asarray(times, utility.dtype), start, stop, utility.dtype(timestep), recorder.buffer, recorder.interval, recorder.window, escape_times, escape_steps, escape_states, retire, particle_batch.step_sizes, utility.dtype(rtol), utility.dtype(atol))
+    particle_batch.escaped |= ~np.isnan(escape_times)
+    return (escape_steps, escape_states)
+
+runners = {"rk4" : run_rk4, "rk45" : run_rk45} # functions running the compiled kernels, by integrator name
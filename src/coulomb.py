@@ -0,0 +1,213 @@
+import numpy as np
+import utility
+
+# Pairwise Coulomb interaction between the simulated particles, for collisional runs with up to a few thousand particles
+# Enabled by the optional "coulomb" entry of the simulation settings dictionary: {"method" : "tree" or "direct", "theta" : opening angle, "softening" : length, "leaf_size" : n}
+#   method: "tree" (default) approximates the field of distant groups of particles with a Barnes-Hut octree in O(N log N); "direct" sums over all pairs in O(N^2)
+#   theta: Barnes-Hut opening angle (0.5 by default); a tree node of side s at distance d is approximated by its monopole and dipole moments if s / d < theta, so smaller values are more accurate and slower
+#   softening: Plummer softening length in m (0 by default), replacing r^2 by r^2 + softening^2 to limit the force in very close encounters
+#   leaf_size: maximum number of particles in an octree leaf, within which pairs are summed directly (8 by default)
+# As for the space charge mode (see pic.py), the field sources are the particle positions at the start of each step; the field is then evaluated at whichever positions the integrator needs
+
+coulomb_constant = 1 / (4 * np.pi * utility.permittivity_of_free_space)
+max_depth = 16 # maximum octree depth; particles closer than the root cube side / 2^max_depth share a leaf
+
+def direct_field_E(targets, sources, charges, target_ids=None, softening=0, chunk_size=10**6):
+    """Returns (N, 3) array of the Coulomb electric field at the (N, 3) targets argument due to the point charges at the (M, 3) sources argument, summed directly over all pairs
+    Args:
+        target_ids: optional (N,) array of the source index of each target, whose own charge is then left out of its field
+        softening: Plummer softening length in m
+        chunk_size: maximum number of target-source pairs evaluated at once, bounding temporary memory use
+    """
+    field = np.zeros((len(targets), 3), utility.dtype)
+    chunk = max(1, chunk_size // max(len(sources), 1))
+    for start in range(0, len(targets), chunk):
+        r = targets[start:start + chunk, None, :] - sources[None, :, :] # (chunk, M, 3)
+        r_squared = (r * r).sum(axis=2) + softening**2
+        inverse_cube = np.divide(1, r_squared**1.5, out=np.zeros(r_squared.shape, utility.dtype), where=r_squared > 0)
+        if target_ids is not None:
+            inverse_cube[np.arange(len(r)), target_ids[start:start + chunk]] = 0
+        field[start:start + chunk] = coulomb_constant * np.einsum("nm,nmc->nc", inverse_cube * charges, r)
+    return field
+
+def morton_codes(cells):
+    """Returns (N,) array of Morton (Z-order) codes interleaving the bits of the (N, 3) integer cells argument, so that sorting by code groups particles by octree node at every depth
+    """
+    codes = np.zeros(len(cells), np.int64)
+    for bit in range(max_depth):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + 2 - axis)
+    return codes
+
+class Octree_Level:
+    """
+    Nodes of a Coulomb_Tree at one depth, as arrays over the nodes; each node covers a contiguous range of the depth sorted particles
+    """
+    def __init__(self, depth, prefixes, starts, counts, size, sorted_positions, sorted_charges, leaf_size):
+        self.depth = depth
+        self.prefixes = prefixes # Morton code prefixes identifying the nodes
+        self.starts = starts # index of each node's first particle in the sorted particle arrays
+        self.counts = counts # number of particles in each node
+        self.size = size # side length of the nodes' cubes in m
+        self.leaf = (counts <= leaf_size) | (depth == max_depth)
+
+        # Monopole and dipole moments about each node's centre of absolute charge, which stays inside the node even when its net charge is near zero
+        absolute_charges = np.abs(sorted_charges)
+        total_absolute = np.add.reduceat(absolute_charges, starts)
+        weighted_positions = np.add.reduceat(absolute_charges[:, None] * sorted_positions, starts)
+        mean_positions = np.add.reduceat(sorted_positions, starts) / counts[:, None]
+        self.centres = np.where(total_absolute[:, None] > 0, weighted_positions / np.where(total_absolute > 0, total_absolute, 1)[:, None], mean_positions)
+        self.charges = np.add.reduceat(sorted_charges, starts)
+        self.dipoles = np.add.reduceat(sorted_charges[:, None] * sorted_positions, starts) - self.charges[:, None] * self.centres
+
+class Coulomb_Tree:
+    """
+    Barnes-Hut octree over a set of point charges, evaluating their Coulomb electric field at arbitrary positions in O(log N) per position
+    The tree is held as one Octree_Level per depth, and evaluation walks all positions down the tree together, level by level, as arrays of (position, node) pairs
+    """
+    target_chunk_size = 512 # number of targets walked down the tree together, keeping their pair arrays small enough to stay in cache
+
+    def __init__(self, positions, charges, leaf_size=8):
+        positions = np.asarray(positions, utility.dtype)
+        lower = positions.min(axis=0) if len(positions) else np.zeros(3, utility.dtype)
+        extent = (positions.max(axis=0) - lower).max() if len(positions) else 0
+        self.size = extent * (1 + 1e-9) if extent > 0 else utility.dtype(1) # side of the root cube
+        cells = np.minimum(((positions - lower) / self.size * 2**max_depth).astype(np.int64), 2**max_depth - 1)
+        codes = morton_codes(cells)
+        self.order = np.argsort(codes, kind="stable") # sorted index -> source index
+        self.ranks = np.empty(len(positions), np.intp) # source index -> sorted index
+        self.ranks[self.order] = np.arange(len(positions))
+        self.codes = codes[self.order]
+        self.positions = positions[self.order]
+        self.charges = np.asarray(charges, utility.dtype)[self.order]
+
+        # Builds levels down to the depth at which every node is a leaf
+        self.levels = []
+        for depth in range(max_depth + 1):
+            prefixes = self.codes >> (3 * (max_depth - depth))
+            starts = np.flatnonzero(np.diff(prefixes, prepend=-1)) if len(prefixes) else np.arange(0)
+            counts = np.diff(np.append(starts, len(prefixes)))
+            level = Octree_Level(depth, prefixes[starts], starts, counts, self.size / 2**depth, self.positions, self.charges, leaf_size)
+            self.levels.append(level)
+            if level.leaf.all():
+                break
+
+    def field_E(self, targets, target_ids=None, theta=0.5, softening=0):
+        """Returns (N, 3) array of the Coulomb electric field at the (N, 3) targets argument
+        Args:
+            target_ids: optional (N,) array of the source index of each target, whose own charge is then left out of its field
+            theta: opening angle; nodes of side s at distance d from a target are approximated by their monopole and dipole moments if s / d < theta
+            softening: Plummer softening length in m
+        """
+        field = np.zeros((len(targets), 3), utility.dtype)
+        if len(self.positions) == 0:
+            return field
+        for start in range(0, len(targets), self.target_chunk_size):
+            chunk = slice(start, start + self.target_chunk_size)
+            field[chunk] = self.chunk_field_E(targets[chunk], None if target_ids is None else target_ids[chunk], theta, softening)
+        return field
+
+    def chunk_field_E(self, targets, target_ids, theta, softening):
+        """Returns (N, 3) array of the Coulomb electric field at the (N, 3) targets argument (see field_E), walking all targets down the tree together
+        """
+        field = np.zeros((len(targets), 3), utility.dtype)
+        own_ranks = None if target_ids is None else self.ranks[target_ids]
+        pair_targets = np.arange(len(targets))
+        pair_nodes = np.zeros(len(targets), np.intp) # every target starts at the root node
+        for level in self.levels:
+            if len(pair_targets) == 0:
+                break
+            r = targets[pair_targets] - level.centres[pair_nodes]
+            r_squared = (r * r).sum(axis=1) + softening**2
+            accept = level.size**2 < theta**2 * r_squared
+            if own_ranks is not None: # nodes holding the target's own charge are always opened, so it is left out at the leaves
+                accept &= (self.codes[own_ranks[pair_targets]] >> (3 * (max_depth - level.depth))) != level.prefixes[pair_nodes]
+
+            # Approximates accepted nodes by their monopole and dipole fields
+            accepted = np.flatnonzero(accept)
+            if len(accepted):
+                ra = r[accepted]
+                inverse = 1 / np.sqrt(r_squared[accepted])
+                dipoles = level.dipoles[pair_nodes[accepted]]
+                contributions = coulomb_constant * (
+                    (level.charges[pair_nodes[accepted]] * inverse**3)[:, None] * ra
+                    + (3 * (dipoles * ra).sum(axis=1) * inverse**5)[:, None] * ra - inverse[:, None]**3 * dipoles
+                )
+                self.accumulate(field, pair_targets[accepted], contributions)
+
+            # Sums opened leaves directly over their particles
+            opened = ~accept
+            leaves = np.flatnonzero(opened & level.leaf[pair_nodes])
+            if len(leaves):
+                leaf_targets, particles = self.expand(pair_targets[leaves], level.starts[pair_nodes[leaves]], level.counts[pair_nodes[leaves]])
+                if own_ranks is not None:
+                    others = particles != own_ranks[leaf_targets]
+                    leaf_targets, particles = leaf_targets[others], particles[others]
+                r = targets[leaf_targets] - self.positions[particles]
+                r_squared = (r * r).sum(axis=1) + softening**2
+                inverse_cube = np.divide(1, r_squared**1.5, out=np.zeros(r_squared.shape, utility.dtype), where=r_squared > 0)
+                self.accumulate(field, leaf_targets, coulomb_constant * (self.charges[particles] * inverse_cube)[:, None] * r)
+
+            # Opens the remaining nodes into their children at the next level
+            internal = np.flatnonzero(opened & ~level.leaf[pair_nodes])
+            if len(internal):
+                children = self.levels[level.depth + 1]
+                parent_prefixes = children.prefixes >> 3
+                nodes = pair_nodes[internal]
+                first_children = np.searchsorted(parent_prefixes, level.prefixes[nodes], "left")
+                child_counts = np.searchsorted(parent_prefixes, level.prefixes[nodes], "right") - first_children
+                pair_targets, pair_nodes = self.expand(pair_targets[internal], first_children, child_counts)
+            else:
+                pair_targets = pair_nodes = np.arange(0)
+        return field
+
+    @staticmethod
+    def expand(pair_targets, firsts, counts):
+        """Returns tuple (targets, indices) of arrays pairing each of the pair_targets argument with every index in its range firsts to firsts + counts - 1
+        """
+        targets = np.repeat(pair_targets, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return (targets, np.repeat(firsts, counts) + offsets)
+
+    @staticmethod
+    def accumulate(field, targets, contributions):
+        """Adds the (K, 3) contributions argument to the rows of field given by the (K,) targets argument, summing repeated targets
+        """
+        for axis in range(3):
+            field[:, axis] += np.bincount(targets, contributions[:, axis], len(field))
+
+class Coulomb_Interaction:
+    """
+    Coulomb field of the particles of a em.Particle_Batch on each other, with sources updated once per step
+    """
+    def __init__(self, method="tree", theta=0.5, softening=0, leaf_size=8):
+        if method not in ("tree", "direct"):
+            raise ValueError("Unknown Coulomb method: " + str(method) + "; expected \"tree\" or \"direct\"")
+        self.method = method
+        self.theta = theta
+        self.softening = softening
+        self.leaf_size = leaf_size
+        self.tree = None
+        self.sources = np.zeros((0, 3), utility.dtype)
+        self.charges = np.zeros(0, utility.dtype)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Returns Coulomb_Interaction described by the "coulomb" settings dictionary entry
+        """
+        return cls(settings.get("method", "tree"), settings.get("theta", 0.5), settings.get("softening", 0), settings.get("leaf_size", 8))
+
+    def update(self, positions, charges):
+        """Sets the field sources to point charges at the (N, 3) positions argument
+        """
+        self.sources = positions.copy()
+        self.charges = charges
+        if self.method == "tree":
+            self.tree = Coulomb_Tree(positions, charges, self.leaf_size)
+
+    def field_E_batch(self, positions, ids):
+        """Returns (N, 3) array of the Coulomb field at the (N, 3) positions argument of the particles with source indices ids, leaving out each particle's own charge
+        """
+        if self.method == "tree":
+            return self.tree.field_E(positions, ids, self.theta, self.softening)
+        return direct_field_E(positions, self.sources, self.charges, ids, self.softening)
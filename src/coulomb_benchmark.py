@@ -0,0 +1,32 @@
+import numpy as np
+import time
+import coulomb
+import utility
+
+# Benchmarks the Barnes-Hut Coulomb field (coulomb.Coulomb_Tree) against direct summation, showing the accuracy / speed trade-off of the opening angle theta
+# Particles are a quasi-neutral Gaussian cloud of equal numbers of deuterium ions and electrons; the error is the relative RMS difference from the direct sum over all particles
+
+def benchmark(particle_nums=(1000, 2000, 4000, 8000), thetas=(0.3, 0.5, 0.8), seed=0):
+    """Prints and returns list of dictionaries of timings and errors of the tree method for each number of particles and opening angle
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+    for particle_num in particle_nums:
+        positions = rng.normal(size=(particle_num, 3))
+        charges = np.where(np.arange(particle_num) % 2 == 0, utility.elementary_charge, -utility.elementary_charge)
+        ids = np.arange(particle_num)
+        start = time.perf_counter()
+        direct = coulomb.direct_field_E(positions, positions, charges, ids)
+        direct_time = time.perf_counter() - start
+        for theta in thetas:
+            start = time.perf_counter()
+            tree = coulomb.Coulomb_Tree(positions, charges)
+            field = tree.field_E(positions, ids, theta)
+            tree_time = time.perf_counter() - start
+            error = np.sqrt(((field - direct)**2).sum() / (direct**2).sum())
+            results.append({"particle_num" : particle_num, "theta" : theta, "direct_time" : direct_time, "tree_time" : tree_time, "relative_error" : error})
+            print("N = {:6d}, theta = {:.2f}: direct {:8.3f} s, tree {:8.3f} s, speed up {:6.2f}, relative RMS error {:.2e}".format(particle_num, theta, direct_time, tree_time, direct_time / tree_time, error))
+    return results
+
+if __name__ == "__main__":
+    benchmark()
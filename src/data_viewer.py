@@ -14,7 +14,7 @@ sim = Simulation()
 def load_data_func():
     """Opens a window to choose data file from and loads the chosen file into sim object instance 
     """
-    filename = filedialog.askopenfilename(initialdir=os.getcwd(), title="Select A Data File", filetypes=(("pkl files", "*.pkl"),))
+    filename = filedialog.askopenfilename(initialdir=os.getcwd(), title="Select A Data File", filetypes=(("pkl files", "*.pkl"), ("streamed data sidecar files", "*.json")))
     sim.load_data(absolute_path=filename)
 
 def process_input(input_widget): # For processing entries that should hold floats
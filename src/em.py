@@ -1,21 +1,104 @@
 import numpy as np
 import utility
+import instrumentation
+import itertools
+import hashlib
+import json
+import os
 
 # All units are in standard SI units
 
+region_faces = ("inner", "outer", "top", "bottom") # faces of the toroidal field region, in the order of the face codes returned by boundary_crossings
+
+def _field_array(positions, out=None):
+    """Returns out if it is a (N, 3) array matching the N positions argument, else a newly allocated (N, 3) array for holding field vectors
+    """
+    if out is None or out.shape != (len(positions), 3):
+        out = np.empty((len(positions), 3), utility.dtype)
+    return out
+
+def _unit_vectors(vectors):
+    """Returns (N, 3) array of the (N, 3) vectors argument scaled to unit length; zero vectors are left as zero
+    """
+    magnitudes = np.sqrt((vectors * vectors).sum(axis=1))[:, None]
+    return np.divide(vectors, magnitudes, out=np.zeros(vectors.shape, utility.dtype), where=magnitudes > 0)
+
 class Field:
+    gradient_step = 1e-6 # displacement in m used for finite difference derivatives of the B field
+    confining = False # whether the field confines particles to a region (given by contains), so that confinement escape is checked for
+
     def __init__(self):
         self.name = "Field"
         self.field_methods = (self.field_B,) # a tuple of field method functions for the all_fields method to use for calling individual field methods
+        self.batch_field_methods = (self.field_B_batch,) # a tuple of batch field method functions for the all_fields_batch method, in the same order as field_methods
 
     def all_fields(self, position):
         """Returns a dictionary with entries having keys denoting field type and value denoting field strength at position argument
         """
         return dict(method(position) for method in self.field_methods)
 
+    def all_fields_batch(self, positions, out=None):
+        """Returns a dictionary with entries having keys denoting field type and value denoting (N, 3) array of field strengths at the (N, 3) positions argument
+        Args:
+            positions: (N, 3) array of positions
+            out: optional dictionary of preallocated (N, 3) arrays keyed by field type which are filled in place (and added to if missing or of the wrong shape) to avoid allocating new arrays on every call
+        """
+        if out is None:
+            out = {}
+        for method in self.batch_field_methods:
+            name = method.__name__[:-len("_batch")] # e.g. "field_B" for field_B_batch
+            out[name] = method(positions, out.get(name))
+        return out
+
     def field_B(self, position):
         return ("field_B", utility.zero_vec.copy())
 
+    def field_B_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = 0
+        return out
+
+    def contains(self, positions):
+        """Returns (N,) boolean array of which of the (N, 3) positions argument lie within the field region; fields without a region contain everywhere
+        """
+        return np.ones(len(positions), bool)
+
+    def boundary_crossings(self, starts, ends):
+        """Returns tuple (fractions, faces) of (N,) arrays of the fractions along the straight segments from the (N, 3) starts argument (inside the field region) to the (N, 3) ends argument (outside it)
+        at which the segments first leave the field region, and of the codes of the region faces crossed there (indices into region_faces, -1 where unknown)
+        """
+        return (np.ones(len(starts), utility.dtype), np.full(len(starts), -1, np.int8))
+
+    def grad_B_magnitude_batch(self, positions):
+        """Returns (N, 3) array of the gradients of the B field magnitude at the (N, 3) positions argument, by central finite differences (fields with closed forms may override this)
+        """
+        gradient = np.empty((len(positions), 3), utility.dtype)
+        for axis in range(3):
+            step = np.zeros(3, utility.dtype)
+            step[axis] = self.gradient_step
+            forward = np.sqrt((self.field_B_batch(positions + step)**2).sum(axis=1))
+            backward = np.sqrt((self.field_B_batch(positions - step)**2).sum(axis=1))
+            gradient[:, axis] = (forward - backward) / (2 * self.gradient_step)
+        return gradient
+
+    def curvature_batch(self, positions):
+        """Returns (N, 3) array of the curvature vectors (b . grad) b of the B field lines at the (N, 3) positions argument, b being the unit B vector, by central finite differences along b (fields with closed forms may override this)
+        """
+        step = self.gradient_step * _unit_vectors(self.field_B_batch(positions))
+        forward = _unit_vectors(self.field_B_batch(positions + step))
+        backward = _unit_vectors(self.field_B_batch(positions - step))
+        return (forward - backward) / (2 * self.gradient_step)
+
+    def parameters(self):
+        """Returns dictionary of the constructor arguments of the field
+        """
+        return {}
+
+    def to_dict(self):
+        """Returns JSON compatible dictionary describing the field, from which field_from_dict can rebuild it
+        """
+        return {"name" : self.name, "parameters" : utility.json_compatible(self.parameters())}
+
 class Uniform_B_Field(Field):
     """
     Simulates an uniform magnetic field
@@ -23,12 +106,21 @@ class Uniform_B_Field(Field):
     def __init__(self, B_vector):
         super().__init__()
         self.field_methods = (self.field_B,)
+        self.batch_field_methods = (self.field_B_batch,)
         self.B_vector = B_vector
         self.name = "Uniform_B_Field"
 
     def field_B(self, position):
         return ("field_B", self.B_vector)
 
+    def field_B_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.B_vector
+        return out
+
+    def parameters(self):
+        return {"B_vector" : self.B_vector}
+
 class EB_Field(Uniform_B_Field):
     """
     Simulates an uniform magnetic and electric field
@@ -36,12 +128,21 @@ class EB_Field(Uniform_B_Field):
     def __init__(self, B_vector, E_vector):
         super().__init__(B_vector)
         self.field_methods = (self.field_B, self.field_E,)
+        self.batch_field_methods = (self.field_B_batch, self.field_E_batch,)
         self.E_vector = E_vector
         self.name = "EB_Field"
     
     def field_E(self, position):
         return ("field_E", self.E_vector)
 
+    def field_E_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.E_vector
+        return out
+
+    def parameters(self):
+        return {"B_vector" : self.B_vector, "E_vector" : self.E_vector}
+
 class GB_Field(Uniform_B_Field):
     """
     Simulates an uniform magnetic and gravitational field
@@ -49,18 +150,29 @@ class GB_Field(Uniform_B_Field):
     def __init__(self, B_vector, G_vector):
         super().__init__(B_vector)
         self.field_methods = (self.field_B, self.field_G,)
+        self.batch_field_methods = (self.field_B_batch, self.field_G_batch,)
         self.G_vector = G_vector
         self.name = "GB_Field"
     
     def field_G(self, position):
         return ("field_G", self.G_vector)
 
+    def field_G_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.G_vector
+        return out
+
+    def parameters(self):
+        return {"B_vector" : self.B_vector, "G_vector" : self.G_vector}
+
 class Toroidal_B_Field(Field): 
     """
     Simulates a toroidal magnetic field
     """
+    confining = True
     def __init__(self, coil_num, current, inner_radius, outer_radius):
         self.field_methods = (self.field_B, )
+        self.batch_field_methods = (self.field_B_batch, )
         self.coil_num = coil_num
         self.current = current
         self.inner_radius = inner_radius
@@ -74,29 +186,90 @@ class Toroidal_B_Field(Field):
         """
         The toroidal B field is shaped with a square cross section and centred about the axis x=y=0; B vectors point anti-clockwise when viewed downwards from the +z direction, i.e. in the direction where +90 degrees separation exists from +x direction to +y direction
         """
-        radius_vec = self.radius_vec(position)
-        r = np.sqrt(radius_vec.dot(radius_vec)) # modulus of radius_vec; 
-        if r > self.inner_radius and r < self.outer_radius and position[2] < self.z_top and position[2] > self.z_bot: # checks that particle position is within the toroidal field region
-            # Below cross product yields vector in direction perpendicular to radius vector and vector pointing in the +z axis direction; the resulting vector is also scaled to have magnitude = self.strength_factor / r
-            B_vector = np.cross(np.array((0,0, self.strength_factor / r), utility.dtype), radius_vec) / r
-        else:
-            B_vector = utility.zero_vec.copy()
-        return ("field_B", B_vector)
+        return ("field_B", self.field_B_batch(np.array(position, utility.dtype).reshape(1, 3))[0])
+
+    def field_B_batch(self, positions, out=None):
+        """Batch version of field_B; returns (N, 3) array of B vectors at the (N, 3) positions argument
+        """
+        out = _field_array(positions, out)
+        x = positions[:, 0]
+        y = positions[:, 1]
+        r = np.sqrt(x*x + y*y) # moduli of radius vectors
+        inside = self.contains(positions) # checks which positions are within the toroidal field region
+        r_inside = np.where(inside, r, 1) # avoids dividing by zero radius outside of the field region
+        scale = self.strength_factor / r_inside
+        # Below yields the cross product of (0, 0, self.strength_factor / r) with the radius vector (x, y, 0), scaled by 1 / r to have magnitude self.strength_factor / r
+        out[:, 0] = -(scale * y) / r_inside
+        out[:, 1] = (scale * x) / r_inside
+        out[:, 2] = 0
+        out[~inside] = 0
+        return out
     
+    def contains(self, positions):
+        """Returns (N,) boolean array of which of the (N, 3) positions argument lie within the toroidal field region, the square cross section torus between inner_radius and outer_radius, z_bot and z_top
+        """
+        r = np.sqrt(positions[:, 0]**2 + positions[:, 1]**2)
+        return (r > self.inner_radius) & (r < self.outer_radius) & (positions[:, 2] < self.z_top) & (positions[:, 2] > self.z_bot)
+
+    def boundary_crossings(self, starts, ends):
+        """Returns tuple (fractions, faces) of (N,) arrays of the fractions along the straight segments from the (N, 3) starts argument (inside the field region) to the (N, 3) ends argument (outside it)
+        at which the segments first leave the field region, and of the codes of the region faces crossed there (indices into region_faces);
+        the fractions are those of the first crossing of the inner and outer cylinders and the top and bottom planes
+        """
+        d = ends - starts
+        candidates = np.full((len(starts), len(region_faces)), np.inf, utility.dtype) # crossing fraction of each face, in the order of region_faces
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Cylinders, crossed where r^2 = a s^2 + b s + c equals the squared radius
+            a = d[:, 0]**2 + d[:, 1]**2
+            b = 2 * (starts[:, 0] * d[:, 0] + starts[:, 1] * d[:, 1])
+            c = starts[:, 0]**2 + starts[:, 1]**2
+            inner_discriminant = b*b - 4 * a * (c - self.inner_radius**2)
+            inner = (-b - np.sqrt(np.maximum(inner_discriminant, 0))) / (2 * a) # first crossing of the inner cylinder, if the line meets it ahead
+            candidates[:, 0] = np.where((a > 0) & (inner_discriminant >= 0) & (inner >= 0), inner, np.inf)
+            outer_discriminant = b*b - 4 * a * (c - self.outer_radius**2) # positive for segments starting inside the outer cylinder
+            candidates[:, 1] = np.where(a > 0, (-b + np.sqrt(np.maximum(outer_discriminant, 0))) / (2 * a), np.inf)
+            # Top and bottom planes, crossed where z is linear in the fraction
+            candidates[:, 2] = np.where(d[:, 2] > 0, (self.z_top - starts[:, 2]) / d[:, 2], np.inf)
+            candidates[:, 3] = np.where(d[:, 2] < 0, (self.z_bot - starts[:, 2]) / d[:, 2], np.inf)
+        faces = np.argmin(candidates, axis=1).astype(np.int8)
+        fractions = candidates[np.arange(len(starts)), faces]
+        faces[np.isinf(fractions)] = -1
+        return (np.clip(fractions, 0, 1), faces)
+
     def radius_vec(self, position):
         return np.array((position[0], position[1], 0), utility.dtype)
 
+    def grad_B_magnitude_batch(self, positions):
+        """Returns (N, 3) array of the gradients of the B field magnitude at the (N, 3) positions argument; inside the field region |B| = self.strength_factor / r, so the gradient is -self.strength_factor / r^2 along the radius vector
+        """
+        inside = self.contains(positions)[:, None]
+        radius_vecs = positions * np.array((1, 1, 0), utility.dtype)
+        r_squared = np.where(inside[:, 0], (radius_vecs * radius_vecs).sum(axis=1), 1)[:, None]
+        return np.where(inside, -self.strength_factor * radius_vecs / r_squared**1.5, 0)
+
+    def curvature_batch(self, positions):
+        """Returns (N, 3) array of the curvature vectors of the B field lines at the (N, 3) positions argument; the field lines are circles about the z axis, so the curvature is -1 / r along the radius vector
+        """
+        inside = self.contains(positions)[:, None]
+        radius_vecs = positions * np.array((1, 1, 0), utility.dtype)
+        r_squared = np.where(inside[:, 0], (radius_vecs * radius_vecs).sum(axis=1), 1)[:, None]
+        return np.where(inside, -radius_vecs / r_squared, 0)
+
+    def parameters(self):
+        return {"coil_num" : self.coil_num, "current" : self.current, "inner_radius" : self.inner_radius, "outer_radius" : self.outer_radius}
 
-class Tokamak_Field(Toroidal_B_Field):
+
+class Uniform_EG_Fields:
     """
-    Simulates a tokamak field based on the toroidal B field above with the addition of uniform electric and gravitational field
+    Mixin adding uniform electric and gravitational fields to a B field class, as in the tokamak fields; it goes before the B field class among the bases so that parameters extends the B field's parameters
     """
-    def __init__(self, coil_num, current, inner_radius, outer_radius, E_vector, G_vector):
-        super().__init__(coil_num, current, inner_radius, outer_radius)
+    def add_uniform_fields(self, E_vector, G_vector):
+        """Sets the uniform E and G field vectors and adds their methods to the field methods used by all_fields and all_fields_batch
+        """
         self.field_methods = (self.field_B, self.field_E, self.field_G)
+        self.batch_field_methods = (self.field_B_batch, self.field_E_batch, self.field_G_batch)
         self.E_vector = E_vector
         self.G_vector = G_vector
-        self.name = "Tokamak_Field"
 
     def field_E(self, position):
         return ("field_E", self.E_vector)
@@ -104,6 +277,297 @@ class Tokamak_Field(Toroidal_B_Field):
     def field_G(self, position):
         return ("field_G", self.G_vector)
 
+    def field_E_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.E_vector
+        return out
+
+    def field_G_batch(self, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.G_vector
+        return out
+
+    def parameters(self):
+        return dict(super().parameters(), E_vector=self.E_vector, G_vector=self.G_vector)
+
+class Tokamak_Field(Uniform_EG_Fields, Toroidal_B_Field):
+    """
+    Simulates a tokamak field based on the toroidal B field above with the addition of uniform electric and gravitational field
+    """
+    def __init__(self, coil_num, current, inner_radius, outer_radius, E_vector, G_vector):
+        super().__init__(coil_num, current, inner_radius, outer_radius)
+        self.add_uniform_fields(E_vector, G_vector)
+        self.name = "Tokamak_Field"
+
+class Coil_Field(Toroidal_B_Field):
+    """
+    Simulates the magnetic field of round(coil_num) discrete rectangular coils evenly spaced in angle about the z axis, each a filament carrying the current around the square cross section of the toroidal field region
+    at a distance clearance in m outside it, so that toroidal ripple between coils is included; away from the coils the field tends to the ideal Toroidal_B_Field with the same parameters
+    The field is the Biot-Savart sum over the straight coil segments, including the fringe field outside the field region; confinement escape is still judged by leaving the field region (see contains)
+    Direct summation costs O(number of segments) per position, so for simulations the field should be precomputed with gridded (see Gridded_Field)
+    """
+    segment_chunk_size = 10**6 # maximum number of position-segment pairs evaluated at once, bounding temporary memory use
+
+    def __init__(self, coil_num, current, inner_radius, outer_radius, clearance=0.5):
+        super().__init__(coil_num, current, inner_radius, outer_radius)
+        if not 0 < clearance < inner_radius:
+            raise ValueError("Coil clearance must be positive and less than the inner radius, so that the coils lie outside the field region and the inner legs outside the z axis; got " + str(clearance))
+        self.clearance = clearance
+        self.name = "Coil_Field"
+        self.segment_starts, self.segment_ends = self.coil_segments()
+
+    def coil_segments(self):
+        """Returns tuple (starts, ends) of (4 * round(coil_num), 3) arrays of the start and end points of the coil segments in the direction of the current
+        Current flows up the inner legs, so that B points anti-clockwise when viewed downwards from the +z direction as for Toroidal_B_Field
+        """
+        angles = 2 * np.pi * np.arange(round(self.coil_num)) / round(self.coil_num)
+        # Corners of a coil in the x-z plane, in the order the current passes through them; the legs lie clearance outside the field region, away from the singular field of the filaments
+        inner, outer = self.inner_radius - self.clearance, self.outer_radius + self.clearance
+        bottom, top = self.z_bot - self.clearance, self.z_top + self.clearance
+        corners = np.array(((inner, bottom), (inner, top), (outer, top), (outer, bottom)), utility.dtype)
+        radii = np.array((corners[:, 0], corners[:, 0], corners[:, 1])).T # (radius, radius, z) of each corner, scaled below into (x, y, z)
+        rotations = np.stack((np.cos(angles), np.sin(angles), np.ones(len(angles))), axis=1)
+        coil_corners = rotations[:, None, :] * radii[None, :, :] # (coils, 4, 3)
+        starts = coil_corners.reshape(-1, 3)
+        ends = np.roll(coil_corners, -1, axis=1).reshape(-1, 3)
+        return (starts, ends)
+
+    def field_B(self, position):
+        return ("field_B", self.field_B_batch(np.array(position, utility.dtype).reshape(1, 3))[0])
+
+    def field_B_batch(self, positions, out=None):
+        """Batch version of field_B; returns (N, 3) array of B vectors at the (N, 3) positions argument, summing the exact field of every straight coil segment
+        """
+        out = _field_array(positions, out)
+        chunk = max(1, self.segment_chunk_size // len(self.segment_starts))
+        for start in range(0, len(positions), chunk):
+            out[start:start + chunk] = self.segment_field_sum(positions[start:start + chunk])
+        return out
+
+    def segment_field_sum(self, positions):
+        """Returns (N, 3) array of the B fields at the (N, 3) positions argument summed over all coil segments
+        Uses the closed form of a finite straight filament: mu0 I / (4 pi) (|r1| + |r2|) (r1 x r2) / (|r1| |r2| (|r1| |r2| + r1 . r2)), with r1, r2 the displacements from the segment's start and end
+        """
+        r1 = positions[:, None, :] - self.segment_starts[None, :, :] # (N, segments, 3)
+        r2 = positions[:, None, :] - self.segment_ends[None, :, :]
+        r1_norm = np.sqrt((r1 * r1).sum(axis=2))
+        r2_norm = np.sqrt((r2 * r2).sum(axis=2))
+        denominator = r1_norm * r2_norm * (r1_norm * r2_norm + (r1 * r2).sum(axis=2))
+        factor = np.divide(r1_norm + r2_norm, denominator, out=np.zeros(denominator.shape, utility.dtype), where=denominator > 0) # zero on the filaments themselves
+        cross = np.stack((
+            (factor * (r1[:, :, 1] * r2[:, :, 2] - r1[:, :, 2] * r2[:, :, 1])).sum(axis=1),
+            (factor * (r1[:, :, 2] * r2[:, :, 0] - r1[:, :, 0] * r2[:, :, 2])).sum(axis=1),
+            (factor * (r1[:, :, 0] * r2[:, :, 1] - r1[:, :, 1] * r2[:, :, 0])).sum(axis=1),
+        ), axis=1)
+        return utility.permeability_of_free_space * self.current / (4 * np.pi) * cross
+
+    # The closed forms of Toroidal_B_Field don't hold with ripple, so derivatives of B are taken by finite differences
+    grad_B_magnitude_batch = Field.grad_B_magnitude_batch
+    curvature_batch = Field.curvature_batch
+
+    def parameters(self):
+        return dict(super().parameters(), clearance=self.clearance)
+
+    def gridded(self, shape=(101, 33, 51), cache_folder="Field Grid Cache"):
+        """Returns Gridded_Field sampling this field on an (R, phi, z) grid of the given shape over the angle between neighbouring coils, which by symmetry gives the field everywhere;
+        to be used in simulations in place of direct summation
+        The grid spans the field region and half the clearance around it, so that the fringe field just outside the region is included while the singular field at the coils is not sampled
+        """
+        margin = self.clearance / 2
+        lower = (self.inner_radius - margin, 0, self.z_bot - margin)
+        upper = (self.outer_radius + margin, 2 * np.pi / round(self.coil_num), self.z_top + margin)
+        return Gridded_Field(self, lower, upper, shape, cache_folder=cache_folder, sector_angle=2 * np.pi / round(self.coil_num))
+
+class Coil_Tokamak_Field(Uniform_EG_Fields, Coil_Field):
+    """
+    Simulates a tokamak field based on the discrete coil B field above with the addition of uniform electric and gravitational field
+    """
+    def __init__(self, coil_num, current, inner_radius, outer_radius, E_vector, G_vector, clearance=0.5):
+        super().__init__(coil_num, current, inner_radius, outer_radius, clearance)
+        self.add_uniform_fields(E_vector, G_vector)
+        self.name = "Coil_Tokamak_Field"
+
+class Gridded_Field(Field):
+    """
+    Samples the fields of another field instance onto a regular grid once and evaluates them by vectorized linear interpolation between grid nodes,
+    for field maps without a closed form or whose closed form is slow to evaluate
+    Args:
+        source: field instance to sample
+        lower, upper: corners of the grid; (x, y, z) in m, (R, z) in m if axisymmetric, or (R, phi, z) in m, rad, m if sector_angle is given
+        shape: number of grid nodes along each axis; (nx, ny, nz), (nR, nz) if axisymmetric, or (nR, nphi, nz) if sector_angle is given
+        axisymmetric: if True the source is sampled on the R-z half plane y = 0, x = R > 0 and assumed symmetric about the z axis, storing vector fields in cylindrical (R, phi, z) components
+        cache_folder: folder in which sampled grids are saved, keyed by a hash of the source field's description and the grid, so that each grid is only sampled once; None disables the cache
+        sector_angle: if given the source is assumed symmetric under rotations about the z axis by this angle in rad (e.g. 2 pi / coil_num for discrete coils), and is sampled on a cylindrical (R, phi, z) grid
+            whose phi range should cover [0, sector_angle]; vector fields are stored in cylindrical components and positions are mapped into the sector before interpolating
+    Fields are zero outside the grid, so the grid should cover everywhere particles move; for sources whose B vanishes outside their field region (e.g. Toroidal_B_Field) B is also zero wherever the nearest grid node lies outside it,
+    while confinement escape is detected exactly with the source's contains method
+    """
+    def __init__(self, source, lower, upper, shape, axisymmetric=False, cache_folder="Field Grid Cache", sector_angle=None):
+        self.source = source
+        self.lower = np.array(lower, utility.dtype)
+        self.upper = np.array(upper, utility.dtype)
+        self.shape = tuple(int(n) for n in shape)
+        self.axisymmetric = bool(axisymmetric)
+        self.sector_angle = None if sector_angle is None else utility.dtype(sector_angle)
+        self.cylindrical = self.axisymmetric or self.sector_angle is not None # whether vector fields are stored in cylindrical components
+        self.cache_folder = cache_folder
+        self.spacing = (self.upper - self.lower) / (np.array(self.shape) - 1)
+        self.confining = source.confining
+        self.name = "Gridded_Field"
+        self.field_names, self.values, self.zero_B_nodes = self.load_grid()
+        # Field methods of the field types sampled from the source, in the same order
+        self.field_methods = tuple(getattr(self, name) for name in self.field_names)
+        self.batch_field_methods = tuple(getattr(self, name + "_batch") for name in self.field_names)
+
+    def grid_key(self):
+        """Returns hash identifying the sampled grid, from the source field's description and the grid parameters
+        """
+        description = utility.json_compatible({"source" : self.source, "lower" : self.lower, "upper" : self.upper, "shape" : self.shape, "axisymmetric" : self.axisymmetric, "sector_angle" : self.sector_angle})
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def load_grid(self):
+        """Returns tuple (field_names, values, zero_B_nodes) of the sampled grid, loaded from the cache folder if it was sampled before
+        values is a (*self.shape, 3 * len(field_names)) array of the field vectors at the grid nodes, zero_B_nodes a boolean array of shape self.shape marking nodes where B vanishes
+        """
+        path = None if self.cache_folder is None else os.path.join(self.cache_folder, "gridded_field_" + self.grid_key() + ".npz")
+        if path is not None and os.path.isfile(path):
+            with np.load(path) as grid:
+                return (tuple(str(name) for name in grid["field_names"]), grid["values"], grid["zero_B_nodes"]) # names as str rather than np.str_, as when sampled
+        field_names, values, zero_B_nodes = self.sample()
+        if path is not None:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            with utility.atomic_write(path) as f:
+                np.savez(f, field_names=np.array(field_names), values=values, zero_B_nodes=zero_B_nodes)
+        return (field_names, values, zero_B_nodes)
+
+    def sample(self):
+        """Returns tuple (field_names, values, zero_B_nodes) of the source fields sampled at the grid nodes (see load_grid)
+        """
+        axes = [np.linspace(low, high, n) for (low, high, n) in zip(self.lower, self.upper, self.shape)]
+        nodes = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(self.shape))
+        if self.axisymmetric: # nodes on the half plane y = 0, where the x, y components are the R, phi components
+            nodes = np.stack((nodes[:, 0], np.zeros(len(nodes)), nodes[:, 1]), axis=1)
+        elif self.sector_angle is not None:
+            angles = nodes[:, 1]
+            nodes = np.stack((nodes[:, 0] * np.cos(angles), nodes[:, 0] * np.sin(angles), nodes[:, 2]), axis=1)
+        fields = self.source.all_fields_batch(nodes)
+        field_names = tuple(fields)
+        if self.sector_angle is not None: # rotates (x, y, z) components to (R, phi, z) components
+            for field in fields.values():
+                radial = np.cos(angles) * field[:, 0] + np.sin(angles) * field[:, 1]
+                field[:, 1] = -np.sin(angles) * field[:, 0] + np.cos(angles) * field[:, 1]
+                field[:, 0] = radial
+        values = np.concatenate([fields[name] for name in field_names], axis=1).reshape(self.shape + (3 * len(field_names),))
+        zero_B_nodes = np.all(fields["field_B"] == 0, axis=1).reshape(self.shape) if "field_B" in fields else np.ones(self.shape, bool)
+        return (field_names, values.astype(utility.dtype), zero_B_nodes)
+
+    def interpolate(self, positions, names):
+        """Returns dictionary keyed by the given field names of (N, 3) arrays of the fields at the (N, 3) positions argument, linearly interpolated between the surrounding grid nodes
+        """
+        x = positions[:, 0]
+        y = positions[:, 1]
+        if self.cylindrical:
+            r = np.sqrt(x*x + y*y)
+        if self.axisymmetric:
+            coordinates = np.stack((r, positions[:, 2]), axis=1)
+        elif self.sector_angle is not None:
+            coordinates = np.stack((r, np.mod(np.arctan2(y, x), self.sector_angle), positions[:, 2]), axis=1)
+        else:
+            coordinates = positions
+        indices = (coordinates - self.lower) / self.spacing # fractional node indices
+        shape = np.array(self.shape)
+        within = np.all((indices >= 0) & (indices <= shape - 1), axis=1)
+        lower_nodes = np.clip(np.floor(indices).astype(np.intp), 0, shape - 2)
+        fractions = indices - lower_nodes
+
+        # Sums the values at the corners of each position's grid cell, weighted by the products of the fractional distances to the opposite corner
+        corners = np.array(list(itertools.product((0, 1), repeat=len(self.shape)))) # (2^D, D) array of corner offsets
+        strides = np.cumprod((self.shape[1:] + (1,))[::-1])[::-1] # flat index strides of the grid axes
+        flat_nodes = (lower_nodes @ strides)[:, None] + corners @ strides # (N, 2^D) flat indices of the corners
+        weights = np.ones((len(positions), 1), utility.dtype)
+        for axis in range(len(self.shape)): # outer products of the per axis weights, in the same order as corners
+            axis_weights = np.stack((1 - fractions[:, axis], fractions[:, axis]), axis=1)
+            weights = (weights[:, :, None] * axis_weights[:, None, :]).reshape(len(positions), -1)
+        flat_values = self.values.reshape(-1, self.values.shape[-1])
+        if tuple(names) != self.field_names:
+            flat_values = flat_values[:, np.concatenate([np.arange(3 * self.field_names.index(name), 3 * self.field_names.index(name) + 3) for name in names])]
+        interpolated = np.einsum("nk,nkc->nc", weights, np.take(flat_values, flat_nodes, axis=0))
+        if self.cylindrical: # rotates (R, phi, z) components about the z axis to (x, y, z)
+            cos = np.divide(x, r, out=np.ones(len(positions), utility.dtype), where=r > 0)[:, None]
+            sin = np.divide(y, r, out=np.zeros(len(positions), utility.dtype), where=r > 0)[:, None]
+            radial = interpolated[:, 0::3].copy()
+            interpolated[:, 0::3] = cos*radial - sin*interpolated[:, 1::3]
+            interpolated[:, 1::3] = sin*radial + cos*interpolated[:, 1::3]
+        interpolated[~within] = 0
+
+        fields = {name : interpolated[:, 3*i:3*i + 3] for (i, name) in enumerate(names)}
+        if "field_B" in fields:
+            nearest_nodes = tuple(np.clip(np.rint(indices).astype(np.intp), 0, shape - 1).T)
+            fields["field_B"][self.zero_B_nodes[nearest_nodes]] = 0
+        return fields
+
+    def contains(self, positions):
+        return self.source.contains(positions)
+
+    def boundary_crossings(self, starts, ends):
+        return self.source.boundary_crossings(starts, ends)
+
+    def all_fields_batch(self, positions, out=None):
+        """Returns a dictionary with entries having keys denoting field type and value denoting (N, 3) array of field strengths at the (N, 3) positions argument, interpolating all field types together
+        """
+        if out is None:
+            out = {}
+        for (name, field) in self.interpolate(positions, self.field_names).items():
+            out[name] = _field_array(positions, out.get(name))
+            out[name][:] = field
+        return out
+
+    def interpolated_field_batch(self, name, positions, out=None):
+        out = _field_array(positions, out)
+        out[:] = self.interpolate(positions, (name,))[name]
+        return out
+
+    def field_B(self, position):
+        return ("field_B", self.field_B_batch(np.array(position, utility.dtype).reshape(1, 3))[0])
+
+    def field_E(self, position):
+        return ("field_E", self.field_E_batch(np.array(position, utility.dtype).reshape(1, 3))[0])
+
+    def field_G(self, position):
+        return ("field_G", self.field_G_batch(np.array(position, utility.dtype).reshape(1, 3))[0])
+
+    def field_B_batch(self, positions, out=None):
+        if "field_B" not in self.field_names:
+            return super().field_B_batch(positions, out)
+        return self.interpolated_field_batch("field_B", positions, out)
+
+    def field_E_batch(self, positions, out=None):
+        return self.interpolated_field_batch("field_E", positions, out)
+
+    def field_G_batch(self, positions, out=None):
+        return self.interpolated_field_batch("field_G", positions, out)
+
+    def parameters(self):
+        return {"source" : self.source, "lower" : self.lower, "upper" : self.upper, "shape" : self.shape, "axisymmetric" : self.axisymmetric, "cache_folder" : self.cache_folder, "sector_angle" : self.sector_angle}
+
+def _parameter_from_dict(value):
+    """Returns field constructor argument rebuilt from its JSON compatible form in a field description
+    """
+    if isinstance(value, dict): # description of a field, e.g. the source of a Gridded_Field
+        return field_from_dict(value)
+    if isinstance(value, list):
+        return np.array(value, utility.dtype)
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    return utility.dtype(value)
+
+def field_from_dict(description):
+    """Returns field instance rebuilt from a dictionary produced by the field's to_dict method
+    """
+    field_class = field_types[description["name"]]
+    parameters = {name : _parameter_from_dict(value) for (name, value) in description["parameters"].items()}
+    return field_class(**parameters)
+
 class Particle:
     """
     Represents a general charged particle
@@ -116,7 +580,7 @@ class Particle:
         self.field = field # the class instance representing the field as to which the particle lies in
 
         # Initialses confinement escape status variable; assumes input particle parameters leave particle inside confinement magnetic field to start with
-        if self.field.name in ("Tokamak_Field", "Toroidal_B_Field"):
+        if self.field.confining:
             self.escaped = False
     
     def update(self, dt):
@@ -128,8 +592,8 @@ class Particle:
         self.position, self.velocity = utility.two_eq_rk4(self.position, self.get_v, self.velocity, self.get_a, dt)
 
         # Returns signal at the first time when particle escapes magnetic confinement
-        if self.field.name in ("Tokamak_Field", "Toroidal_B_Field"):
-            if self.escaped == False and np.all(self.field.field_B(self.position)[1] == utility.dtype(0)):
+        if self.field.confining:
+            if self.escaped == False and not self.field.contains(np.reshape(self.position, (1, 3)))[0]:
                 self.escaped = True # set escape status as True such that the method won't return True again after the first time particle escapes confinement
                 return True
 
@@ -168,4 +632,298 @@ class Deuterium_Ion(Particle):
     Subclass of Particle representing deuterium ions
     """
     def __init__(self, position=utility.zero_vec.copy(), velocity=utility.zero_vec.copy(), field=Field()):
-        super().__init__(utility.deuterium_mass, utility.elementary_charge, position, velocity, field)
\ No newline at end of file
+        super().__init__(utility.deuterium_mass, utility.elementary_charge, position, velocity, field)
+
+class Particle_Batch:
+    """
+    Represents a batch of charged particles stored as arrays (structure of arrays) so that all particles are advanced together with a single vectorized RK4 step
+    The integrator argument selects how particles are advanced:
+        "rk4": classic RK4 with the given timestep (default)
+        "rk45": adaptive Dormand-Prince 5(4) with each particle taking its own internal step sizes to meet the tolerances in integrator_options ("rtol", relative, default 1e-6; "atol", absolute, default 0);
+            every round of substeps is a Python loop iteration here, so compiled.rk45_kernel is far faster when particles need many substeps per timestep
+        "boris": Boris pusher, which is volume preserving so energy doesn't drift over many gyro-orbits, and needs one field evaluation per step instead of RK4's four
+        "guiding_centre": guiding centre (drift kinetic) pusher; gyromotion is averaged out and the guiding centres are advanced with RK4 along B and by the E x B, gravitational, grad-B and curvature drifts,
+            allowing timesteps far longer than a gyro-period; positions then hold guiding centres, velocities the guiding centre velocities, and confinement escape is judged by the guiding centre leaving the field region
+    Particles can be removed from the batch with retire, after which the per particle arrays hold only the active particles; self.indices maps them to their original indices
+    If self.space_charge is set to a pic.Space_Charge_Mesh, the particles' own electric field is solved for at the start of every step and added to the field's electric field;
+    likewise if self.coulomb is set to a coulomb.Coulomb_Interaction, the pairwise Coulomb field of the particles is added
+    If self.timer is set to an instrumentation.Phase_Timer, the time spent evaluating fields, assembling forces, integrating and checking for escapes is measured
+    """
+    def __init__(self, masses, charges, positions, velocities, field=Field(), integrator="rk4", integrator_options=None):
+        self.masses = np.array(masses, utility.dtype) # shape (N,)
+        self.charges = np.array(charges, utility.dtype) # shape (N,)
+        self.positions = np.array(positions, utility.dtype).reshape(-1, 3) # shape (N, 3)
+        self.velocities = np.array(velocities, utility.dtype).reshape(-1, 3) # shape (N, 3)
+        self.field = field # the class instance representing the field as to which the particles lie in
+        self.indices = np.arange(len(self.masses)) # original indices of the active particles
+        self.retired_positions = np.full(self.positions.shape, np.nan, utility.dtype) # final positions of retired particles by original index, NaN for active particles
+        self.retired_velocities = np.full(self.velocities.shape, np.nan, utility.dtype) # final velocities of retired particles by original index, NaN for active particles
+
+        # Initialises confinement escape status array; assumes input particle parameters leave particles inside confinement magnetic field to start with
+        self.confining = self.field.confining
+        self.escaped = np.zeros(len(self.masses), bool)
+        self.crossings = None # where and how the particles escaping in the last step crossed the field region boundary (see update)
+        self.field_buffers = {} # preallocated field arrays filled by the field's all_fields_batch method
+        self.space_charge = None # optional pic.Space_Charge_Mesh giving the particles' self-consistent electric field
+        self.coulomb = None # optional coulomb.Coulomb_Interaction giving the particles' pairwise Coulomb field
+        self.timer = instrumentation.null_timer # times the phases of each step when profiling (see instrumentation.py)
+
+        # Sets up the integrator
+        self.step_methods = {"rk4" : self.step_rk4, "rk45" : self.step_rk45, "boris" : self.step_boris, "guiding_centre" : self.step_guiding_centre} # methods advancing all particles by a timestep, by integrator name
+        if integrator not in self.step_methods:
+            raise ValueError("Unknown integrator: " + str(integrator) + "; expected one of " + str(tuple(self.step_methods)))
+        self.integrator = integrator
+        self.integrator_options = integrator_options or {}
+        self.step_sizes = None # per particle internal step sizes of the adaptive integrator, set on its first step
+        self.parallel_speeds = None # per particle speeds along B of the guiding centre integrator, set on its first step
+        self.magnetic_moments = None # per particle magnetic moments m v_perp^2 / (2 |B|) of the guiding centre integrator, set on its first step
+
+    @classmethod
+    def from_particles(cls, particles, field, integrator="rk4", integrator_options=None):
+        """Returns a Particle_Batch holding the masses, charges, positions and velocities of a sequence of Particle instances
+        """
+        return cls(
+            [particle.mass for particle in particles],
+            [particle.charge for particle in particles],
+            [particle.position for particle in particles],
+            [particle.velocity for particle in particles],
+            field,
+            integrator,
+            integrator_options,
+        )
+
+    def __len__(self):
+        return len(self.masses)
+
+    def retire(self, mask):
+        """Removes the particles marked by the (N,) boolean mask argument from the batch, compacting the per particle arrays so that only active particles are advanced
+        The final positions and velocities of the removed particles are kept in self.retired_positions and self.retired_velocities
+        """
+        retiring = self.indices[mask]
+        self.retired_positions[retiring] = self.positions[mask]
+        self.retired_velocities[retiring] = self.velocities[mask]
+        keep = ~mask
+        for name in ("masses", "charges", "positions", "velocities", "indices", "escaped", "step_sizes", "parallel_speeds", "magnetic_moments"):
+            values = getattr(self, name)
+            if values is not None:
+                setattr(self, name, values[keep])
+        self.field_buffers = {} # buffers are reallocated for the new number of particles
+
+    def all_velocities(self):
+        """Returns (n_particles, 3) array of the velocities of all particles by original index, final velocities for retired particles
+        """
+        velocities = self.retired_velocities.copy()
+        velocities[self.indices] = self.velocities
+        return velocities
+
+    def update(self, dt):
+        """Updates the kinematics of all particles according to some input timestep dt using the batch's integrator
+        Args:
+            dt: float value representing timestep in units s
+        For toroidal field and tokamak field; this method also returns a boolean array marking the particles which escaped magnetic confinement during this step, else by default returns None;
+        how they crossed the field region boundary, interpolating their kinematics linearly over the step, is then held in the dictionary self.crossings of arrays with a row per escaping particle (in batch order):
+            "fractions": (M,) fractions of the step at which they crossed, "faces": (M,) codes of the faces crossed (indices into region_faces, -1 where unknown),
+            "positions", "velocities": (M, 3) positions and velocities at the crossing
+        """
+        if self.confining:
+            starts = (self.positions.copy(), self.velocities.copy()) # some integrators update kinematics in place
+        with self.timer.phase("field"):
+            if self.space_charge is not None:
+                self.space_charge.solve(self.positions, self.charges)
+            if self.coulomb is not None:
+                self.coulomb.update(self.positions, self.charges)
+        with self.timer.phase("integrator"):
+            self.step_methods[self.integrator](dt)
+
+        # Returns mask of particles escaping magnetic confinement for the first time
+        if self.confining:
+            with self.timer.phase("escape"):
+                newly_escaped = ~self.field.contains(self.positions) & ~self.escaped
+                self.escaped |= newly_escaped
+                start_positions, start_velocities = starts[0][newly_escaped], starts[1][newly_escaped]
+                fractions, faces = self.field.boundary_crossings(start_positions, self.positions[newly_escaped])
+                self.crossings = {
+                    "fractions" : fractions,
+                    "faces" : faces,
+                    "positions" : start_positions + fractions[:, None] * (self.positions[newly_escaped] - start_positions),
+                    "velocities" : start_velocities + fractions[:, None] * (self.velocities[newly_escaped] - start_velocities),
+                }
+            return newly_escaped
+
+    def step_rk4(self, dt):
+        """Advances all particles by timestep dt using RK4
+        """
+        self.positions, self.velocities = utility.two_eq_rk4(self.positions, self.get_v, self.velocities, self.get_a, dt)
+
+    def step_rk45(self, dt):
+        """Advances all particles by timestep dt using adaptive Dormand-Prince 5(4) steps
+        Each particle takes as many internal steps as its error tolerance requires, with its own step size carried over between calls,
+        and its last internal step is shortened to end exactly at dt; so particles in fast gyromotion (e.g. electrons) are substepped while the rest take a single step of dt
+        """
+        rtol = self.integrator_options.get("rtol", 1e-6)
+        atol = self.integrator_options.get("atol", 0)
+        if self.step_sizes is None:
+            self.step_sizes = np.full(len(self), dt, utility.dtype)
+        remaining = np.full(len(self), dt, utility.dtype) # time left for each particle to reach the end of the timestep
+        while True:
+            active = np.flatnonzero(remaining > 0)
+            if len(active) == 0:
+                break
+            h = np.minimum(self.step_sizes[active], remaining[active])
+            get_a = lambda positions, velocities: self.total_force(positions, velocities, active) / self.masses[active, None]
+            positions, velocities, position_error, velocity_error = utility.two_eq_dormand_prince(self.positions[active], self.get_v, self.velocities[active], get_a, h[:, None])
+            # Error relative to tolerance of each particle, taking the worse of the position and velocity errors
+            position_scale = atol + rtol * np.maximum(np.linalg.norm(self.positions[active], axis=1), np.linalg.norm(positions, axis=1))
+            velocity_scale = atol + rtol * np.maximum(np.linalg.norm(self.velocities[active], axis=1), np.linalg.norm(velocities, axis=1))
+            error = np.maximum(np.linalg.norm(position_error, axis=1) / np.maximum(position_scale, np.finfo(utility.dtype).tiny), np.linalg.norm(velocity_error, axis=1) / np.maximum(velocity_scale, np.finfo(utility.dtype).tiny))
+            error = np.where(np.isnan(error), np.inf, error)
+            accepted = (error <= 1) | (h <= dt * 1e-12) # steps far smaller than dt are accepted regardless to guarantee progress
+            accepted_ind = active[accepted]
+            self.positions[accepted_ind] = positions[accepted]
+            self.velocities[accepted_ind] = velocities[accepted]
+            remaining[accepted_ind] = np.where(h[accepted] == remaining[accepted_ind], 0, remaining[accepted_ind] - h[accepted])
+            # Standard step size controller, growing by at most 5 times and shrinking by at most 5 times per step
+            self.step_sizes[active] = h * np.clip(0.9 * np.maximum(error, 1e-10) ** -0.2, 0.2, 5)
+
+    def step_boris(self, dt):
+        """Advances all particles by timestep dt using the Boris pusher in its synchronised drift-kick-drift form
+        Positions are drifted half a step, fields are evaluated once there, the velocity is kicked by half the electric and gravitational acceleration, rotated about B, and kicked again, then positions are drifted the remaining half step
+        """
+        half_positions = self.positions + self.velocities * (dt / 2)
+        fields = self.field_values(half_positions)
+        charge_to_mass = (self.charges / self.masses)[:, None]
+        half_kick = np.zeros(self.positions.shape, utility.dtype) # velocity change over half a step due to electric and gravitational fields
+        if "field_E" in fields:
+            half_kick += charge_to_mass * fields["field_E"] * (dt / 2)
+        if "field_G" in fields:
+            half_kick += fields["field_G"] * (dt / 2)
+        velocities = self.velocities + half_kick
+        if "field_B" in fields:
+            t = charge_to_mass * fields["field_B"] * (dt / 2) # rotation vector
+            s = 2 * t / (1 + (t * t).sum(axis=1))[:, None]
+            velocities_prime = velocities + utility.cross_batch(velocities, t)
+            velocities = velocities + utility.cross_batch(velocities_prime, s)
+        self.velocities = velocities + half_kick
+        self.positions = half_positions + self.velocities * (dt / 2)
+
+    def guiding_centres(self):
+        """Returns (N, 3) array of the guiding centres of the particles' gyromotion, x + m (v x B) / (q |B|^2); particles where B vanishes are their own guiding centres
+        """
+        B = self.field.field_B_batch(self.positions)
+        B_squared = (B * B).sum(axis=1)[:, None]
+        shift = (self.masses / self.charges)[:, None] * utility.cross_batch(self.velocities, B)
+        return self.positions + np.divide(shift, B_squared, out=np.zeros(shift.shape, utility.dtype), where=B_squared > 0)
+
+    def to_guiding_centre(self):
+        """Replaces particle positions by their guiding centres and sets the parallel speeds and magnetic moments used by the guiding centre integrator
+        """
+        B = self.field.field_B_batch(self.positions)
+        B_magnitude = np.sqrt((B * B).sum(axis=1))
+        self.parallel_speeds = (self.velocities * _unit_vectors(B)).sum(axis=1)
+        perpendicular_speeds_squared = np.maximum((self.velocities * self.velocities).sum(axis=1) - self.parallel_speeds**2, 0)
+        self.magnetic_moments = np.divide(self.masses * perpendicular_speeds_squared, 2 * B_magnitude, out=np.zeros(len(self), utility.dtype), where=B_magnitude > 0)
+        self.positions = self.guiding_centres()
+
+    def guiding_centre_derivatives(self, state):
+        """Returns (N, 4) array of the time derivatives of the guiding centre state, an (N, 4) array of guiding centre positions and parallel speeds
+        Guiding centres move along B at the parallel speed and drift with the E x B, gravitational, grad-B and curvature drift velocities; the parallel speed changes due to E and gravity along B and the mirror force
+        Where B vanishes (outside the field region) the state is left unchanged
+        """
+        positions = state[:, :3]
+        parallel_speeds = state[:, 3]
+        fields = self.field_values(positions)
+        B = fields["field_B"]
+        B_squared = (B * B).sum(axis=1)
+        inside = B_squared > 0
+        B_squared = np.where(inside, B_squared, 1)
+        B_magnitude = np.sqrt(B_squared)
+        b = _unit_vectors(B)
+        charge_to_mass = self.charges / self.masses
+
+        # Effective electric field (E + (m / q) g) giving the E x B and gravitational drifts and acceleration along B
+        effective_E = np.zeros(positions.shape, utility.dtype)
+        if "field_E" in fields:
+            effective_E += fields["field_E"]
+        if "field_G" in fields:
+            effective_E += fields["field_G"] / charge_to_mass[:, None]
+        with self.timer.phase("field"):
+            grad_B = self.field.grad_B_magnitude_batch(positions)
+            curvature = self.field.curvature_batch(positions)
+
+        derivatives = np.zeros(state.shape, utility.dtype)
+        derivatives[:, :3] = (
+            parallel_speeds[:, None] * b
+            + utility.cross_batch(effective_E, B) / B_squared[:, None] # E x B and gravitational drifts
+            + (self.magnetic_moments / (self.charges * B_magnitude))[:, None] * utility.cross_batch(b, grad_B) # grad-B drift
+            + (self.masses * parallel_speeds**2 / (self.charges * B_magnitude))[:, None] * utility.cross_batch(b, curvature) # curvature drift
+        )
+        derivatives[:, 3] = charge_to_mass * (effective_E * b).sum(axis=1) - (self.magnetic_moments / self.masses) * (b * grad_B).sum(axis=1)
+        derivatives[~inside] = 0
+        return derivatives
+
+    def step_guiding_centre(self, dt):
+        """Advances the guiding centres of all particles by timestep dt using RK4 on the guiding centre equations of motion (see guiding_centre_derivatives)
+        On the first step particle positions are converted into guiding centres
+        """
+        if self.parallel_speeds is None:
+            self.to_guiding_centre()
+        state = np.concatenate((self.positions, self.parallel_speeds[:, None]), axis=1)
+        k1 = self.guiding_centre_derivatives(state)
+        k2 = self.guiding_centre_derivatives(state + dt*k1/2)
+        k3 = self.guiding_centre_derivatives(state + dt*k2/2)
+        k4 = self.guiding_centre_derivatives(state + dt*k3)
+        mean_derivatives = (k1 + 2*k2 + 2*k3 + k4) / 6
+        state = state + dt * mean_derivatives
+        self.positions = state[:, :3]
+        self.parallel_speeds = state[:, 3]
+        self.velocities = mean_derivatives[:, :3] # guiding centre velocities averaged over the step
+
+    def get_a(self, positions, velocities):
+        """Returns (N, 3) array of particle accelerations given (N, 3) position and velocity arrays
+        """
+        return self.total_force(positions, velocities) / self.masses[:, None]
+
+    def get_v(self, positions, velocities):
+        """Returns particle velocities given position and velocity arrays (trivial but included for sake of consistency with get_a when calling RK4)
+        """
+        return velocities
+
+    def field_values(self, positions, indices=slice(None)):
+        """Returns a dictionary with entries having keys denoting field type and value denoting (N, 3) array of field strengths at the (N, 3) positions argument
+        The returned arrays are buffers reused between calls, so they are only valid until the next call
+        Includes the space charge and Coulomb electric fields if self.space_charge or self.coulomb are set
+        Args:
+            indices: optional index array selecting the particles the positions belong to (all particles by default), so that the Coulomb field leaves out each particle's own charge
+        """
+        with self.timer.phase("field"):
+            fields = self.field.all_fields_batch(positions, self.field_buffers)
+            self_fields_E = []
+            if self.space_charge is not None:
+                self_fields_E.append(self.space_charge.field_E_batch(positions))
+            if self.coulomb is not None:
+                self_fields_E.append(self.coulomb.field_E_batch(positions, np.arange(len(self))[indices]))
+            if self_fields_E:
+                fields = dict(fields) # leaves the buffers dictionary holding only the field's own arrays
+                self_field_E = sum(self_fields_E)
+                fields["field_E"] = fields["field_E"] + self_field_E if "field_E" in fields else self_field_E
+            return fields
+
+    def total_force(self, positions, velocities, indices=slice(None)):
+        """Returns (N, 3) array of total force vectors on the particles given (N, 3) position and velocity arrays
+        Args:
+            indices: optional index array selecting the particles the positions and velocities belong to (all particles by default)
+        """
+        with self.timer.phase("force"):
+            total_force = np.zeros(positions.shape, utility.dtype)
+            fields = self.field_values(positions, indices)
+            charges = self.charges[indices, None]
+            if "field_B" in fields:
+                total_force += charges * utility.cross_batch(velocities, fields["field_B"])
+            if "field_E" in fields:
+                total_force += charges * fields["field_E"]
+            if "field_G" in fields:
+                total_force += self.masses[indices, None] * fields["field_G"]
+            return total_force
+
+# Field classes by name, used for rebuilding fields from their descriptions (see field_from_dict)
+field_types = {field_class.__name__ : field_class for field_class in (Field, Uniform_B_Field, EB_Field, GB_Field, Toroidal_B_Field, Tokamak_Field, Coil_Field, Coil_Tokamak_Field, Gridded_Field)}
@@ -0,0 +1,160 @@
+import numpy as np
+from simulation import Simulation
+from statistics import NormalDist
+import utility
+import json
+
+# Monte Carlo ensemble runs: particles are drawn in batches from proper distributions (e.g. Maxwellian velocities, see sampler.py) and simulated batch after batch,
+# keeping only streaming (online) statistics of their confinement times, until the confidence intervals are as narrow as requested
+# Confinement times are censored at the simulation time (particles still confined then only tell us their confinement time is longer), so the statistics kept per particle type are:
+#   the restricted mean confinement time, the mean of min(confinement time, simulation time), which is unbiased under censoring and is the area under the survival curve
+#   the escaped fraction, and the mean confinement time of escaped particles
+#   the survival curve, the fraction of particles still confined against time, on a fixed grid of times
+
+class Running_Moments:
+    """
+    Streaming mean and variance of a sequence of values, updated a batch at a time (Welford's algorithm, with Chan et al.'s formula for merging batches)
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_squares = 0.0 # sum of squared deviations from the mean
+
+    def add(self, values):
+        """Adds the values of the 1D array argument
+        """
+        values = np.asarray(values, np.float64)
+        if len(values) == 0:
+            return
+        batch_mean = values.mean()
+        batch_sum_squares = ((values - batch_mean)**2).sum()
+        count = self.count + len(values)
+        delta = batch_mean - self.mean
+        self.mean += delta * len(values) / count
+        self.sum_squares += batch_sum_squares + delta**2 * self.count * len(values) / count
+        self.count = count
+
+    def variance(self):
+        """Returns the sample variance, NaN with fewer than 2 values
+        """
+        return self.sum_squares / (self.count - 1) if self.count > 1 else np.nan
+
+    def interval(self, confidence=0.95):
+        """Returns tuple (low, high) of the normal approximation confidence interval of the mean
+        """
+        half_width = NormalDist().inv_cdf((1 + confidence) / 2) * np.sqrt(self.variance() / self.count) if self.count > 1 else np.nan
+        return (self.mean - half_width, self.mean + half_width)
+
+class Confinement_Statistics:
+    """
+    Streaming statistics of the confinement times of one type of particle, over particles simulated for simulation_time seconds
+    """
+    def __init__(self, simulation_time, survival_bins=100):
+        self.simulation_time = simulation_time
+        self.restricted_times = Running_Moments() # moments of min(confinement time, simulation time)
+        self.escape_times = Running_Moments() # moments of the confinement times of escaped particles
+        self.escaped_num = 0
+        self.bin_edges = np.linspace(0, simulation_time, survival_bins + 1)
+        self.escape_counts = np.zeros(survival_bins, np.int64) # number of escapes in each interval between bin edges
+
+    @property
+    def particle_num(self):
+        return self.restricted_times.count
+
+    def add(self, confinement_times):
+        """Adds a batch of confinement times (False where the particle did not escape)
+        """
+        escape_times = np.array([time for time in confinement_times if time is not False], np.float64)
+        self.restricted_times.add(np.concatenate((escape_times, np.full(len(confinement_times) - len(escape_times), self.simulation_time))))
+        self.escape_times.add(escape_times)
+        self.escaped_num += len(escape_times)
+        self.escape_counts += np.histogram(np.minimum(escape_times, self.simulation_time), self.bin_edges)[0]
+
+    def survival_curve(self, confidence=0.95):
+        """Returns tuple (times, survival, low, high) of arrays of the fraction of particles still confined at each bin edge time, with its pointwise normal approximation confidence interval
+        """
+        survival = 1 - np.concatenate(((0,), np.cumsum(self.escape_counts))) / max(self.particle_num, 1)
+        half_width = NormalDist().inv_cdf((1 + confidence) / 2) * np.sqrt(survival * (1 - survival) / max(self.particle_num, 1))
+        return (self.bin_edges, survival, np.clip(survival - half_width, 0, 1), np.clip(survival + half_width, 0, 1))
+
+    def escaped_fraction_interval(self, confidence=0.95):
+        """Returns tuple (low, high) of the normal approximation confidence interval of the escaped fraction
+        """
+        fraction = self.escaped_num / max(self.particle_num, 1)
+        half_width = NormalDist().inv_cdf((1 + confidence) / 2) * np.sqrt(fraction * (1 - fraction) / max(self.particle_num, 1))
+        return (max(fraction - half_width, 0), min(fraction + half_width, 1))
+
+    def precision(self, confidence=0.95):
+        """Returns the half width of the confidence interval of the restricted mean confinement time relative to the restricted mean (inf until it can be estimated)
+        """
+        low, high = self.restricted_times.interval(confidence)
+        if np.isnan(low) or self.restricted_times.mean == 0:
+            return np.inf
+        return (high - low) / 2 / self.restricted_times.mean
+
+    def summary(self, confidence=0.95):
+        """Returns JSON compatible dictionary of the statistics
+        """
+        times, survival, low, high = self.survival_curve(confidence)
+        return {
+            "particle_num" : self.particle_num,
+            "escaped_num" : self.escaped_num,
+            "escaped_fraction" : self.escaped_num / max(self.particle_num, 1),
+            "escaped_fraction_interval" : self.escaped_fraction_interval(confidence),
+            "restricted_mean_confinement_time" : self.restricted_times.mean,
+            "restricted_mean_confinement_time_interval" : self.restricted_times.interval(confidence),
+            "restricted_confinement_time_variance" : self.restricted_times.variance(),
+            "escaped_mean_confinement_time" : self.escape_times.mean if self.escape_times.count else None,
+            "escaped_confinement_time_variance" : self.escape_times.variance() if self.escape_times.count else None,
+            "relative_precision" : self.precision(confidence),
+            "confidence" : confidence,
+            "survival_curve" : {"times" : times, "survival" : survival, "low" : low, "high" : high},
+        }
+
+def run_ensemble(settings_function, settings_arguments, batch_size=1000, max_particles=10**6, target_precision=0.01, confidence=0.95, min_batches=2, seed=None, backend="python", survival_bins=100, output_path=None):
+    """Simulates batches of particles until the restricted mean confinement time of every type of particle is known to the target precision, or max_particles particles were simulated
+    Args:
+        settings_function: function returning simulation settings dictionary given a numpy Generator, the number of particles of each type to draw and the keyword arguments in settings_arguments
+            (e.g. iter_tokamak_data_generator.generate_tokamak_ensemble_settings)
+        batch_size: number of particles of each type simulated per batch
+        max_particles: maximum number of particles of each type to simulate
+        target_precision: half width of the confidence interval of the restricted mean confinement time relative to its value at which the run stops
+        confidence: confidence level of the intervals
+        min_batches: minimum number of batches before the run may stop, guarding against stopping on a lucky first estimate
+        seed: seed of the numpy Generator drawing the particles; if None a random one is drawn
+        backend: simulation backend passed to Simulation.load_settings
+        survival_bins: number of time bins of the survival curves
+        output_path: optional path of a JSON file the statistics are written to after every batch
+    Returns dictionary of Confinement_Statistics by particle type label (e.g. "Deuterium", "Electron")
+    Trajectories are not recorded and escaped particles are retired from each batch, so memory use is bounded by the batch size
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    rng = np.random.default_rng(seed)
+    statistics = {}
+    batch = 0
+    while True:
+        simulation_settings = settings_function(rng, batch_size, **settings_arguments)
+        simulation_settings.update({"recording" : {"mode" : "none"}, "retire_escaped" : True})
+        sim = Simulation()
+        sim.load_settings(simulation_settings, backend)
+        sim.generate_data()
+
+        # Splits confinement times by particle type
+        labels = sim.data["visualisation_settings"]["path_labels"]
+        label_indices = np.array(sim.data["visualisation_settings"]["sets_color_ind"])
+        confinement_times = sim.data["confinement_times"]
+        for (ind, label) in enumerate(labels):
+            if label not in statistics:
+                statistics[label] = Confinement_Statistics(simulation_settings["simulation_time"], survival_bins)
+            statistics[label].add([confinement_times[i] for i in np.flatnonzero(label_indices == ind)])
+        batch += 1
+
+        if output_path is not None:
+            summaries = {label : stats.summary(confidence) for (label, stats) in statistics.items()}
+            with utility.atomic_write(output_path, "w") as f:
+                json.dump(utility.json_compatible({"seed" : seed, "batches" : batch, "statistics" : summaries}), f)
+
+        precise = all(stats.precision(confidence) <= target_precision for stats in statistics.values())
+        if (batch >= min_batches and precise) or min(stats.particle_num for stats in statistics.values()) >= max_particles:
+            return statistics
@@ -0,0 +1,68 @@
+import numpy as np
+import em
+import utility
+import case_data_generator
+
+# Validates the guiding centre integrator against full orbit RK4 on the drift test cases of case_data_generator
+# For each case both integrators advance the same particles over the case's simulation time; the full orbit run uses the case's timestep and the guiding centre run a timestep timestep_factor times longer
+# Reported per case: for particles confined throughout both runs, the distance between the final full orbit guiding centre and the final guiding centre of the drift run, compared with the total drift of the guiding centre and the Larmor radius;
+# for escaping particles, the confinement escape times of both runs (the full orbit particle escapes once its gyro-orbit reaches the field region boundary, so up to the time to drift a Larmor radius before its guiding centre)
+
+drift_cases = {
+    "uniform_EB" : case_data_generator.uniform_EB,
+    "uniform_GB" : case_data_generator.uniform_GB,
+    "toroidal_B" : case_data_generator.toroidal_B,
+    "tokamak" : case_data_generator.tokamak,
+}
+
+def case_particles(settings):
+    """Returns list of em.Particle instances of the simulation settings dictionary
+    """
+    particles = []
+    if settings["deuterium_positions"] is not None:
+        particles += [em.Deuterium_Ion(position=position, velocity=velocity, field=settings["field"]) for (position, velocity) in zip(settings["deuterium_positions"], settings["deuterium_velocities"])]
+    if settings["electron_positions"] is not None:
+        particles += [em.Electron(position=position, velocity=velocity, field=settings["field"]) for (position, velocity) in zip(settings["electron_positions"], settings["electron_velocities"])]
+    return particles
+
+def run(settings, integrator, timestep):
+    """Advances the particles of the simulation settings dictionary with the given integrator and timestep over the simulation time
+    Returns tuple (particle_batch, escape_times) of the final em.Particle_Batch and (N,) array of confinement escape times, NaN where the particle did not escape
+    """
+    particle_batch = em.Particle_Batch.from_particles(case_particles(settings), settings["field"], integrator)
+    escape_times = np.full(len(particle_batch), np.nan)
+    steps = round(settings["simulation_time"] / timestep)
+    for step in range(steps):
+        escaped = particle_batch.update(timestep)
+        if escaped is not None:
+            escape_times[escaped] = (step + particle_batch.crossings["fractions"]) * timestep
+    return (particle_batch, escape_times)
+
+def larmor_radii(settings):
+    """Returns (N,) array of the initial Larmor radii of the particles of the simulation settings dictionary
+    """
+    particle_batch = em.Particle_Batch.from_particles(case_particles(settings), settings["field"])
+    B = settings["field"].field_B_batch(particle_batch.positions)
+    perpendicular_velocities = utility.cross_batch(particle_batch.velocities, B)
+    return np.sqrt((perpendicular_velocities**2).sum(axis=1)) * particle_batch.masses / (np.abs(particle_batch.charges) * (B**2).sum(axis=1))
+
+def validate(name, settings, timestep_factor=20):
+    """Runs the full orbit and guiding centre integrators on a test case and prints their comparison
+    Returns tuple (relative_distances, escape_time_differences) of (N,) arrays of final guiding centre distances relative to the total drift (NaN for escaping particles)
+    and of differences between the escape times of the two runs (NaN for confined particles)
+    """
+    full_orbit, full_orbit_escapes = run(settings, "rk4", settings["timestep"])
+    guiding_centre, guiding_centre_escapes = run(settings, "guiding_centre", settings["timestep"] * timestep_factor)
+    initial = em.Particle_Batch.from_particles(case_particles(settings), settings["field"]).guiding_centres()
+    final = full_orbit.guiding_centres()
+    confined = np.isnan(full_orbit_escapes) & np.isnan(guiding_centre_escapes)
+    distances = np.where(confined, np.sqrt(((final - guiding_centre.positions)**2).sum(axis=1)), np.nan)
+    drifts = np.sqrt(((final - initial)**2).sum(axis=1))
+    print(name)
+    print("    final guiding centre distance:", distances, "m; total drift:", drifts, "m; Larmor radius:", larmor_radii(settings), "m")
+    print("    escape times (full orbit, guiding centre):", full_orbit_escapes, guiding_centre_escapes, "s")
+    return (distances / drifts, guiding_centre_escapes - full_orbit_escapes)
+
+if __name__ == "__main__":
+    for (name, settings) in drift_cases.items():
+        validate(name, settings)
@@ -0,0 +1,167 @@
+import contextlib
+import utility
+import time
+import json
+import sys
+
+# Instrumentation of data generation: progress reports with throughput, ETA and memory use, and an optional timing breakdown of the phases of each step
+# Reports are dictionaries passed to a report callback, given to Simulation.load_settings (print_progress by default, printing percentages of completion as data generation always has)
+# Configured by the optional "instrumentation" entry of the simulation settings dictionary: {"profile" : bool, "every_seconds" : t, "log_path" : path}
+#   profile: if True the wall clock time spent in each phase of a step (see phases) is measured and included in the reports (False by default, as timing adds a little overhead per step)
+#   every_seconds: wall clock interval between "progress" reports besides the reports at every 5% of completion; also bounds the chunks the compiled kernel runs in
+#   log_path: path of a JSON lines file every report is appended to, for following runs in batch schedulers
+# The final report of a run is stored in the data dictionary as data["instrumentation"]
+# Each report holds:
+#   "event": "milestone" (every 5% of completion), "progress" (every every_seconds), "done" or "cached" (in place of "done" when the results were loaded from the result cache, see cache.py, without running)
+#   "step", "steps": steps completed and total steps of the run; "percent": percentage of completion
+#   "elapsed_seconds", "eta_seconds": wall clock time since the run (or its resumption) started and estimated time left
+#   "particle_steps", "particle_steps_per_second": particle steps advanced since the run started and their rate (particles retired from the batch no longer count)
+#   "peak_rss_bytes": peak resident set size of the process (None where it can't be measured)
+#   "phases": with profiling, dictionary by phase of dictionaries {"calls" : n, "seconds" : t}
+# With the compiled backend the field evaluation, force assembly, integration and escape check are fused in the kernel, so their time is all counted towards "integrator"
+
+phases = ("field", "force", "integrator", "escape", "recording")
+milestone_num = 20 # number of milestones reported over a run (every 5% of completion)
+
+# The resource module (peak resident set size) is only available on Unix; elsewhere peak RSS is not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process in bytes, or None where it can't be measured
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # kilobytes on Linux, bytes on macOS
+
+def print_progress(report):
+    """Prints the percentage of completion at milestones and "Done" at the end of a run (the default report callback)
+    """
+    if report["event"] == "milestone":
+        print(str(report["percent"]) + "%")
+    elif report["event"] == "done":
+        print("Done")
+    elif report["event"] == "cached":
+        print("Done (loaded from result cache)")
+
+def quiet(report):
+    """Ignores reports (a report callback for runs which should print nothing)
+    """
+    pass
+
+class Phase_Timer:
+    """
+    Accumulates the number of calls and wall clock time of named phases, entered with "with timer.phase(name):"
+    Phases may nest, in which case time spent in the inner phase is counted only towards it (e.g. field evaluation within force assembly within integration)
+    """
+    def __init__(self):
+        self.calls = dict.fromkeys(phases, 0)
+        self.seconds = dict.fromkeys(phases, 0.0)
+        self.stack = [] # entered phases as [name, time their current stretch started]
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self.stack: # pauses the enclosing phase
+            self.seconds[self.stack[-1][0]] += now - self.stack[-1][1]
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.seconds[name] += now - self.stack.pop()[1]
+            self.calls[name] += 1
+            if self.stack: # resumes the enclosing phase
+                self.stack[-1][1] = now
+
+    def summary(self):
+        """Returns dictionary by phase of dictionaries {"calls" : n, "seconds" : t}
+        """
+        return {name : {"calls" : self.calls[name], "seconds" : self.seconds[name]} for name in phases}
+
+class Null_Timer:
+    """
+    Phase timer which measures nothing, used when profiling is off
+    """
+    null_phase = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def summary(self):
+        return None
+
+null_timer = Null_Timer()
+
+class Run_Monitor:
+    """
+    Tracks the progress of a run and sends reports to a callback and optionally a JSON lines log
+    Milestones are found by comparing the steps completed against the next milestone step only, so checking for them costs the same however many there are
+    """
+    def __init__(self, policy, report, steps, steps_completed=0):
+        policy = policy or {}
+        self.report_callback = report or print_progress
+        self.log_path = policy.get("log_path")
+        self.every_seconds = policy.get("every_seconds")
+        self.timer = Phase_Timer() if policy.get("profile", False) else null_timer
+        self.steps = steps
+        self.start_step = steps_completed
+        self.start_time = time.perf_counter()
+        self.last_report_time = self.start_time
+        self.particle_steps = 0
+        # Milestones passed before a resumed run started are not reported again
+        self.milestone = 0 if steps_completed == 0 else steps_completed * milestone_num // max(steps, 1) + 1 # index of the next milestone
+        self.milestone_step = self.milestone_steps(self.milestone)
+
+    def milestone_steps(self, milestone):
+        """Returns the number of steps completed at which the milestone of the given index is passed (never for indices past the last)
+        The first milestone (0%) is passed after the first step
+        """
+        if milestone >= milestone_num:
+            return float("inf")
+        return max(-(-milestone * self.steps // milestone_num), 1)
+
+    def advance(self, steps_completed, particle_steps):
+        """Records that steps_completed steps of the run are completed after advancing particle_steps more particle steps, reporting any milestones passed and progress due
+        """
+        self.particle_steps += particle_steps
+        if steps_completed >= self.milestone_step:
+            while steps_completed >= self.milestone_step:
+                self.send("milestone", steps_completed, self.milestone * 100 // milestone_num)
+                self.milestone += 1
+                self.milestone_step = self.milestone_steps(self.milestone)
+        elif self.every_seconds and time.perf_counter() - self.last_report_time >= self.every_seconds:
+            self.send("progress", steps_completed, 100 * steps_completed / max(self.steps, 1))
+
+    def finish(self, steps_completed, event="done"):
+        """Sends the final report of the run, of the given event ("done", or "cached" for runs loaded from the result cache), and returns it
+        """
+        return self.send(event, steps_completed, 100)
+
+    def send(self, event, steps_completed, percent):
+        """Returns report dictionary of the given event after passing it to the callback and log
+        """
+        now = time.perf_counter()
+        self.last_report_time = now
+        elapsed = now - self.start_time
+        steps_done = steps_completed - self.start_step
+        report = {
+            "event" : event,
+            "step" : steps_completed,
+            "steps" : self.steps,
+            "percent" : percent,
+            "elapsed_seconds" : elapsed,
+            "eta_seconds" : elapsed / steps_done * (self.steps - steps_completed) if steps_done > 0 else None,
+            "particle_steps" : self.particle_steps,
+            "particle_steps_per_second" : self.particle_steps / elapsed if elapsed > 0 else None,
+            "peak_rss_bytes" : peak_rss_bytes(),
+            "phases" : self.timer.summary(),
+        }
+        if self.log_path is not None:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(utility.json_compatible(report)) + "\n")
+        self.report_callback(report)
+        return report
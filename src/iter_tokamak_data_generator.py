@@ -1,16 +1,16 @@
 import numpy as np
 import em
-import visualisation
-from simulation import Simulation
+import sweep
+import ensemble
+import sampler
 import utility
-import random
 import os
 import json
 
 # All units are in standard SI units
 
 # Function for generating tokamak simulation settings
-def generate_tokamak_settings(temperature, coil_num, ion_density, simulation_time, timestep):
+def generate_tokamak_settings(temperature, coil_num, ion_density, simulation_time, timestep, particle_num=5, space_charge_shape=None, rng=None, maxwellian=False, placement="shell"):
     """Returns settings dictionary for tokamak based on 3 input variables; temperature, number of coils, ion density
     Args:
         temperature: temperature value for particles to simulate in K
@@ -18,39 +18,73 @@ def generate_tokamak_settings(temperature, coil_num, ion_density, simulation_tim
         ion_densty: number of deuterium ions per m^3 inside the tokamak (electron density assumed to be the same)
         simulation_time: length of time to be simulated in s
         timestep: time step size for RK4 differential solver in s
-
-    Sets 5 electrons and 5 deuterium ions
-    Electron and deuterium velocities are randomly generated 3-tuple direction vectors consisting of integers from 0-9 scaled for average speed corresponding to given temperature
-    Electron and deuterium positions are randomly generated 3-tuples of floats within the torus lying on the cylindric surface of radius 4, height 2 symmetric about x-y plane and axis of rotation x=y=0; 
-    this ensures initial starting locations are well away magnetic field boundaries (to avoid ambiguity with confinement escape detection)
+        particle_num: number of electrons and number of deuterium ions to simulate (all particles are advanced together as a batch, so thousands are feasible)
+        space_charge_shape: optional (nx, ny, nz) number of mesh cells; if given charge separation is modelled self-consistently with the PIC space charge mode (see pic.py), each simulated particle standing for ion_density * torus volume / particle_num real ones,
+            instead of by the parallel plate approximation for the electric field
+        rng: numpy Generator or integer seed the particles are drawn with (see sampler.py); if None fresh entropy is used
+        maxwellian: if True velocities are drawn from the Maxwell-Boltzmann distribution at the given temperature instead of along integer directions
+        placement: "shell", "uniform_shell" or "torus", where particle positions are drawn (see below)
+
+    Sets particle_num electrons and particle_num deuterium ions (5 of each by default)
+    Electron and deuterium velocities are randomly generated 3-tuple direction vectors consisting of integers from 0-9 scaled for average speed corresponding to given temperature (unless maxwellian)
+    With "shell" placement electron and deuterium positions are randomly generated 3-tuples of floats within the torus lying on the cylindric surface of radius 4, height 2 symmetric about x-y plane and axis of rotation x=y=0; 
+    this ensures initial starting locations are well away magnetic field boundaries (to avoid ambiguity with confinement escape detection). With "uniform_shell" placement they are uniformly distributed over that surface
+    (the "shell" placement clusters them towards the y axis), and with "torus" placement uniformly distributed over the torus volume
     """
     # Initialises particle velocity and position parameters
-    avg_velocity_deut = utility.dtype(np.sqrt(8*utility.gas_constant*temperature / (np.pi*utility.deuterium_molar_mass)))
-    avg_velocity_elec = utility.dtype(np.sqrt(8*utility.gas_constant*temperature / (np.pi*utility.electron_molar_mass)))
-    deut_directions = [np.array((random.randrange(10), random.randrange(10), random.randrange(10)), utility.dtype) for _ in range(5)]
-    elec_directions = [np.array((random.randrange(10), random.randrange(10), random.randrange(10)), utility.dtype) for _ in range(5)]
-    
-    deut_x = [random.uniform(-4,4) for _ in range(5)]
-    elec_x = [random.uniform(-4,4) for _ in range(5)]
+    rng = sampler.generator(rng)
+    if maxwellian:
+        deut_velocities = sampler.maxwellian_velocities(rng, particle_num, utility.deuterium_mass, temperature)
+        elec_velocities = sampler.maxwellian_velocities(rng, particle_num, utility.electron_mass, temperature)
+    else:
+        avg_velocity_deut = utility.dtype(np.sqrt(8*utility.gas_constant*temperature / (np.pi*utility.deuterium_molar_mass)))
+        avg_velocity_elec = utility.dtype(np.sqrt(8*utility.gas_constant*temperature / (np.pi*utility.electron_molar_mass)))
+        deut_velocities = sampler.direction_velocities(rng, particle_num, avg_velocity_deut)
+        elec_velocities = sampler.direction_velocities(rng, particle_num, avg_velocity_elec)
+
+    if placement == "shell":
+        deut_positions = sampler.shell_positions(rng, particle_num, uniform_angle=False)
+        elec_positions = sampler.shell_positions(rng, particle_num, uniform_angle=False)
+    elif placement == "uniform_shell":
+        deut_positions = sampler.shell_positions(rng, particle_num)
+        elec_positions = sampler.shell_positions(rng, particle_num)
+    elif placement == "torus":
+        deut_positions = sampler.torus_positions(rng, particle_num)
+        elec_positions = sampler.torus_positions(rng, particle_num)
+    else:
+        raise ValueError("Unknown particle placement: " + str(placement) + "; expected \"shell\", \"uniform_shell\" or \"torus\"")
 
     # Computes electric field within toroid based on an approximating assumption that 10% of ions/electrons form parallel plates of charge on the top and bottom of the torus (thus accounting for charge separation due to drift velocities)
     E_strength = ion_density * 4 * 0.1 * utility.elementary_charge / utility.permittivity_of_free_space
+    if space_charge_shape is not None: # charge separation arises from the particles' own field instead
+        E_strength = 0
 
-    return {
+    settings = {
         "field" : em.Tokamak_Field(utility.dtype(coil_num), utility.dtype(1), utility.dtype(2), utility.dtype(6), np.array([0,0,-E_strength], utility.dtype), np.array([0,0,-9.8], utility.dtype)),
         "timestep" : timestep,
         "simulation_time" : simulation_time,
-        "electron_positions" : [np.array(( x, random.choice([np.sqrt(16-x**2), -np.sqrt(16-x**2)]),  random.uniform(-1,1) ), utility.dtype) for x in elec_x], # in m
-        "electron_velocities" : [avg_velocity_elec * direction for direction in elec_directions], # in m/s
-        "deuterium_positions" : [np.array(( x, random.choice([np.sqrt(16-x**2), -np.sqrt(16-x**2)]), random.uniform(-1,1) ), utility.dtype) for x in deut_x], # in m
-        "deuterium_velocities" : [avg_velocity_deut * direction for direction in deut_directions], # in m/s
+        "electron_positions" : elec_positions, # (particle_num, 3) array in m
+        "electron_velocities" : elec_velocities, # (particle_num, 3) array in m/s
+        "deuterium_positions" : deut_positions, # (particle_num, 3) array in m
+        "deuterium_velocities" : deut_velocities, # (particle_num, 3) array in m/s
     }
+    if space_charge_shape is not None:
+        torus_volume = np.pi * (6**2 - 2**2) * 4 # volume of the square cross section torus of inner radius 2, outer radius 6
+        settings["space_charge"] = {"shape" : space_charge_shape, "macro_weight" : ion_density * torus_volume / particle_num}
+    return settings
+
+# Function for generating tokamak ensemble settings (see ensemble.py)
+def generate_tokamak_ensemble_settings(rng, particle_num, temperature, coil_num, ion_density, simulation_time, timestep):
+    """Returns settings dictionary for tokamak as generate_tokamak_settings, but with particle_num electrons and particle_num deuterium ions drawn with the numpy Generator rng from proper distributions
+    Velocities are drawn from the Maxwell-Boltzmann distribution at the given temperature, and positions uniformly on the cylindric surface of radius 4, height 2 symmetric about x-y plane and axis of rotation x=y=0
+    """
+    return generate_tokamak_settings(temperature, coil_num, ion_density, simulation_time, timestep, particle_num, rng=rng, maxwellian=True, placement="uniform_shell")
 
 # Function for generating data samples for tokamak simulation varying each of the 3 variables individually symmetrically around set initial value with respective step sizes linearly; 21 data points are taken for each variable
-def generate_data_samples_linear(settings):
-    # Initialise simulation object
-    sim = Simulation()
-
+def generate_data_samples_linear(settings, workers=None, seed=None, backend="python"):
+    """Runs the sweep with its cases spread over workers processes (see sweep.run_sweep); every case gets its own seed derived from seed, and the root seed is saved to settings.json
+    An optional "recording" entry of settings gives the recording policy of every case (see recording.py), e.g. {"mode" : "none"} keeps only confinement times and summary statistics
+    """
     # Initialise the range of variable values to test
     variable_vals = {
         "temperature" : [settings["temperature"] + i * settings["temperature_step"] for i in range(-10,11)],
@@ -63,21 +97,42 @@ def generate_data_samples_linear(settings):
     if not os.path.isdir(folder_path): # creates folder if doesn't already exist
         os.mkdir(folder_path)
 
-    # Save simulation settings to a json file in directory
+    # Draw a root seed if none given, so that the sweep can be reproduced from settings.json
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    # Save simulation settings (with the root seed) to a json file in directory
     with open(os.path.join(folder_path, "settings.json"), "w") as f:
-        json.dump(settings, f)
+        json.dump(dict(settings, seed=seed), f)
 
     # Initialise base settings
     base_settings = dict({item for item in settings.items() if item[0] in ("temperature", "coil_num", "ion_density", "simulation_time", "timestep")})
 
-    # Loop over the settings with variables changed accordingly and output data
+    # Create the sweep cases with variables changed accordingly
+    cases = []
     for variable, values in variable_vals.items():
         for value in values:
             current_settings = base_settings.copy()
             current_settings[variable] = value
-            sim.load_settings(generate_tokamak_settings(**current_settings))
-            sim.generate_data()
-            sim.output_data(folder_path, variable+"_"+str(value))
+            cases.append((variable+"_"+str(value), current_settings))
+
+    # Run the cases and output data
+    sweep.run_sweep(generate_tokamak_settings, cases, folder_path, workers, seed, backend, {"recording" : settings.get("recording", {"mode" : "all"})})
+
+# Function for generating data samples for tokamak simulation over a declarative parameter space design, e.g. a Latin hypercube covering coupled effects of several variables
+def generate_data_samples_design(settings, space, design="latin_hypercube", samples=64, workers=None, seed=None, backend="python", executor=None):
+    """Runs the distinct cases of a sweep design over the parameter space into the settings' folder (see sweep.run_design_in_folder); rerunning an interrupted sweep with seed None completes it
+    executor optionally runs the cases instead of a pool of workers processes (see sweep.run_sweep), e.g. sweep.Job_Queue_Executor(queue_folder)
+    """
+    return sweep.run_design_in_folder(generate_tokamak_settings, settings, os.path.join(os.getcwd(), "ITER Tokamak Data", settings["folder"]), ("temperature", "coil_num", "ion_density", "simulation_time", "timestep"), space, design, samples, workers, seed, backend, executor)
+
+# Function for estimating the confinement times of tokamak particles by Monte Carlo, simulating batches of particles drawn from proper distributions until the estimates are precise enough
+def generate_ensemble_statistics(settings, batch_size=1000, target_precision=0.01, seed=None, backend="python", output_path="ensemble_statistics.json"):
+    """Returns dictionary of the ensemble statistics by particle type of ensemble.run_ensemble for the tokamak given by the "temperature", "coil_num", "ion_density", "simulation_time" and "timestep" entries of settings
+    The statistics are saved to output_path after every batch, so that long runs can be followed
+    """
+    arguments = {name : settings[name] for name in ("temperature", "coil_num", "ion_density", "simulation_time", "timestep")}
+    return ensemble.run_ensemble(generate_tokamak_ensemble_settings, arguments, batch_size, target_precision=target_precision, seed=seed, backend=backend, output_path=output_path)
 
 # Settings for the two scenario sets tested
 data_sample_settings_ITER = {
@@ -104,15 +159,22 @@ data_sample_settings_ITER_weak_E = {
     "folder" : "iter_simulation_weak_E", 
 }
 
-# Sample data generation for ITER tokamak setting
+# Sample data generation for ITER tokamak setting (when running with multiple workers, place calls under an if __name__ == "__main__": guard)
 # generate_data_samples_linear(data_sample_settings_ITER)
 
 # Sample data generation for ITER weak_E tokamak setting
 # generate_data_samples_linear(data_sample_settings_ITER_weak_E)
 
+# Latin hypercube sample of 64 cases varying temperature, coil number and ion density together about the ITER weak_E tokamak setting
+# generate_data_samples_design(data_sample_settings_ITER_weak_E, {"temperature" : {"low" : 10**7, "high" : 10**9, "scale" : "log"}, "coil_num" : {"low" : 10**7, "high" : 10**9, "scale" : "log"}, "ion_density" : {"low" : 10**13, "high" : 10**17, "scale" : "log"}})
+
+# Monte Carlo ensemble for ITER weak_E tokamak setting, simulating batches of 1000 particles of each type until the restricted mean confinement times are known to 1% (see ensemble.run_ensemble)
+# statistics = generate_ensemble_statistics(data_sample_settings_ITER_weak_E, batch_size=1000, target_precision=0.01)
+
 # Some tokamak test cases
-# To run, uncomment sim = Simulation(), sim.load_settings code block containing desired simulation settings, sim.generate_data() to generate simulation data, and print confinement time/sim.visualise/sim.output_data for corresponding additional actions if necessary
+# To run, uncomment the import of Simulation, sim = Simulation(), sim.load_settings code block containing desired simulation settings, sim.generate_data() to generate simulation data, and print confinement time/sim.visualise/sim.output_data for corresponding additional actions if necessary
 
+# from simulation import Simulation
 # sim = Simulation()
 
 # Case Simulating ITER Specifications
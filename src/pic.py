@@ -0,0 +1,86 @@
+import numpy as np
+import itertools
+import utility
+
+# Particle-in-cell (PIC) space charge: the particles' own electric field, found each step by depositing their charge onto a mesh and solving Poisson's equation there
+# Enabled by the optional "space_charge" entry of the simulation settings dictionary: {"shape" : (nx, ny, nz), "macro_weight" : w, "lower" : (x, y, z), "upper" : (x, y, z)}
+#   shape: number of mesh cells along each axis
+#   macro_weight: number of real particles each simulated particle stands for (1 by default), scaling the charge it deposits
+#   lower, upper: corners of the mesh in m; by default the box bounding the field region of toroidal fields with a margin of margin_cells cells on every side, which needs shape to exceed 2 * margin_cells along every axis
+# Each step costs O(N + M log M) for N particles and M mesh cells: charge is deposited with cloud-in-cell (trilinear) weights, Poisson's equation is solved with FFTs,
+# and the field is interpolated back to the particles with the same weights. The mesh is periodic, so the margin around the field region keeps image charges away
+
+margin_cells = 4 # cells of empty mesh added on every side of the field region by default
+
+class Space_Charge_Mesh:
+    """
+    Periodic mesh on which the electric field of a set of charged particles is found by cloud-in-cell deposition and an FFT Poisson solve
+    """
+    def __init__(self, lower, upper, shape, macro_weight=1):
+        self.lower = np.array(lower, utility.dtype)
+        self.upper = np.array(upper, utility.dtype)
+        self.shape = tuple(int(n) for n in shape)
+        self.macro_weight = utility.dtype(macro_weight)
+        self.spacing = (self.upper - self.lower) / np.array(self.shape)
+        self.cell_volume = np.prod(self.spacing)
+        self.field_E_mesh = np.zeros((np.prod(self.shape), 3), utility.dtype) # electric field at the mesh nodes, flattened; zero until solve is called
+
+        # Eigenvalues of the discrete (second order finite difference) Laplacian for each Fourier mode, matching the central differences used for the field
+        wavenumbers = [2 * np.pi * np.fft.fftfreq(n, h) for (n, h) in zip(self.shape, self.spacing)]
+        symbols = [(2 * np.sin(k * h / 2) / h)**2 for (k, h) in zip(wavenumbers, self.spacing)]
+        laplacian = symbols[0][:, None, None] + symbols[1][None, :, None] + symbols[2][None, None, :]
+        laplacian[0, 0, 0] = 1 # the mean charge density is dropped (a uniform neutralising background), as a periodic mesh can't hold net charge
+        self.inverse_laplacian = 1 / laplacian
+        self.inverse_laplacian[0, 0, 0] = 0
+
+    @classmethod
+    def from_settings(cls, settings, field):
+        """Returns Space_Charge_Mesh described by the "space_charge" settings dictionary entry, with the mesh fitted around field's region unless lower and upper are given
+        """
+        shape = np.array(settings["shape"])
+        if "lower" in settings:
+            lower, upper = settings["lower"], settings["upper"]
+        else:
+            lower = np.array((-field.outer_radius, -field.outer_radius, field.z_bot), utility.dtype)
+            upper = np.array((field.outer_radius, field.outer_radius, field.z_top), utility.dtype)
+            if np.any(shape <= 2 * margin_cells): # the field region needs at least one cell besides the margins
+                raise ValueError("Space charge mesh shape " + str(tuple(settings["shape"])) + " needs more than " + str(2 * margin_cells) + " cells along every axis to fit the margin around the field region; give a larger shape or the lower and upper corners")
+            margin = (upper - lower) * margin_cells / (shape - 2 * margin_cells)
+            lower, upper = lower - margin, upper + margin
+        return cls(lower, upper, shape, settings.get("macro_weight", 1))
+
+    def cloud_in_cell(self, positions):
+        """Returns tuple (flat_nodes, weights, within) of (N, 8) arrays of the flat indices and trilinear weights of the mesh nodes surrounding the (N, 3) positions argument,
+        and (N,) boolean array of which positions lie within the mesh (the weights of the others are zero)
+        """
+        indices = (positions - self.lower) / self.spacing
+        within = np.all((indices >= 0) & (indices < np.array(self.shape)), axis=1)
+        lower_nodes = np.floor(indices).astype(np.intp)
+        fractions = indices - lower_nodes
+        corners = np.array(list(itertools.product((0, 1), repeat=3)))
+        nodes = (lower_nodes[:, None, :] + corners[None, :, :]) % np.array(self.shape) # periodic wrap of the upper corners
+        flat_nodes = nodes @ np.array((self.shape[1] * self.shape[2], self.shape[2], 1))
+        weights = np.ones((len(positions), 1), utility.dtype)
+        for axis in range(3): # outer products of the per axis weights, in the same order as corners
+            axis_weights = np.stack((1 - fractions[:, axis], fractions[:, axis]), axis=1)
+            weights = (weights[:, :, None] * axis_weights[:, None, :]).reshape(len(positions), -1)
+        weights[~within] = 0
+        flat_nodes[~within] = 0
+        return (flat_nodes, weights, within)
+
+    def solve(self, positions, charges):
+        """Deposits the charges of the particles at the (N, 3) positions argument onto the mesh and updates the mesh electric field by solving Poisson's equation
+        """
+        flat_nodes, weights, _ = self.cloud_in_cell(positions)
+        deposited = np.bincount(flat_nodes.ravel(), (weights * (self.macro_weight * charges)[:, None]).ravel(), np.prod(self.shape))
+        charge_density = deposited.reshape(self.shape) / self.cell_volume
+        potential = np.fft.irfftn(np.fft.rfftn(charge_density) * self.inverse_laplacian[..., :self.shape[2] // 2 + 1], self.shape) / utility.permittivity_of_free_space
+        for axis in range(3): # E = -grad(potential) by periodic central differences
+            gradient = (np.roll(potential, -1, axis) - np.roll(potential, 1, axis)) / (2 * self.spacing[axis])
+            self.field_E_mesh[:, axis] = -gradient.ravel()
+
+    def field_E_batch(self, positions):
+        """Returns (N, 3) array of the mesh electric field interpolated to the (N, 3) positions argument with cloud-in-cell weights; zero outside the mesh
+        """
+        flat_nodes, weights, _ = self.cloud_in_cell(positions)
+        return np.einsum("nk,nkc->nc", weights, np.take(self.field_E_mesh, flat_nodes, axis=0))
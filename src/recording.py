@@ -0,0 +1,280 @@
+import numpy as np
+import em
+import utility
+import json
+import os
+
+# Recording policies deciding which particle positions are kept during data generation
+# The policy is given by the optional "recording" entry of the simulation settings dictionary, one of:
+#   {"mode" : "all"}: record positions at every step (default)
+#   {"mode" : "every", "interval" : k}: record positions at every k-th step
+#   {"mode" : "window", "length" : n}: record positions at only the last n steps
+#   {"mode" : "none"}: record no trajectories; only confinement times and summary statistics are kept
+# The optional "stream_output" settings entry {"path" : path without extension, "chunk_steps" : n} streams the recorded trajectory to a memory mapped path.npy file during the run,
+# flushing it every n steps (1000 by default) together with a JSON sidecar path.json holding the settings, confinement times and number of records written so far
+# Whatever the recording mode, every crossing of the field region boundary (confinement escape) is logged as a wall event (see wall_event_dtype),
+# so wall loads can be studied from runs recording no trajectories; streamed runs write the events to path_wall_events.npy
+# Trajectories of particles retired from a run (see the "retire_escaped" simulation setting) are cut off: their records from the cut off step on are NaN, and the cut off step of every particle is kept (the number of steps of the run if never cut off)
+
+recording_modes = ("all", "every", "window", "none")
+wall_events_suffix = "_wall_events.npy" # appended to the stream_output path to give the path of the wall events file of streamed runs
+
+# Structured dtype of wall events, with a row per particle crossing the field region boundary
+wall_event_dtype = np.dtype([
+    ("id", np.int64), # index of the particle
+    ("species", "U16"), # particle type label, e.g. "Deuterium" or "Electron"
+    ("time", np.float64), # time of the crossing in s
+    ("position", np.float64, (3,)), # position of the crossing in m
+    ("velocity", np.float64, (3,)), # velocity at the crossing in m/s
+    ("kinetic_energy", np.float64), # kinetic energy at the crossing in J
+    ("face", "U8"), # face of the field region crossed, one of em.region_faces ("" where unknown)
+])
+
+class Wall_Event_Log:
+    """
+    Log of the particles crossing the field region boundary during a run
+    """
+    def __init__(self, species):
+        self.species = np.asarray(species, wall_event_dtype["species"]) # (n_particles,) array of the type label of every particle
+        self.chunks = [] # structured arrays of the events logged so far, concatenated only when the events are asked for
+
+    @classmethod
+    def from_visualisation_settings(cls, visualisation_settings):
+        """Returns Wall_Event_Log for the particles described by a simulation's visualisation settings
+        """
+        return cls(np.array(visualisation_settings["path_labels"])[np.array(visualisation_settings["sets_color_ind"], np.intp)])
+
+    def add(self, ids, times, positions, velocities, masses, faces):
+        """Logs the boundary crossings of the particles with indices ids
+        Args:
+            times: (M,) array of crossing times
+            positions, velocities: (M, 3) arrays of the particles' kinematics at the crossings
+            masses: (M,) array of the particles' masses
+            faces: (M,) array of the codes of the faces crossed (indices into em.region_faces, -1 where unknown)
+        """
+        if len(ids) == 0:
+            return
+        events = np.zeros(len(ids), wall_event_dtype)
+        events["id"] = ids
+        events["species"] = self.species[ids]
+        events["time"] = times
+        events["position"] = positions
+        events["velocity"] = velocities
+        events["kinetic_energy"] = 0.5 * masses * (np.asarray(velocities, np.float64)**2).sum(axis=1)
+        events["face"] = np.array(em.region_faces + ("",))[faces] # code -1 picks the empty name
+        self.chunks.append(events)
+
+    def events(self):
+        """Returns structured array of all events logged so far in order of time
+        """
+        events = np.concatenate(self.chunks) if self.chunks else np.zeros(0, wall_event_dtype)
+        return events[np.argsort(events["time"], kind="stable")]
+
+class Trajectory_Recorder:
+    """
+    Records particle positions into a preallocated (n_particles, n_records, 3) buffer according to a recording policy
+    """
+    chunk_steps = None # number of steps between flushes of recorded data to disk; None if the recorder keeps everything in memory
+
+    def __init__(self, settings, particle_num, steps, visualisation_settings):
+        self.wall_events = Wall_Event_Log.from_visualisation_settings(visualisation_settings)
+        policy = settings.get("recording", {"mode" : "all"})
+        self.mode = policy.get("mode", "all")
+        self.steps = steps
+        self.window = 0 # length of the ring buffer in window mode, 0 otherwise
+        self.cutoff_steps = np.full(particle_num, steps) # step from which nothing is recorded for each particle
+        if self.mode == "all":
+            self.interval = 1
+            records = steps
+        elif self.mode == "every":
+            self.interval = int(policy["interval"])
+            records = -(-steps // self.interval) # number of multiples of interval below steps
+        elif self.mode == "window":
+            self.window = min(int(policy["length"]), steps)
+            self.interval = 1 if self.window else 0
+            records = self.window
+        elif self.mode == "none":
+            self.interval = 0 # an interval of 0 means nothing is recorded
+            records = 0
+        else:
+            raise ValueError("Unknown recording mode: " + str(self.mode) + "; expected one of " + str(recording_modes))
+        self.buffer = self.allocate_buffer((particle_num, records, 3), settings.get("trajectory_dtype", np.float64))
+
+    def allocate_buffer(self, shape, dtype):
+        """Returns the array positions are recorded into
+        """
+        return np.empty(shape, dtype)
+
+    def record(self, step, positions, rows=slice(None)):
+        """Records the (N, 3) positions array at the start of the given step if the policy keeps that step
+        rows selects the particles (buffer rows) the positions belong to, by default all of them
+        """
+        if self.interval and step % self.interval == 0:
+            slot = step % self.window if self.window else step // self.interval
+            self.buffer[rows, slot] = positions
+
+    def cut_off(self, rows, step):
+        """Marks the trajectories of the particles indexed by rows as cut off at the given step, from which their records are NaN
+        """
+        self.cutoff_steps[rows] = step
+        if not self.window: # window mode ring buffer slots still hold earlier records, so cut off records are only blanked in trajectory
+            self.buffer[rows, self.records_before(step):] = np.nan
+
+    def recorded_steps(self):
+        """Returns array of the indices of the steps whose positions are kept, in chronological order
+        """
+        if self.window:
+            return np.arange(self.steps - self.window, self.steps)
+        if self.interval:
+            return np.arange(0, self.steps, self.interval)
+        return np.arange(0)
+
+    def trajectory(self):
+        """Returns (n_particles, n_records, 3) array of the kept positions in chronological order
+        """
+        if self.window:
+            trajectory = np.roll(self.buffer, -(self.steps % self.window), axis=1) # the oldest kept step sits in the slot after the most recently written one
+            trajectory[self.recorded_steps()[None, :] >= self.cutoff_steps[:, None]] = np.nan
+            return trajectory
+        return self.buffer
+
+    def records_before(self, step):
+        """Returns number of records kept from the steps before the given step
+        """
+        return -(-step // self.interval) if self.interval else 0
+
+    def flush(self, steps_completed, confinement_times):
+        """Writes data recorded so far to disk; nothing to do for in memory recorders
+        """
+        pass
+
+    def close(self, confinement_times, summary):
+        """Finishes recording once the run is complete; nothing to do for in memory recorders
+        """
+        pass
+
+class Streaming_Trajectory_Recorder(Trajectory_Recorder):
+    """
+    Trajectory recorder whose buffer is a memory mapped .npy file, flushed to disk every chunk_steps steps along with a JSON sidecar holding the settings and run progress,
+    so that partial results survive crashes and the full trajectory never has to be held in memory
+    """
+    def __init__(self, settings, particle_num, steps, visualisation_settings):
+        self.path = settings["stream_output"]["path"]
+        self.chunk_steps = int(settings["stream_output"].get("chunk_steps", 1000))
+        super().__init__(settings, particle_num, steps, visualisation_settings)
+        if self.window:
+            raise ValueError("Streaming output does not support the window recording mode")
+        self.metadata = {
+            "status" : "running",
+            "settings" : utility.json_compatible(settings),
+            "visualisation_settings" : utility.json_compatible(visualisation_settings),
+            "steps" : steps,
+            "steps_completed" : 0,
+            "record_interval" : self.interval,
+            "records_written" : 0,
+            "confinement_times" : [False] * particle_num,
+            "cutoff_steps" : utility.json_compatible(self.cutoff_steps),
+            "summary" : None,
+        }
+        self.write_sidecar()
+
+    def allocate_buffer(self, shape, dtype):
+        if 0 in shape: # memory maps can't be empty
+            return np.empty(shape, dtype)
+        return np.lib.format.open_memmap(self.path + ".npy", mode="w+", dtype=dtype, shape=shape)
+
+    def __getstate__(self):
+        """Returns the recorder state for pickling (e.g. in checkpoints) without the memory mapped buffer, whose contents are already on disk
+        """
+        state = self.__dict__.copy()
+        state["buffer"] = isinstance(self.buffer, np.memmap) or self.buffer # True marks a memory mapped buffer to be reopened when unpickled
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.buffer is True:
+            self.buffer = np.load(self.path + ".npy", mmap_mode="r+")
+
+    def write_sidecar(self):
+        """Writes the JSON sidecar file, replacing the previous one only once the new one is fully written
+        """
+        with utility.atomic_write(self.path + ".json", "w") as f:
+            json.dump(self.metadata, f)
+
+    def flush(self, steps_completed, confinement_times):
+        """Writes the trajectory chunks recorded so far to disk and updates the sidecar with the run progress
+        """
+        if isinstance(self.buffer, np.memmap):
+            self.buffer.flush()
+        self.metadata["steps_completed"] = steps_completed
+        self.metadata["records_written"] = self.records_before(steps_completed)
+        self.metadata["confinement_times"] = utility.json_compatible(confinement_times)
+        self.metadata["cutoff_steps"] = utility.json_compatible(self.cutoff_steps)
+        with utility.atomic_write(self.path + wall_events_suffix) as f:
+            np.save(f, self.wall_events.events())
+        self.write_sidecar()
+
+    def close(self, confinement_times, summary):
+        self.metadata["summary"] = utility.json_compatible(summary)
+        self.metadata["status"] = "complete"
+        self.flush(self.steps, confinement_times)
+
+def make_recorder(settings, particle_num, steps, visualisation_settings):
+    """Returns the trajectory recorder for a run; a Streaming_Trajectory_Recorder if settings has a "stream_output" entry, else a Trajectory_Recorder
+    """
+    if "stream_output" in settings:
+        return Streaming_Trajectory_Recorder(settings, particle_num, steps, visualisation_settings)
+    return Trajectory_Recorder(settings, particle_num, steps, visualisation_settings)
+
+def streamed_output_path(path):
+    """Returns the path (without extension) of the streamed run whose output file (the JSON sidecar, the trajectory .npy or the wall events .npy) is at path, or None if path is not a streamed output file
+    """
+    for suffix in (wall_events_suffix, ".npy", ".json"): # the wall events suffix is checked first, as it also ends in .npy
+        if path.endswith(suffix) and os.path.exists(path[:-len(suffix)] + ".json"):
+            return path[:-len(suffix)]
+    return None
+
+def load_streamed_data(path):
+    """Returns data dictionary (in the same format as Simulation.data) of a streamed run saved at path (without extension)
+    The trajectory is memory mapped read only, so only the parts of it that are used are read from disk; for unfinished runs only the records written before the last flush are included
+    """
+    with open(path + ".json", "r") as f:
+        metadata = json.load(f)
+    settings = metadata["settings"]
+    settings["field"] = em.field_from_dict(settings["field"])
+    particle_num = len(metadata["confinement_times"])
+    interval = metadata["record_interval"]
+    if metadata["records_written"]:
+        trajectory = np.load(path + ".npy", mmap_mode="r")[:, :metadata["records_written"]]
+    else:
+        trajectory = np.empty((particle_num, 0, 3))
+    wall_events_path = path + wall_events_suffix
+    wall_events = np.load(wall_events_path) if os.path.exists(wall_events_path) else np.zeros(0, wall_event_dtype)
+    return {
+        "settings" : settings,
+        "visualisation_settings" : metadata["visualisation_settings"],
+        "data" : trajectory,
+        "recorded_steps" : np.arange(metadata["records_written"]) * interval,
+        "confinement_times" : metadata["confinement_times"],
+        "cutoff_steps" : np.array(metadata.get("cutoff_steps", [metadata["steps"]] * particle_num)),
+        "wall_events" : wall_events,
+        "summary" : metadata["summary"],
+        "status" : metadata["status"],
+    }
+
+def summary_statistics(confinement_times, velocities):
+    """Returns dictionary of summary statistics of a finished run
+    Args:
+        confinement_times: list of confinement escape times (False where the particle did not escape)
+        velocities: (N, 3) array of final particle velocities
+    """
+    escape_times = np.array([time for time in confinement_times if time is not False], np.float64)
+    return {
+        "particle_num" : len(confinement_times),
+        "escaped_num" : len(escape_times),
+        "escaped_fraction" : len(escape_times) / len(confinement_times) if confinement_times else 0,
+        "mean_confinement_time" : float(escape_times.mean()) if len(escape_times) else None, # mean over escaped particles only
+        "min_confinement_time" : float(escape_times.min()) if len(escape_times) else None,
+        "max_confinement_time" : float(escape_times.max()) if len(escape_times) else None,
+        "final_mean_speed" : float(np.sqrt((velocities**2).sum(axis=1)).mean()) if len(velocities) else None,
+    }
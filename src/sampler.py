@@ -0,0 +1,50 @@
+import numpy as np
+import utility
+
+# Seeded, vectorized sampling of particle initial conditions
+# Every function takes a numpy Generator rng (e.g. np.random.default_rng(seed)) and returns all particle_num samples as one (particle_num, 3) array of dtype utility.dtype,
+# so a run's initial conditions are reproduced exactly from its seed; sweeps give every case a Generator of its own (see sweep.case_seeds)
+
+def generator(seed=None):
+    """Returns numpy Generator seeded with the seed argument (an integer, a np.random.SeedSequence or None for fresh entropy), or the argument itself if it already is a Generator
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def boltzmann_constant():
+    """Returns the Boltzmann constant in J/K from the gas constant and Avogadro constant used throughout
+    """
+    return utility.gas_constant / utility.avogadro
+
+def shell_positions(rng, particle_num, radius=4, half_height=1, uniform_angle=True):
+    """Returns (particle_num, 3) array of positions in m on the cylindric surface of the given radius about the z axis, uniformly distributed in height between -half_height and half_height
+    Args:
+        uniform_angle: if True positions are uniform over the surface; if False x is uniform between -radius and radius instead, with y on either side of the x axis with equal probability,
+            as the original data generators placed particles (so positions cluster towards the y axis)
+    """
+    if uniform_angle:
+        angles = rng.uniform(0, 2 * np.pi, particle_num)
+        x, y = radius * np.cos(angles), radius * np.sin(angles)
+    else:
+        x = rng.uniform(-radius, radius, particle_num)
+        y = rng.choice((-1, 1), particle_num) * np.sqrt(radius**2 - x**2)
+    return np.stack((x, y, rng.uniform(-half_height, half_height, particle_num)), axis=1).astype(utility.dtype)
+
+def torus_positions(rng, particle_num, inner_radius=2, outer_radius=6, z_bot=-2, z_top=2):
+    """Returns (particle_num, 3) array of positions in m uniformly distributed over the volume of the rectangular cross section torus about the z axis of the given inner and outer radii, between heights z_bot and z_top
+    (the field region of the toroidal fields of em.py)
+    """
+    radii = np.sqrt(rng.uniform(inner_radius**2, outer_radius**2, particle_num)) # the area element r dr dphi makes r^2 uniform
+    angles = rng.uniform(0, 2 * np.pi, particle_num)
+    return np.stack((radii * np.cos(angles), radii * np.sin(angles), rng.uniform(z_bot, z_top, particle_num)), axis=1).astype(utility.dtype)
+
+def maxwellian_velocities(rng, particle_num, mass, temperature):
+    """Returns (particle_num, 3) array of velocities in m/s drawn from the Maxwell-Boltzmann distribution of particles of the given mass in kg at temperature in K
+    """
+    return rng.normal(0, np.sqrt(boltzmann_constant() * temperature / mass), (particle_num, 3)).astype(utility.dtype)
+
+def direction_velocities(rng, particle_num, speed):
+    """Returns (particle_num, 3) array of velocities in m/s along directions of integer components from 0 to 9, scaled by speed, as the original data generators drew them
+    """
+    return (speed * rng.integers(0, 10, (particle_num, 3))).astype(utility.dtype)
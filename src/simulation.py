@@ -1,6 +1,14 @@
 import numpy as np
 import em
 import visualisation
+import compiled
+import recording
+import checkpoint
+import pic
+import coulomb
+import cache
+import utility
+import instrumentation
 
 # Modules for saving
 import pickle
@@ -10,21 +18,47 @@ import os
 class Simulation:
     def __init__(self):
         self.data = None
+        self.backend = "python"
+        self.run_state = None # state of the run in progress (see generate_data)
+        self.report = None # callback given progress reports during data generation (see instrumentation.py)
     
-    def load_settings(self, settings):
+    def load_settings(self, settings, backend="python", report=None):
         """Loads simulation settings (a dictionary)
+        Args:
+            backend: "python" to integrate with the NumPy particle batch, or "numba" to use the compiled kernels in compiled.py;
+                the compiled kernels are used only if numba is installed, the field is one of the built in types, the integrator is RK4 or RK45 and there is no space charge or Coulomb interaction, otherwise the Python backend is used
+            report: function called with each progress report dictionary during data generation (see instrumentation.py); by default the percentage of completion is printed
+        Optional settings include "integrator" ("rk4" by default, "rk45" for adaptive per particle steps with "integrator_options" {"rtol" : ..., "atol" : ...}, "boris" or "guiding_centre"; see em.Particle_Batch;
+        with the Python backend RK45 runs a loop iteration in Python per internal substep, so runs in which some particles need many substeps per timestep (e.g. electrons in tokamak fields) are far slower than with the numba backend, which substeps each particle within the compiled kernel),
+        "trajectory_dtype", "recording" and "stream_output" (see recording.py), "checkpoint" (see checkpoint.py)
+        "space_charge" (see pic.py), "coulomb" (see coulomb.py), "result_cache" (see cache.py), "instrumentation" (see instrumentation.py) and "retire_escaped" (False by default; if True particles stop being advanced and recorded once they escape confinement, and the run stops once every particle has escaped)
         """
+        if backend not in ("python", "numba"):
+            raise ValueError("Unknown simulation backend: " + str(backend))
         self.settings = settings
+        self.backend = backend
+        self.report = report
 
     def generate_data(self):
         """Generates simulation data
+        Particle trajectories are stored in self.data["data"] as a (n_particles, n_records, 3) array of positions; its dtype is given by the optional "trajectory_dtype" setting (np.float64 by default, np.float32 halves memory and file size)
+        Which steps are recorded is given by the optional "recording" setting (see recording.py); the indices of the recorded steps are stored in self.data["recorded_steps"] and summary statistics of the run in self.data["summary"]
         """
+        # Loads the results of an earlier run with the same settings from the result cache, if enabled
+        if "result_cache" in self.settings and "stream_output" not in self.settings:
+            cached = cache.Result_Cache.from_settings(self.settings["result_cache"]).get(cache.settings_key(self.settings, self.backend))
+            if cached is not None:
+                self.data = cached
+                steps = round(self.settings["simulation_time"] / self.settings["timestep"])
+                self.data["instrumentation"] = instrumentation.Run_Monitor(self.settings.get("instrumentation"), self.report, steps, steps).finish(steps, "cached") # reports the run as complete
+                return
+
         self.data = {}
         self.data["settings"] = self.settings
         self.data["visualisation_settings"] = {}
 
         # Deals with cases where there are only deuterium ions, only electrons or there are both
-        if self.settings["electron_positions"] == None:
+        if self.settings["electron_positions"] is None:
             self.data["visualisation_settings"].update({
                 "path_labels" : ("Deuterium",),
                 "path_colors" : ("b",),
@@ -32,7 +66,7 @@ class Simulation:
             })
             deuterium_ions = [em.Deuterium_Ion(position=position, velocity=velocity, field=self.settings["field"]) for (position, velocity) in zip(self.settings["deuterium_positions"], self.settings["deuterium_velocities"])]
             particles = deuterium_ions
-        elif self.settings["deuterium_positions"] == None:
+        elif self.settings["deuterium_positions"] is None:
             self.data["visualisation_settings"].update({
                 "path_labels" : ("Electron",),
                 "path_colors" : ("r",),
@@ -50,39 +84,167 @@ class Simulation:
             electrons = [em.Electron(position=position, velocity=velocity, field=self.settings["field"]) for (position, velocity) in zip(self.settings["electron_positions"], self.settings["electron_velocities"])]
             particles = deuterium_ions + electrons
 
-        # Initialises data holders and simulation time recorder
-        data = [[[], [], []] for _ in range(len(self.data["visualisation_settings"]["sets_color_ind"]))]
-        time = 0
-        confinement_times = [False] * len(particles)
-        # Initialses dictionary used for reporting data generation progress
-        generation_progress_report = {proportion*self.settings["simulation_time"]:[percent, False] for (proportion, percent) in [(0.05*i, str(i*5)+"%") for i in range(20)]} # key is time passed corresponding to the proportional completion, percent is a string with the percentage, the False value is to indicate the percentage hasn't been passed yet
+        # Gathers all particles into a single batch advanced together with vectorized RK4 steps
+        particle_batch = em.Particle_Batch.from_particles(particles, self.settings["field"], self.settings.get("integrator", "rk4"), self.settings.get("integrator_options"))
+        if "space_charge" in self.settings:
+            particle_batch.space_charge = pic.Space_Charge_Mesh.from_settings(self.settings["space_charge"], self.settings["field"])
+        if "coulomb" in self.settings:
+            particle_batch.coulomb = coulomb.Coulomb_Interaction.from_settings(self.settings["coulomb"])
+
+        # Initialises the state of the run, which is everything needed to continue it from a checkpoint
+        steps = round(self.settings["simulation_time"] / self.settings["timestep"])
+        self.run_state = {
+            "particle_batch" : particle_batch,
+            "recorder" : recording.make_recorder(self.settings, len(particle_batch), steps, self.data["visualisation_settings"]),
+            "steps" : steps, # total number of steps of the run
+            "step" : 0, # number of steps completed
+            "time" : 0, # simulation time recorder
+            "confinement_times" : [False] * len(particle_batch),
+        }
+        self.continue_run()
+
+    def continue_run(self):
+        """Generates particle trajectories and confinement times for the steps remaining in self.run_state with the chosen backend, then stores the results in self.data
+        Checkpoints are saved during the run according to the optional "checkpoint" setting (see checkpoint.py)
+        """
+        checkpointer = checkpoint.Checkpointer(self.settings.get("checkpoint"), self.run_state["step"])
+        monitor = instrumentation.Run_Monitor(self.settings.get("instrumentation"), self.report, self.run_state["steps"], self.run_state["step"])
+        self.run_state["particle_batch"].timer = monitor.timer
+        if self.backend == "numba" and compiled.available and compiled.supports(self.settings):
+            self.run_compiled(self.run_state, checkpointer, monitor)
+        else:
+            self.run_python(self.run_state, checkpointer, monitor)
+        self.run_state["particle_batch"].timer = instrumentation.null_timer
+
+        recorder = self.run_state["recorder"]
+        confinement_times = self.run_state["confinement_times"]
+        self.data["data"] = recorder.trajectory() # assigns the generated data to self.data dictionary
+        self.data["recorded_steps"] = recorder.recorded_steps()
+        self.data["confinement_times"] = confinement_times # assign confinement times found to self.data dictionary
+        self.data["wall_events"] = recorder.wall_events.events() # structured array of the crossings of the field region boundary (see recording.wall_event_dtype)
+        self.data["cutoff_steps"] = recorder.cutoff_steps # step each trajectory was cut off at when retiring escaped particles (steps of the run if never cut off)
+        self.data["summary"] = recording.summary_statistics(confinement_times, self.run_state["particle_batch"].all_velocities())
+        self.data["instrumentation"] = monitor.finish(self.run_state["step"]) # throughput, memory use and (when profiling) time spent in each phase of the run
+        recorder.close(confinement_times, self.data["summary"])
+        self.run_state = None
+
+        if "result_cache" in self.settings and "stream_output" not in self.settings:
+            cache.Result_Cache.from_settings(self.settings["result_cache"]).put(cache.settings_key(self.settings, self.backend), self.data)
+
+    def save_checkpoint(self, checkpointer):
+        """Saves the run in progress with checkpointer (a checkpoint.Checkpointer), after flushing any streamed output up to the current step
+        """
+        self.run_state["recorder"].flush(self.run_state["step"], self.run_state["confinement_times"])
+        checkpointer.save({"settings" : self.settings, "backend" : self.backend, "data" : self.data, "run_state" : self.run_state}, self.run_state["step"])
+
+    def resume(self, path, report=None):
+        """Loads the checkpoint at path saved during generate_data and continues the run from it
+        The results are identical to those of the run had it not been interrupted
+        Args:
+            report: function called with each progress report dictionary (see load_settings)
+        """
+        saved = checkpoint.load(path)
+        self.report = report
+        self.settings = saved["settings"]
+        self.backend = saved["backend"]
+        self.data = saved["data"]
+        self.run_state = saved["run_state"]
+        self.continue_run()
+
+    def run_python(self, state, checkpointer, monitor):
+        """Advances the particle batch of the run state dictionary state over its remaining time steps with the NumPy RK4 integrator, updating state as it goes
+        Particle positions at the start of each step are passed to the run's recorder (a recording.Trajectory_Recorder), and progress to monitor (an instrumentation.Run_Monitor)
+        """
+        particle_batch = state["particle_batch"]
+        recorder = state["recorder"]
+        confinement_times = state["confinement_times"] # confinement escape times (False where the particle did not escape)
+        time = state["time"]
+        retire = self.settings.get("retire_escaped", False)
+        timer = monitor.timer
         # Loops over time steps determined by specified simulation time and timestep settings
-        for _ in range(round(self.settings["simulation_time"] / self.settings["timestep"])):
+        for step in range(state["step"], state["steps"]):
+            if retire and len(particle_batch) == 0: # stops the run once every particle has escaped
+                break
             time += self.settings["timestep"] # increments time recorder
-            for ind, particle in enumerate(particles): # loops over particles
-                for index, axis in enumerate(data[ind]):
-                    axis.append(particle.position[index]) # record new particle position
-                escaped_confinement = particle.update(self.settings["timestep"])
-                if escaped_confinement: # recording particle confinement escape
-                    confinement_times[ind] = time
-            # Reporting generation progress
-            for progress in generation_progress_report.keys(): # loops over the milestone times corresponding to completion progress to check for whether a new milestone has been passed
-                if time >= progress and generation_progress_report[progress][1] == False: # if a new milestone has been passed
-                    generation_progress_report[progress][1] = True # set the milestone's passed status to True
-                    print(generation_progress_report[progress][0]) # print corresponding progress completion
-                    break # break out of the milestone time checking loop
-        else: # After data generation complete
-            print("Done") 
-                
-        self.data["data"] = data # assigns the generated data to self.data dictionary
-        self.data["confinement_times"] = confinement_times # assign confinement times found to self.data dictionary
+            with timer.phase("recording"):
+                recorder.record(step, particle_batch.positions, particle_batch.indices) # record new particle positions
+            particle_num = len(particle_batch)
+            escaped_confinement = particle_batch.update(self.settings["timestep"])
+            if escaped_confinement is not None: # recording particle confinement escape
+                with timer.phase("escape"):
+                    escaped_indices = particle_batch.indices[escaped_confinement]
+                    crossings = particle_batch.crossings
+                    escape_times = time - (1 - crossings["fractions"]) * self.settings["timestep"] # times at which the particles crossed the field region boundary, interpolated within the step
+                    for (ind, escape_time) in zip(escaped_indices, escape_times):
+                        confinement_times[ind] = float(escape_time)
+                with timer.phase("recording"):
+                    recorder.wall_events.add(escaped_indices, escape_times, crossings["positions"], crossings["velocities"], particle_batch.masses[escaped_confinement], crossings["faces"])
+                    if retire and len(escaped_indices): # removes escaped particles from the batch and cuts off their trajectories
+                        particle_batch.retire(escaped_confinement)
+                        recorder.cut_off(escaped_indices, step + 1)
+            state["step"] = step + 1
+            state["time"] = time
+            if recorder.chunk_steps and (step + 1) % recorder.chunk_steps == 0: # flushing recorded data to disk when streaming output
+                with timer.phase("recording"):
+                    recorder.flush(step + 1, confinement_times)
+            if checkpointer.due(step + 1):
+                self.save_checkpoint(checkpointer)
+            monitor.advance(step + 1, particle_num) # reports generation progress
+
+    def run_compiled(self, state, checkpointer, monitor):
+        """Advances the particle batch of the run state dictionary state over its remaining time steps with the compiled kernel of the run's integrator, filling the buffer of the run's recorder
+        Progress is passed to monitor (an instrumentation.Run_Monitor) after each chunk of steps the kernel runs
+        """
+        particle_batch = state["particle_batch"]
+        recorder = state["recorder"]
+        steps = state["steps"]
+        times = np.cumsum(np.full(steps, self.settings["timestep"])) # time at the end of each step, accumulated in the same way as run_python
+        escape_times = np.array([np.nan if escape_time is False else escape_time for escape_time in state["confinement_times"]], np.float64)
+        retire = self.settings.get("retire_escaped", False)
+        run_kernel = compiled.runners[self.settings.get("integrator", "rk4")]
+        # Runs the kernel in chunks of steps when recorded data has to be flushed or checkpoints saved during the run
+        # and in chunks of at most the steps between progress milestones (but no fewer than 1000 steps, keeping the overhead of returning from the kernel small), so that progress is reported as the run goes
+        chunk_sizes = (recorder.chunk_steps, checkpointer.every_steps, 1000 if checkpointer.every_seconds else None, 1000 if monitor.every_seconds else None, max(steps // instrumentation.milestone_num, 1000))
+        chunk_steps = min(size for size in chunk_sizes if size)
+        timer = monitor.timer
+        for start in range(state["step"], steps, chunk_steps):
+            stop = min(start + chunk_steps, steps)
+            particle_num = len(particle_batch) - np.count_nonzero(~np.isnan(escape_times)) if retire else len(particle_batch) # escaped particles are skipped by the kernel when retiring them
+            with timer.phase("integrator"):
+                escape_steps, escape_states = run_kernel(particle_batch, self.settings["timestep"], times, start, stop, recorder, escape_times, retire)
+            with timer.phase("recording"):
+                escaped_ind = np.flatnonzero(escape_steps >= 0)
+                recorder.wall_events.add(escaped_ind, escape_times[escaped_ind], escape_states[escaped_ind, :3], escape_states[escaped_ind, 3:6], particle_batch.masses[escaped_ind], escape_states[escaped_ind, 6].astype(np.intp))
+                if retire: # cuts off the trajectories of particles escaping in this chunk after their escape step
+                    for ind in escaped_ind:
+                        recorder.cut_off(ind, escape_steps[ind] + 1)
+            state["step"] = stop
+            state["time"] = times[stop - 1]
+            state["confinement_times"] = [False if np.isnan(escape_time) else float(escape_time) for escape_time in escape_times]
+            with timer.phase("recording"):
+                recorder.flush(stop, state["confinement_times"])
+            if checkpointer.due(stop):
+                self.save_checkpoint(checkpointer)
+            monitor.advance(stop, particle_num * (stop - start)) # reports generation progress
+            if retire and not np.isnan(escape_times).any(): # stops the run once every particle has escaped
+                break
+
+    def data_as_nested_lists(self):
+        """Returns the trajectory data in the nested list format [[x values, y values, z values], ...] used by older data files and notebooks
+        """
+        return utility.trajectory_to_nested_lists(self.data["data"])
 
-    def visualise(self, plot_or_anime, anime_time=10, fps=20, to_proportion=False, custom_limits=None, plot_vectors=False, vector_plot_length=0, vector_num=5):
+    def visualise(self, plot_or_anime, anime_time=10, fps=20, to_proportion=False, custom_limits=None, plot_vectors=False, vector_plot_length=0, vector_num=5, record_slice=None):
         """Generates data visualisation according to inputted visualisation arguments
+        Args:
+            record_slice: optional tuple (start, stop) or (start, stop, step) of the range of records to visualise, e.g. for paging through large memory mapped trajectories
         """
-        if self.data:
+        if self.data and np.size(self.data["data"]): # trajectories are empty when the run was recorded with the "none" recording mode
+            point_sets = utility.as_trajectory_array(self.data["data"])
+            if record_slice:
+                point_sets = point_sets[:, slice(*record_slice)]
             # Initialises a Visualiser class instance with corresponding visualisation settings
-            visualiser = visualisation.Visualiser(self.data["visualisation_settings"], self.data["data"], self.data["settings"]["field"].field_methods, to_proportion, custom_limits)
+            visualiser = visualisation.Visualiser(self.data["visualisation_settings"], point_sets, self.data["settings"]["field"].field_methods, to_proportion, custom_limits)
             if plot_or_anime == "plot":
                 visualiser.plot_3d(plot_vectors, vector_plot_length, vector_num)
             elif plot_or_anime == "anime":
@@ -90,7 +252,12 @@ class Simulation:
 
     def load_data(self, folder=None, filename=None, absolute_path=None):
         """Loadss data from .pkl files at location according to specified argument values into self.data attribute of class instance
+        If absolute_path is one of the files of streamed output (the .json sidecar, trajectory .npy or wall events .npy), the streamed data is loaded instead (see load_streamed_data)
         """
+        streamed_path = recording.streamed_output_path(absolute_path) if absolute_path else None
+        if streamed_path is not None:
+            self.load_streamed_data(absolute_path=streamed_path)
+            return
         if absolute_path:
             file_path = absolute_path
         else:
@@ -99,6 +266,16 @@ class Simulation:
         with open(file_path, "rb") as f:
             self.data = pickle.load(f)
 
+    def load_streamed_data(self, folder=None, filename=None, absolute_path=None):
+        """Loads data streamed during a run (with the "stream_output" setting) at location according to specified argument values (paths without extension) into self.data attribute of class instance
+        The trajectory is memory mapped rather than read into memory, so that large runs can be paged through with the record_slice argument of visualise
+        """
+        if absolute_path:
+            file_path = absolute_path
+        else:
+            file_path = os.path.join(os.getcwd(), folder, filename)
+        self.data = recording.load_streamed_data(file_path)
+
     def output_data(self, folder=None, filename=None, absolute_path=None):
         """Outputs data file in .pkl format to a file at location according to specified argument values
         """
@@ -108,5 +285,5 @@ class Simulation:
             else:
                 output_folder = os.path.join(os.getcwd(), folder)
                 file_path = os.path.join(output_folder, filename+".pkl")
-            with open(file_path, "wb") as f:
+            with utility.atomic_write(file_path) as f: # an interrupted run never leaves a partial data file behind
                 pickle.dump(self.data, f, pickle.HIGHEST_PROTOCOL)
\ No newline at end of file
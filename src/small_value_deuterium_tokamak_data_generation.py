@@ -1,15 +1,14 @@
 import numpy as np
 import em
-import visualisation
-from simulation import Simulation
+import sweep
+import sampler
 import utility
-import random
 import os
 import json
 
 # All units are in standard SI units
 
-def generate_small_value_tokamak_settings(coil_num, E_field, speed, simulation_time, timestep):
+def generate_small_value_tokamak_settings(coil_num, E_field, speed, simulation_time, timestep, particle_num=10, rng=None):
     """Returns settings dictionaries for tokamak based on 3 input variables; temperature, number of coils, ion density
     Args:
         coil_num: number of rings of coils around the toroid (assumed current through them is 0.05 A)
@@ -17,16 +16,18 @@ def generate_small_value_tokamak_settings(coil_num, E_field, speed, simulation_t
         speed: speed scalar of particles in m/s
         simulation_time: length of time to be simulated in s
         timestep: time step size for RK4 differential solver in s
+        particle_num: number of deuterium ions to simulate
+        rng: numpy Generator or integer seed the particles are drawn with (see sampler.py); if None fresh entropy is used
 
-    Sets 10 deuterium ions
+    Sets particle_num deuterium ions (10 by default)
     Deuterium velocities are randomly generated 3-tuple direction vectors consisting of integers from 0-9 scaled for average speed
     Deuterium positions are randomly generated 3-tuples of floats within the torus lying on the cylindric surface of radius 4, height 2 symmetric about x-y plane and axis of rotation x=y=0; 
     this ensures initial starting locations are well away magnetic field boundaries (to avoid ambiguity with confinement escape detection)
     """
     # Initialises particle velocity and position parameters
-    deut_directions = [np.array((random.randrange(10), random.randrange(10), random.randrange(10)), utility.dtype) for _ in range(10)]
-    
-    deut_x = [random.uniform(-4,4) for _ in range(10)]
+    rng = sampler.generator(rng)
+    deut_velocities = sampler.direction_velocities(rng, particle_num, speed)
+    deut_positions = sampler.shell_positions(rng, particle_num, uniform_angle=False)
 
     return {
         "field" : em.Tokamak_Field(utility.dtype(coil_num), utility.dtype(0.05), utility.dtype(2), utility.dtype(6), np.array([0,0,-E_field], utility.dtype), np.array([0,0,-9.8], utility.dtype)),
@@ -34,14 +35,14 @@ def generate_small_value_tokamak_settings(coil_num, E_field, speed, simulation_t
         "simulation_time" : simulation_time,
         "electron_positions" : None,
         "electron_velocities" : None,
-        "deuterium_positions" : [np.array(( x, random.choice([np.sqrt(16-x**2), -np.sqrt(16-x**2)]), random.uniform(-1,1) ), utility.dtype) for x in deut_x], # in m
-        "deuterium_velocities" : [speed * direction for direction in deut_directions], # in m/s
+        "deuterium_positions" : deut_positions, # (particle_num, 3) array in m
+        "deuterium_velocities" : deut_velocities, # (particle_num, 3) array in m/s
     }
 
-def generate_small_value_tokamak_data_linear(settings):
-    # Initialise simulation object
-    sim = Simulation()
-
+def generate_small_value_tokamak_data_linear(settings, workers=None, seed=None, backend="python"):
+    """Runs the sweep with its cases spread over workers processes (see sweep.run_sweep); every case gets its own seed derived from seed, and the root seed is saved to settings.json
+    An optional "recording" entry of settings gives the recording policy of every case (see recording.py), e.g. {"mode" : "none"} keeps only confinement times and summary statistics
+    """
     # Initialise the range of variable values to test
     variable_vals = {
         "coil_num" : [settings["coil_num"] + i * settings["coil_num_step"] for i in range(-10,11)],
@@ -54,21 +55,34 @@ def generate_small_value_tokamak_data_linear(settings):
     if not os.path.isdir(folder_path): # creates folder if doesn't already exist
         os.mkdir(folder_path)
 
-    # Save simulation settings to a json file in directory
+    # Draw a root seed if none given, so that the sweep can be reproduced from settings.json
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    # Save simulation settings (with the root seed) to a json file in directory
     with open(os.path.join(folder_path, "settings.json"), "w") as f:
-        json.dump(settings, f)
+        json.dump(dict(settings, seed=seed), f)
 
     # Initialise base settings
     base_settings = dict({item for item in settings.items() if item[0] in ("coil_num", "E_field", "speed", "simulation_time", "timestep")})
-    
-    # Loop over the settings with variables changed accordingly and output data
+
+    # Create the sweep cases with variables changed accordingly
+    cases = []
     for variable, values in variable_vals.items():
         for value in values:
             current_settings = base_settings.copy()
             current_settings[variable] = value
-            sim.load_settings(generate_small_value_tokamak_settings(**current_settings))
-            sim.generate_data()
-            sim.output_data(folder_path, variable+"_"+str(value))
+            cases.append((variable+"_"+str(value), current_settings))
+
+    # Run the cases and output data
+    sweep.run_sweep(generate_small_value_tokamak_settings, cases, folder_path, workers, seed, backend, {"recording" : settings.get("recording", {"mode" : "all"})})
+
+# Function for generating data samples for tokamak simulation over a declarative parameter space design, e.g. a Latin hypercube covering coupled effects of several variables
+def generate_small_value_tokamak_data_design(settings, space, design="latin_hypercube", samples=64, workers=None, seed=None, backend="python", executor=None):
+    """Runs the distinct cases of a sweep design over the parameter space into the settings' folder (see sweep.run_design_in_folder); rerunning an interrupted sweep with seed None completes it
+    executor optionally runs the cases instead of a pool of workers processes (see sweep.run_sweep), e.g. sweep.Job_Queue_Executor(queue_folder)
+    """
+    return sweep.run_design_in_folder(generate_small_value_tokamak_settings, settings, os.path.join(os.getcwd(), "Small Value Tokamak Data", settings["folder"]), ("coil_num", "E_field", "speed", "simulation_time", "timestep"), space, design, samples, workers, seed, backend, executor)
 
 # Settings for the 2 scenario sets tested
 data_settings = {
@@ -96,4 +110,6 @@ data_settings_stronger_magnetic_field = {
 }
 
 # Command for generating and outputting data samples corresponding to settings in the argument of below
-generate_small_value_tokamak_data_linear(data_settings)
\ No newline at end of file
+# Guarded so that sweep worker processes importing this module don't start the sweep again
+if __name__ == "__main__":
+    generate_small_value_tokamak_data_linear(data_settings)
\ No newline at end of file
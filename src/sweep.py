@@ -0,0 +1,467 @@
+import numpy as np
+from simulation import Simulation
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import itertools
+import inspect
+import pickle
+import utility
+import json
+import time
+import uuid
+import threading
+import sys
+import os
+
+# Runs sets of independent simulation cases (parameter sweeps), optionally spread over a pool of worker processes or a local job queue
+# Sweeps can be given explicitly as a list of cases or declaratively as a parameter space and a design (see design_cases):
+#   the parameter space is a dictionary of variable name (a keyword argument of the settings function, e.g. "temperature", "coil_num", "ion_density", "E_field", "speed") to its specification, either
+#       {"values" : [v1, v2, ...]}: the listed values
+#       {"low" : a, "high" : b, "num" : n, "scale" : "linear" or "log"}: the range from a to b, with n evenly spaced (linearly or logarithmically, linear by default) grid points
+#   the design is one of
+#       "grid": every combination of the grid points of all variables
+#       "one_at_a_time": each variable over its grid points in turn, with the other variables at their base values
+#       "latin_hypercube": samples points, each variable's range (or list of values) split into samples strata with exactly one point in each
+#       "sobol": samples points of a scrambled Sobol low discrepancy sequence (requires scipy; samples is best a power of 2)
+# Coupled effects of several variables are so covered by latin_hypercube and sobol designs without running the full grid
+# Besides a data file per case, every sweep writes a summary table to summary.npy in its output folder: a NumPy structured array with a row per particle per case (see summary_dtype),
+# holding the case's settings and seed and the particle's species, confinement time and escape position, so that sweeps can be analysed without unpickling every trajectory
+# load_summary returns it as a pandas DataFrame
+
+# Scipy is an optional dependency, only needed for Sobol designs
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+# Pandas is an optional dependency, only needed for loading summary tables as DataFrames
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+designs = ("grid", "one_at_a_time", "latin_hypercube", "sobol")
+heartbeat_interval = 10 # s between touches of the files of running job queue jobs
+default_stale_after = 60 # s after the last touch at which running job queue jobs count as abandoned by dead workers
+summary_filename = "summary.npy"
+
+def case_seeds(seed, case_num):
+    """Returns list of case_num independent integer seeds derived from the integer root seed
+    """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(case_num)]
+
+def grid_values(specification):
+    """Returns list of the grid points of a parameter space variable specification
+    """
+    if "values" in specification:
+        return list(specification["values"])
+    if "num" not in specification:
+        raise ValueError("Grid and one_at_a_time designs need the number of grid points num of every range")
+    if specification.get("scale", "linear") == "log":
+        return list(np.geomspace(specification["low"], specification["high"], specification["num"]))
+    return list(np.linspace(specification["low"], specification["high"], specification["num"]))
+
+def scaled_values(specification, unit_samples):
+    """Returns list of the values of a parameter space variable specification at the (N,) unit_samples argument of points in [0, 1)
+    Listed values are picked by stratum, ranges mapped linearly or logarithmically
+    """
+    if "values" in specification:
+        values = list(specification["values"])
+        return [values[i] for i in np.minimum((unit_samples * len(values)).astype(np.intp), len(values) - 1)]
+    low, high = specification["low"], specification["high"]
+    if specification.get("scale", "linear") == "log":
+        return list(low * (high / low)**unit_samples)
+    return list(low + (high - low) * unit_samples)
+
+def latin_hypercube(rng, samples, dimensions):
+    """Returns (samples, dimensions) array of a Latin hypercube sample of the unit cube drawn with the numpy Generator rng
+    """
+    strata = np.stack([rng.permutation(samples) for _ in range(dimensions)], axis=1)
+    return (strata + rng.uniform(size=(samples, dimensions))) / samples
+
+def sobol(rng, samples, dimensions):
+    """Returns (samples, dimensions) array of the first samples points of a scrambled Sobol sequence in the unit cube, scrambled with the numpy Generator rng
+    """
+    if qmc is None:
+        raise ImportError("Sobol designs require scipy")
+    sampler = qmc.Sobol(dimensions, scramble=True, seed=rng)
+    exponent = int(np.log2(samples))
+    return sampler.random_base2(exponent) if 2**exponent == samples else sampler.random(samples)
+
+def plain_value(value):
+    """Returns numpy scalar argument as the equivalent Python number (so case names and settings files stay readable), other arguments unchanged
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+def design_cases(space, design="grid", base_settings=None, samples=None, seed=None):
+    """Returns list of tuples (filename, case_settings) of the distinct cases of a sweep design over a parameter space (see the top of this file)
+    Args:
+        space: dictionary of variable name to specification
+        design: one of designs
+        base_settings: dictionary of keyword arguments common to every case (e.g. simulation_time, timestep), and the base values of the variables of one_at_a_time designs
+        samples: number of points of latin_hypercube and sobol designs
+        seed: seed of the numpy Generator drawing latin_hypercube and sobol points
+    Cases with equal settings are run once, named after the first; filenames join variable_value for the varied variables (so one_at_a_time case names are variable_value, as in the original linear sweeps)
+    """
+    if design not in designs:
+        raise ValueError("Unknown sweep design: " + str(design) + "; expected one of " + ", ".join(designs))
+    base_settings = base_settings or {}
+    variables = list(space)
+    if design == "grid":
+        points = [dict(zip(variables, values)) for values in itertools.product(*(grid_values(space[variable]) for variable in variables))]
+    elif design == "one_at_a_time":
+        points = [{variable : value} for variable in variables for value in grid_values(space[variable])]
+    else:
+        rng = np.random.default_rng(seed)
+        unit_samples = (latin_hypercube if design == "latin_hypercube" else sobol)(rng, samples, len(variables))
+        columns = [scaled_values(space[variable], unit_samples[:, i]) for (i, variable) in enumerate(variables)]
+        points = [dict(zip(variables, values)) for values in zip(*columns)]
+
+    cases = []
+    seen = set()
+    for point in points:
+        point = {variable : plain_value(value) for (variable, value) in point.items()}
+        case_settings = dict(base_settings, **point)
+        key = tuple(sorted(case_settings.items()))
+        if key in seen:
+            continue
+        seen.add(key)
+        cases.append(("__".join(variable + "_" + str(value) for (variable, value) in point.items()), case_settings))
+    return cases
+
+def process_context():
+    """Returns the multiprocessing context worker process pools are started with: forkserver where available, else spawn
+    Worker processes are never forked from this process, as forking a process in which the compiled kernel's threads have run (see compiled.py) can leave it hanging at exit
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def output_path(folder_path, filename):
+    """Returns path of the data file of a sweep case
+    """
+    return os.path.join(folder_path, filename + ".pkl")
+
+def run_case(settings_function, case_settings, seed, folder_path, filename, backend="python", extra_settings=None):
+    """Runs a single sweep case in its own Simulation object and outputs its data to folder_path/filename.pkl
+    Args:
+        settings_function: module level function returning simulation settings dictionary given the keyword arguments in case_settings and a numpy Generator as keyword argument rng (see sampler.py)
+        seed: integer seed of the case's numpy Generator
+        backend: simulation backend passed to Simulation.load_settings
+        extra_settings: optional dictionary of additional simulation settings (e.g. "recording") added to those returned by settings_function
+    Returns tuple (filename, confinement_times, particle_results) with particle_results as returned by particle_results
+    """
+    simulation_settings = settings_function(**case_settings, rng=np.random.default_rng(seed))
+    simulation_settings.update(extra_settings or {})
+    sim = Simulation()
+    sim.load_settings(simulation_settings, backend)
+    sim.generate_data()
+    sim.output_data(absolute_path=output_path(folder_path, filename))
+    return (filename, sim.data["confinement_times"], particle_results(sim.data))
+
+def particle_results(data):
+    """Returns dictionary of the per particle results of a simulation data dictionary that go into summary tables:
+    "species": (N,) array of particle type labels, "confinement_time": (N,) array of confinement times (NaN where the particle did not escape),
+    "escape_position": (N, 3) array of where the particles crossed the field region boundary and "escape_face": (N,) array of the faces crossed (NaN and "" where unknown or not escaped)
+    """
+    labels = data["visualisation_settings"]["path_labels"]
+    species = np.array([labels[ind] for ind in data["visualisation_settings"]["sets_color_ind"]], "U16")
+    confinement_times = np.array([np.nan if time is False else time for time in data["confinement_times"]], np.float64)
+    escape_positions = np.full((len(species), 3), np.nan)
+    escape_faces = np.zeros(len(species), "U8")
+    events = data.get("wall_events") # missing from data files of older runs
+    if events is not None and len(events):
+        escape_positions[events["id"]] = events["position"]
+        escape_faces[events["id"]] = events["face"]
+    return {"species" : species, "confinement_time" : confinement_times, "escape_position" : escape_positions, "escape_face" : escape_faces}
+
+def swept_variables(filename, case_settings):
+    """Returns list of the names of the variables a case varies, those whose variable_value appears in its filename (as in the filenames of design_cases and the linear sweeps of the data generators)
+    """
+    parts = filename.split("__")
+    return [name for (name, value) in case_settings.items() if name + "_" + str(value) in parts]
+
+def summary_dtype(setting_names, case_length=128, variable_length=64):
+    """Returns structured dtype of summary tables with a float column for each of the case settings in setting_names, and columns:
+        "case": filename of the case; "variable": name of the variable the case varies (names joined by "__" if it varies several); "value": its value (NaN unless the case varies one variable)
+        "seed": seed of the case's numpy Generator; "particle": index of the particle in the case; "species": particle type label, e.g. "Deuterium" or "Electron"
+        "escaped": whether the particle escaped; "confinement_time": its confinement time in s (NaN if it did not escape)
+        "escape_x", "escape_y", "escape_z": position in m where it crossed the field region boundary; "escape_face": face crossed, one of em.region_faces (NaN and "" if it did not escape)
+    """
+    return np.dtype(
+        [("case", "U" + str(case_length)), ("variable", "U" + str(variable_length)), ("value", np.float64), ("seed", np.int64)]
+        + [(name, np.float64) for name in setting_names]
+        + [("particle", np.int64), ("species", "U16"), ("escaped", np.bool_), ("confinement_time", np.float64), ("escape_x", np.float64), ("escape_y", np.float64), ("escape_z", np.float64), ("escape_face", "U8")]
+    )
+
+def summary_table(cases, seeds, case_results):
+    """Returns summary table (structured array of dtype summary_dtype) with a row per particle per case
+    Args:
+        cases: list of tuples (filename, case_settings) as run_sweep
+        seeds: list of the integer seeds of the cases
+        case_results: list of the cases' particle_results dictionaries
+    Settings with numeric values in every case get a column each
+    """
+    setting_names = [name for name in cases[0][1] if all(isinstance(case_settings.get(name), (int, float, np.number)) and not isinstance(case_settings.get(name), bool) for (_, case_settings) in cases)] if cases else []
+    variables = [swept_variables(filename, case_settings) for (filename, case_settings) in cases]
+    dtype = summary_dtype(setting_names, max([len(filename) for (filename, _) in cases] + [1]), max([len("__".join(names)) for names in variables] + [1]))
+    tables = []
+    for ((filename, case_settings), seed, results, names) in zip(cases, seeds, case_results, variables):
+        table = np.zeros(len(results["species"]), dtype)
+        table["case"] = filename
+        table["variable"] = "__".join(names)
+        table["value"] = case_settings[names[0]] if len(names) == 1 and isinstance(case_settings[names[0]], (int, float, np.number)) else np.nan
+        table["seed"] = seed
+        for name in setting_names:
+            table[name] = case_settings[name]
+        table["particle"] = np.arange(len(table))
+        table["species"] = results["species"]
+        table["escaped"] = ~np.isnan(results["confinement_time"])
+        table["confinement_time"] = results["confinement_time"]
+        table["escape_x"], table["escape_y"], table["escape_z"] = results["escape_position"].T
+        table["escape_face"] = results["escape_face"]
+        tables.append(table)
+    return np.concatenate(tables) if tables else np.zeros(0, dtype)
+
+def load_summary_table(folder_path):
+    """Returns the summary table (structured array) written by run_sweep to folder_path, or None if there is none
+    """
+    path = os.path.join(folder_path, summary_filename)
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+def load_summary(folder_path):
+    """Returns the summary table written by run_sweep to folder_path as a pandas DataFrame, with a row per particle per case (see summary_dtype)
+    """
+    if pandas is None:
+        raise ImportError("Loading summary tables as DataFrames requires pandas; use load_summary_table for the structured array")
+    table = load_summary_table(folder_path)
+    if table is None:
+        raise FileNotFoundError("No sweep summary table in " + str(folder_path))
+    return pandas.DataFrame({name : table[name] for name in table.dtype.names})
+
+class Serial_Executor:
+    """
+    Executor running every call one after another in this process
+    """
+    def map(self, function, *iterables):
+        return list(map(function, *iterables))
+
+class Job_Queue_Executor:
+    """
+    Executor running calls through a job queue of files in queue_folder, so that any number of worker processes, started with
+        python sweep.py <queue_folder> [stale_after]
+    (on this or other machines sharing the folder) work through the jobs alongside this process; the queue can be added to by several sweeps at once
+    Jobs are claimed by atomically renaming their files, so every job runs once unless its worker dies:
+    workers touch the files of the jobs they run every heartbeat_interval s, and jobs whose files weren't touched for stale_after s are moved back to the pending jobs and run again
+    """
+    def __init__(self, queue_folder, poll_interval=1, stale_after=default_stale_after):
+        self.queue_folder = queue_folder
+        self.poll_interval = poll_interval # s between checks for the results of jobs run by other workers
+        self.stale_after = stale_after
+
+    def map(self, function, *iterables, timeout=None):
+        """Queues a job per call of function, works through the queue and returns the list of results in the order of the calls once every job is done
+        Reraises the exception of the first job that failed, and raises TimeoutError if, while waiting for jobs run by other workers, the jobs aren't all done timeout s after the call (never by default)
+        """
+        start = time.monotonic()
+        for folder in ("pending", "running", "done"):
+            os.makedirs(os.path.join(self.queue_folder, folder), exist_ok=True)
+        prefix = uuid.uuid4().hex
+        names = []
+        for (i, arguments) in enumerate(zip(*iterables)):
+            names.append("{}_{:08d}.pkl".format(prefix, i))
+            write_file(os.path.join(self.queue_folder, "pending", names[-1]), (function, arguments))
+
+        work(self.queue_folder, self.stale_after)
+        results = []
+        for name in names:
+            result_path = os.path.join(self.queue_folder, "done", name)
+            while not os.path.exists(result_path): # waits for jobs claimed by other workers, running jobs requeued from dead workers
+                if timeout is not None and time.monotonic() - start >= timeout:
+                    raise TimeoutError("Job queue " + str(self.queue_folder) + " didn't finish the jobs within " + str(timeout) + " s")
+                if requeue_stale(self.queue_folder, self.stale_after):
+                    work(self.queue_folder, self.stale_after)
+                time.sleep(self.poll_interval)
+            with open(result_path, "rb") as f:
+                results.append(pickle.load(f))
+            os.remove(result_path)
+        for (succeeded, value) in results:
+            if not succeeded:
+                raise value
+        return [value for (_, value) in results]
+
+def write_file(path, value):
+    """Pickles value to path atomically, so other processes never see partially written files
+    """
+    with utility.atomic_write(path) as f:
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+
+def requeue_stale(queue_folder, stale_after=default_stale_after):
+    """Moves the running jobs of the Job_Queue_Executor queue in queue_folder whose files weren't touched for stale_after s (their workers died) back to the pending jobs
+    Returns the number of jobs requeued
+    """
+    running_folder = os.path.join(queue_folder, "running")
+    requeued = 0
+    for running_name in os.listdir(running_folder):
+        if not running_name.endswith(".pkl"):
+            continue
+        running_path = os.path.join(running_folder, running_name)
+        name = running_name.split("_", 1)[1] # strips the worker's process id
+        try:
+            if time.time() - os.path.getmtime(running_path) < stale_after:
+                continue
+            if os.path.exists(os.path.join(queue_folder, "done", name)): # the worker died after writing the result
+                os.remove(running_path)
+            else:
+                os.rename(running_path, os.path.join(queue_folder, "pending", name)) # fails if another process requeued it first
+                requeued += 1
+        except OSError:
+            continue
+    return requeued
+
+def heartbeat(path, interval, stop):
+    """Touches the file at path every interval s until the threading.Event stop is set, marking the job as still running
+    """
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError: # requeued in the meantime
+            return
+
+def work(queue_folder, stale_after=default_stale_after):
+    """Runs the jobs of the Job_Queue_Executor queue in queue_folder until none are pending, first requeuing jobs of dead workers (see requeue_stale)
+    """
+    pending_folder = os.path.join(queue_folder, "pending")
+    while True:
+        requeue_stale(queue_folder, stale_after)
+        names = sorted(name for name in os.listdir(pending_folder) if name.endswith(".pkl"))
+        if not names:
+            return
+        for name in names:
+            running_path = os.path.join(queue_folder, "running", str(os.getpid()) + "_" + name)
+            try:
+                os.rename(os.path.join(pending_folder, name), running_path) # claims the job, failing if another worker claimed it first
+                os.utime(running_path) # renaming keeps the time the job was queued
+            except OSError:
+                continue
+            with open(running_path, "rb") as f:
+                function, arguments = pickle.load(f)
+            stop = threading.Event()
+            beating = threading.Thread(target=heartbeat, args=(running_path, min(heartbeat_interval, stale_after / 3), stop), daemon=True)
+            beating.start()
+            try:
+                result = (True, function(*arguments))
+            except Exception as exception:
+                result = (False, exception)
+            finally:
+                stop.set()
+                beating.join()
+            write_file(os.path.join(queue_folder, "done", name), result)
+            try:
+                os.remove(running_path)
+            except FileNotFoundError: # requeued while this worker was stalled; the job's result is written all the same
+                pass
+
+def run_sweep(settings_function, cases, folder_path, workers=None, seed=None, backend="python", extra_settings=None, executor=None, skip_existing=False):
+    """Runs all sweep cases, each with its own independently seeded numpy Generator, and outputs one data file per case
+    Args:
+        settings_function: module level function returning simulation settings dictionary given the keyword arguments of a case and a numpy Generator as keyword argument rng
+        cases: list of tuples (filename, case_settings) with case_settings a dictionary of keyword arguments for settings_function
+        folder_path: folder to output data files to
+        workers: number of worker processes when no executor is given; 1 runs the cases one after another in this process, None uses one process per CPU
+        seed: integer root seed from which every case's seed is derived; if None a random one is drawn
+        backend: simulation backend passed to Simulation.load_settings
+        extra_settings: optional dictionary of additional simulation settings applied to every case (see run_case)
+        executor: optional object whose map method runs the cases like the built in map (e.g. Serial_Executor, Job_Queue_Executor or a concurrent.futures executor)
+        skip_existing: if True cases whose data file already exists are not run again (their seeds are unchanged, so rerunning an interrupted sweep with the same root seed completes it)
+    Returns list of (filename, confinement_times) tuples in the same order as cases, with confinement_times None for skipped cases
+    The summary table of all cases, including skipped ones, is written to folder_path/summary.npy (see summary_table)
+    Note scripts calling this with more than one worker should guard their top level code with if __name__ == "__main__" as worker processes may import them
+    """
+    parameters = inspect.signature(settings_function).parameters
+    for (filename, case_settings) in cases:
+        unknown = [name for name in case_settings if name not in parameters]
+        if unknown:
+            raise ValueError("Sweep case " + filename + " sets " + ", ".join(unknown) + ", which are not arguments of " + settings_function.__name__)
+
+    seeds = case_seeds(seed, len(cases))
+    run = [i for (i, (filename, _)) in enumerate(cases) if not (skip_existing and os.path.exists(output_path(folder_path, filename)))]
+    arguments = (
+        [settings_function] * len(run),
+        [cases[i][1] for i in run],
+        [seeds[i] for i in run],
+        [folder_path] * len(run),
+        [cases[i][0] for i in run],
+        [backend] * len(run),
+        [extra_settings] * len(run),
+    )
+    if executor is not None:
+        run_results = list(executor.map(run_case, *arguments))
+    elif workers == 1:
+        run_results = Serial_Executor().map(run_case, *arguments)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as pool:
+            run_results = list(pool.map(run_case, *arguments)) # map returns results in the order of cases regardless of completion order
+    results = [(filename, None) for (filename, _) in cases]
+    case_results = [None] * len(cases)
+    for (i, (filename, confinement_times, particle_result)) in zip(run, run_results):
+        results[i] = (filename, confinement_times)
+        case_results[i] = particle_result
+
+    # Writes the summary table, taking the results of skipped cases from the previous summary table, or their data files if they are missing from it
+    previous = load_summary_table(folder_path) if len(run) < len(cases) else None
+    for (i, (filename, _)) in enumerate(cases):
+        if case_results[i] is None:
+            rows = previous[previous["case"] == filename] if previous is not None else []
+            if len(rows):
+                case_results[i] = {"species" : rows["species"], "confinement_time" : rows["confinement_time"], "escape_position" : np.stack((rows["escape_x"], rows["escape_y"], rows["escape_z"]), axis=1), "escape_face" : rows["escape_face"]}
+            else:
+                sim = Simulation()
+                sim.load_data(absolute_path=output_path(folder_path, filename))
+                case_results[i] = particle_results(sim.data)
+    path = os.path.join(folder_path, summary_filename)
+    with utility.atomic_write(path) as f: # replaces any previous summary table only once fully written
+        np.save(f, summary_table(cases, seeds, case_results))
+    return results
+
+def run_design(settings_function, space, folder_path, design="grid", base_settings=None, samples=None, workers=None, seed=None, backend="python", extra_settings=None, executor=None, skip_existing=True):
+    """Runs the distinct cases of a sweep design over a parameter space (see design_cases), skipping cases already output by default
+    The design's points and every case's seed are derived from the root seed, so rerunning with the same seed continues an interrupted sweep; other arguments as run_sweep
+    Returns list of (filename, confinement_times) tuples as run_sweep
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    design_seed, cases_seed = np.random.SeedSequence(seed).spawn(2)
+    cases = design_cases(space, design, base_settings, samples, design_seed)
+    return run_sweep(settings_function, cases, folder_path, workers, int(cases_seed.generate_state(1)[0]), backend, extra_settings, executor, skip_existing)
+
+def run_design_in_folder(settings_function, settings, folder_path, base_names, space, design="latin_hypercube", samples=64, workers=None, seed=None, backend="python", executor=None):
+    """Runs the distinct cases of a sweep design over the parameter space (see design_cases) into folder_path, as the data generators do, with the variables not in space at their values in settings
+    Args:
+        settings: data generation settings dictionary, saved to settings.json in folder_path along with the design and root seed; its optional "recording" entry gives the recording policy of every case ({"mode" : "all"} by default)
+        base_names: names of the entries of settings which are keyword arguments of settings_function, giving the base values of the variables
+    Cases whose data file already exists are skipped; if seed is None the root seed saved to settings.json by an earlier run is reused, so rerunning an interrupted sweep completes it; other arguments as run_design
+    """
+    # Setup file directory
+    if not os.path.isdir(folder_path): # creates folder if doesn't already exist
+        os.mkdir(folder_path)
+
+    # Reuse the root seed of an earlier run of the sweep, or draw one if none given
+    settings_path = os.path.join(folder_path, "settings.json")
+    if seed is None and os.path.exists(settings_path):
+        with open(settings_path, "r") as f:
+            seed = json.load(f).get("seed")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    # Save simulation settings (with the design and root seed) to a json file in directory
+    with open(settings_path, "w") as f:
+        json.dump(dict(settings, seed=seed, space=space, design=design, samples=samples), f)
+
+    base_settings = {name : settings[name] for name in base_names if name in settings}
+    return run_design(settings_function, space, folder_path, design, base_settings, samples, workers, seed, backend, {"recording" : settings.get("recording", {"mode" : "all"})}, executor)
+
+if __name__ == "__main__":
+    work(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else default_stale_after)
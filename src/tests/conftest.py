@@ -0,0 +1,5 @@
+import sys
+import os
+
+# The modules of src import each other by name, so src is put on the import path whichever folder pytest is run from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import coulomb
+import utility
+
+# Checks of the Barnes-Hut Coulomb field against direct summation over a Gaussian cloud of alternating charges, as in coulomb_benchmark.py
+
+def charged_cloud(particle_num=500, seed=0):
+    """Returns tuple (positions, charges, ids) of a Gaussian cloud of particles of alternating charge +e and -e
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.normal(size=(particle_num, 3))
+    charges = np.where(np.arange(particle_num) % 2 == 0, utility.elementary_charge, -utility.elementary_charge)
+    return (positions, charges, np.arange(particle_num))
+
+def relative_rms_error(E, exact_E):
+    return np.sqrt(((E - exact_E)**2).sum() / (exact_E**2).sum())
+
+@pytest.mark.parametrize("softening", [0, 0.01])
+def test_tree_converges_to_direct_summation(softening):
+    positions, charges, ids = charged_cloud()
+    exact_E = coulomb.direct_field_E(positions, positions, charges, ids, softening)
+    tree = coulomb.Coulomb_Tree(positions, charges)
+    np.testing.assert_allclose(tree.field_E(positions, ids, 0, softening), exact_E, rtol=1e-9, atol=1e-9 * np.abs(exact_E).max()) # theta 0 opens every node
+    errors = [relative_rms_error(tree.field_E(positions, ids, theta, softening), exact_E) for theta in (0.8, 0.5, 0.3)]
+    assert errors[1] < 0.01
+    assert errors[0] > errors[1] > errors[2]
+
+def test_direct_summation_excludes_self_field():
+    positions, charges, ids = charged_cloud(particle_num=2)
+    E = coulomb.direct_field_E(positions, positions, charges, ids)
+    separation = positions[0] - positions[1]
+    np.testing.assert_allclose(E[0], coulomb.coulomb_constant * charges[1] * separation / np.linalg.norm(separation)**3, rtol=1e-12)
+    np.testing.assert_allclose(E[1], -E[0] * charges[0] / charges[1], rtol=1e-12)
@@ -0,0 +1,34 @@
+import numpy as np
+import ensemble
+
+# Checks of the streaming statistics of ensemble runs against the same statistics computed over all values at once
+
+def test_running_moments_match_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.exponential(3, 1000) + 1e6 # a large mean, where summing squares would lose the variance to rounding
+    moments = ensemble.Running_Moments()
+    for batch in np.split(values, [0, 1, 7, 300, 301, 1000]): # including empty and single value batches
+        moments.add(batch)
+    assert moments.count == len(values)
+    np.testing.assert_allclose(moments.mean, values.mean(), rtol=1e-14)
+    np.testing.assert_allclose(moments.variance(), values.var(ddof=1), rtol=1e-9)
+    low, high = moments.interval(0.95)
+    np.testing.assert_allclose((high - low) / 2, 1.959964 * values.std(ddof=1) / np.sqrt(len(values)), rtol=1e-6)
+
+def test_running_moments_need_two_values():
+    moments = ensemble.Running_Moments()
+    moments.add([2.0])
+    assert moments.mean == 2.0 and np.isnan(moments.variance()) and np.isnan(moments.interval()[0])
+
+def test_confinement_statistics_censor_at_simulation_time():
+    statistics = ensemble.Confinement_Statistics(10, survival_bins=5)
+    statistics.add([1.0, False, 3.0])
+    statistics.add([False, 9.0, 5.0, False])
+    assert statistics.particle_num == 7 and statistics.escaped_num == 4
+    np.testing.assert_allclose(statistics.restricted_times.mean, (1 + 3 + 9 + 5 + 3 * 10) / 7)
+    np.testing.assert_allclose(statistics.escape_times.mean, (1 + 3 + 9 + 5) / 4)
+    np.testing.assert_allclose(statistics.escape_times.variance(), np.var([1, 3, 9, 5], ddof=1))
+    times, survival, low, high = statistics.survival_curve()
+    np.testing.assert_array_equal(times, [0, 2, 4, 6, 8, 10])
+    np.testing.assert_allclose(survival, np.array([7, 6, 5, 4, 4, 3]) / 7)
+    assert np.all(low <= survival) and np.all(survival <= high)
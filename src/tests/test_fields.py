@@ -0,0 +1,59 @@
+import numpy as np
+import em
+
+# Checks of the field types against closed forms: the discrete coil field against the ideal toroidal field, and gridded fields against the fields they sample and their cached grids, and boundary crossings against segments of known faces
+
+def ring_positions(radii, angle, z=0, angle_num=5):
+    """Returns (N, 3) array of positions at the given radii and z over angle_num angles from 0 to angle about the z axis
+    """
+    R, phi = np.meshgrid(radii, np.linspace(0, angle, angle_num))
+    return np.stack((R.ravel() * np.cos(phi.ravel()), R.ravel() * np.sin(phi.ravel()), np.full(R.size, z)), axis=1)
+
+def test_coil_field_tends_to_ideal_field_away_from_coils():
+    coils = em.Coil_Field(16, 1e6, 2, 6)
+    ideal = em.Toroidal_B_Field(16, 1e6, 2, 6)
+    positions = ring_positions(np.linspace(3, 5, 9), 2 * np.pi / 16)
+    B = coils.field_B_batch(positions)
+    ideal_B = ideal.field_B_batch(positions)
+    np.testing.assert_array_less(np.linalg.norm(B - ideal_B, axis=1), 0.02 * np.linalg.norm(ideal_B, axis=1))
+
+def test_coil_field_is_finite_at_the_walls_and_has_a_fringe():
+    coils = em.Coil_Field(16, 1e6, 2, 6)
+    ideal = em.Toroidal_B_Field(16, 1e6, 2, 6)
+    near_walls = np.array(((2.01, 0, 0), (5.99, 0, 0), (4, 0, 1.99), (4, 0, -1.99)))
+    strongest_ideal_B = ideal.strength_factor / ideal.inner_radius
+    assert np.all(np.linalg.norm(coils.field_B_batch(near_walls), axis=1) < 1.5 * strongest_ideal_B)
+    outside = np.array(((6.2, 0, 0), (1.8, 0, 0), (4, 0, 2.2)))
+    assert not coils.contains(outside).any()
+    assert np.all(np.linalg.norm(coils.field_B_batch(outside), axis=1) > 0)
+
+def tokamak_field():
+    return em.Tokamak_Field(16, 1e6, 2, 6, np.array((0, 0, -1e-3)), np.array((0, 0, -9.8)))
+
+def test_gridded_field_interpolates_its_source(tmp_path):
+    source = tokamak_field()
+    gridded = em.Gridded_Field(source, (1.9, -2.1), (6.1, 2.1), (211, 11), axisymmetric=True, cache_folder=str(tmp_path))
+    positions = ring_positions(np.linspace(2.5, 5.5, 7), 2 * np.pi, z=0.3, angle_num=7)
+    for name in ("field_B", "field_E", "field_G"):
+        np.testing.assert_allclose(getattr(gridded, name + "_batch")(positions), getattr(source, name + "_batch")(positions), rtol=1e-3, atol=1e-12)
+
+def test_gridded_field_cache_round_trip(tmp_path, monkeypatch):
+    arguments = (tokamak_field(), (1.9, -2.1), (6.1, 2.1), (43, 11))
+    sampled = em.Gridded_Field(*arguments, axisymmetric=True, cache_folder=str(tmp_path))
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    def not_sampled(self):
+        raise AssertionError("the grid was sampled instead of loaded from the cache")
+    monkeypatch.setattr(em.Gridded_Field, "sample", not_sampled)
+    loaded = em.Gridded_Field(*arguments, axisymmetric=True, cache_folder=str(tmp_path))
+    assert loaded.field_names == sampled.field_names and all(type(name) is str for name in loaded.field_names)
+    np.testing.assert_array_equal(loaded.values, sampled.values)
+    np.testing.assert_array_equal(loaded.zero_B_nodes, sampled.zero_B_nodes)
+
+def test_boundary_crossings_find_each_face():
+    field = tokamak_field()
+    starts = np.full((5, 3), (4.0, 0, 0))
+    ends = np.array(((1, 0, 0), (7, 0, 0), (4, 0, 3), (4, 0, -3), (-7, 0, 0))) # the last would cross the outer cylinder too, beyond the inner one
+    fractions, faces = field.boundary_crossings(starts, ends)
+    assert [em.region_faces[face] for face in faces] == ["inner", "outer", "top", "bottom", "inner"]
+    np.testing.assert_allclose(fractions, (2 / 3, 2 / 3, 2 / 3, 2 / 3, 2 / 11), rtol=1e-12)
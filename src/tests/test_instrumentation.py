@@ -0,0 +1,68 @@
+import pytest
+import json
+import compiled
+import instrumentation
+from simulation import Simulation
+import small_value_deuterium_tokamak_data_generation as small_value
+
+# Checks of the run instrumentation: phase timing, including nested phases, and the reports sent over a run
+
+class Clock:
+    """
+    Stand in for time.perf_counter advancing one second per call
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+def test_nested_phases_count_time_once(monkeypatch):
+    monkeypatch.setattr(instrumentation.time, "perf_counter", Clock())
+    timer = instrumentation.Phase_Timer()
+    with timer.phase("integrator"): # enters at 1
+        with timer.phase("force"): # pauses integrator at 2
+            with timer.phase("field"): # pauses force at 3
+                pass # field exits at 4
+            with timer.phase("field"): # enters at 5
+                pass # exits at 6
+        with timer.phase("escape"): # force exits at 7, escape enters at 8
+            pass # exits at 9
+    # integrator exits at 10
+    summary = timer.summary()
+    assert {name : phase["calls"] for (name, phase) in summary.items()} == {"field" : 2, "force" : 1, "integrator" : 1, "escape" : 1, "recording" : 0}
+    assert {name : phase["seconds"] for (name, phase) in summary.items()} == {"field" : 2, "force" : 3, "integrator" : 3, "escape" : 1, "recording" : 0}
+    assert not timer.stack
+
+def run(backend, instrumentation_settings):
+    """Returns tuple (data, reports) of the data dictionary and reports of a short small value tokamak run with the given backend and instrumentation settings
+    """
+    settings = small_value.generate_small_value_tokamak_settings(2000, 1e-7, 3, 5, 0.01, particle_num=4, rng=3)
+    settings["instrumentation"] = instrumentation_settings
+    reports = []
+    sim = Simulation()
+    sim.load_settings(settings, backend, reports.append)
+    sim.generate_data()
+    return (sim.data, reports)
+
+@pytest.mark.parametrize("backend", ["python", "numba"])
+def test_profiled_run_times_its_phases(backend):
+    if backend == "numba" and not compiled.available:
+        pytest.skip("numba is not installed")
+    data, reports = run(backend, {"profile" : True})
+    phases = data["instrumentation"]["phases"]
+    assert set(phases) == set(instrumentation.phases)
+    timed = instrumentation.phases if backend == "python" else ("integrator", "recording") # the compiled kernel fuses the other phases into "integrator"
+    for name in instrumentation.phases:
+        assert (phases[name]["calls"] > 0) == (name in timed)
+        assert phases[name]["seconds"] >= 0 and (phases[name]["seconds"] > 0) <= (name in timed)
+    assert sum(phase["seconds"] for phase in phases.values()) <= data["instrumentation"]["elapsed_seconds"]
+    assert [report["percent"] for report in reports if report["event"] == "milestone"] == list(range(0, 100, 100 // instrumentation.milestone_num))
+    assert reports[-1] is data["instrumentation"] and reports[-1]["event"] == "done" and reports[-1]["step"] == reports[-1]["steps"]
+
+def test_unprofiled_run_has_no_phases(tmp_path):
+    log_path = tmp_path / "log.jsonl"
+    data, reports = run("python", {"log_path" : str(log_path)})
+    assert data["instrumentation"]["phases"] is None
+    assert [json.loads(line)["event"] for line in log_path.read_text().splitlines()] == [report["event"] for report in reports]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import em
+import utility
+import guiding_centre_validation
+
+# Checks of the integrators of em.Particle_Batch against properties of the exact motion
+
+def gyrating_batch(integrator):
+    """Returns tuple (particle_batch, gyro_period) of two deuterium ions gyrating in a uniform B field, one also moving along B
+    """
+    B = 1e-3
+    field = em.Uniform_B_Field(np.array((0, 0, B), utility.dtype))
+    masses = [utility.deuterium_mass] * 2
+    charges = [utility.elementary_charge] * 2
+    particle_batch = em.Particle_Batch(masses, charges, [[0, 0, 0], [1, 0, 0]], [[1e3, 0, 10], [0, 2e3, 0]], field, integrator)
+    return (particle_batch, 2 * np.pi * utility.deuterium_mass / (utility.elementary_charge * B))
+
+def test_boris_conserves_energy_over_many_gyro_orbits():
+    particle_batch, period = gyrating_batch("boris")
+    energies = (particle_batch.velocities**2).sum(axis=1)
+    for _ in range(2000): # 250 gyro-orbits at 8 steps per orbit
+        particle_batch.update(period / 8)
+    np.testing.assert_allclose((particle_batch.velocities**2).sum(axis=1), energies, rtol=1e-12)
+
+    # RK4 with the same timestep loses most of the energy, which is what the Boris pusher is for
+    particle_batch, period = gyrating_batch("rk4")
+    for _ in range(2000):
+        particle_batch.update(period / 8)
+    assert np.all((particle_batch.velocities**2).sum(axis=1) < 0.5 * energies)
+
+@pytest.mark.parametrize("name", ["uniform_EB", "uniform_GB"])
+def test_guiding_centre_drift_matches_full_orbit(name):
+    settings = guiding_centre_validation.drift_cases[name]
+    relative_distances, _ = guiding_centre_validation.validate(name, settings)
+    assert np.all(relative_distances < 1e-9) # the drifts are exact in uniform fields
+
+@pytest.mark.parametrize("name", ["toroidal_B", "tokamak"])
+def test_guiding_centre_escape_matches_full_orbit(name):
+    settings = guiding_centre_validation.drift_cases[name]
+    _, full_orbit_escapes = guiding_centre_validation.run(settings, "rk4", settings["timestep"])
+    _, guiding_centre_escapes = guiding_centre_validation.run(settings, "guiding_centre", settings["timestep"] * 20)
+    assert not np.isnan(full_orbit_escapes).any() and not np.isnan(guiding_centre_escapes).any()
+    np.testing.assert_allclose(guiding_centre_escapes, full_orbit_escapes, rtol=0.1) # escape of the gyro-orbit leads that of the guiding centre (see guiding_centre_validation.py)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import sampler
+import utility
+
+# Checks that the samplers are reproducible from their seed and draw from the distributions they document
+
+samplers = {
+    "shell" : lambda rng, n: sampler.shell_positions(rng, n),
+    "shell_original" : lambda rng, n: sampler.shell_positions(rng, n, uniform_angle=False),
+    "torus" : lambda rng, n: sampler.torus_positions(rng, n),
+    "maxwellian" : lambda rng, n: sampler.maxwellian_velocities(rng, n, utility.deuterium_mass, 1e8),
+    "direction" : lambda rng, n: sampler.direction_velocities(rng, n, 3),
+}
+
+@pytest.mark.parametrize("name", samplers)
+def test_samples_are_reproduced_from_seed(name):
+    draw = samplers[name]
+    samples = draw(sampler.generator(5), 100)
+    assert samples.shape == (100, 3) and samples.dtype == utility.dtype
+    np.testing.assert_array_equal(draw(sampler.generator(5), 100), samples)
+    np.testing.assert_array_equal(draw(sampler.generator(np.random.SeedSequence(5)), 100), samples)
+    assert not np.array_equal(draw(sampler.generator(6), 100), samples)
+    rng = sampler.generator(5)
+    assert sampler.generator(rng) is rng
+
+def test_maxwellian_speeds_match_temperature():
+    temperature = 1e8
+    velocities = sampler.maxwellian_velocities(sampler.generator(0), 10**5, utility.deuterium_mass, temperature)
+    thermal_energy = sampler.boltzmann_constant() * temperature
+    np.testing.assert_allclose(velocities.mean(axis=0), 0, atol=0.02 * np.sqrt(thermal_energy / utility.deuterium_mass))
+    np.testing.assert_allclose(0.5 * utility.deuterium_mass * (velocities**2).sum(axis=1).mean(), 1.5 * thermal_energy, rtol=0.01)
+    mean_speed = np.sqrt(8 * thermal_energy / (np.pi * utility.deuterium_mass))
+    np.testing.assert_allclose(np.linalg.norm(velocities, axis=1).mean(), mean_speed, rtol=0.01)
+
+def test_positions_fill_their_region():
+    rng = sampler.generator(0)
+    shell = sampler.shell_positions(rng, 10**4, radius=4, half_height=1)
+    np.testing.assert_allclose(np.hypot(shell[:, 0], shell[:, 1]), 4, rtol=1e-12)
+    assert np.all(np.abs(shell[:, 2]) <= 1)
+    np.testing.assert_allclose(shell[:, :2].mean(axis=0), 0, atol=0.1)
+
+    torus = sampler.torus_positions(rng, 10**5, inner_radius=2, outer_radius=6, z_bot=-2, z_top=2)
+    radii = np.hypot(torus[:, 0], torus[:, 1])
+    assert np.all((radii >= 2) & (radii <= 6)) and np.all(np.abs(torus[:, 2]) <= 2)
+    np.testing.assert_allclose(np.mean(radii < 4), (4**2 - 2**2) / (6**2 - 2**2), atol=0.01) # uniform in volume, not in radius
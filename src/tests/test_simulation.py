@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+import em
+import pic
+import cache
+import sweep
+import compiled
+import instrumentation
+import recording
+import utility
+import visualisation
+from simulation import Simulation
+import small_value_deuterium_tokamak_data_generation as small_value
+
+# Regression checks of the guarantees the engine makes: the particle batch and compiled kernels reproduce the per particle RK4 loop and the Python RK45 integrator, resumed runs are identical to uninterrupted ones,
+# wall events log the face and energy of every escape, the result cache only hits for identical settings, and sweeps give the same results however their cases are run
+# Runs use small value tokamaks of a few deuterium ions over 2000 steps, in which some ions escape confinement
+
+def tokamak_settings(seed=3, particle_num=6, simulation_time=20):
+    """Returns settings of a small value tokamak run in which some of the deuterium ions escape confinement
+    """
+    return small_value.generate_small_value_tokamak_settings(2000, 1e-7, 3, simulation_time, 0.01, particle_num=particle_num, rng=seed)
+
+def run(settings, backend="python", report=instrumentation.quiet):
+    """Returns data dictionary of a run with the given settings and backend
+    """
+    sim = Simulation()
+    sim.load_settings(settings, backend, report)
+    sim.generate_data()
+    return sim.data
+
+def assert_same_run(data, other):
+    """Asserts two data dictionaries hold the same trajectories, confinement times and wall events
+    """
+    np.testing.assert_array_equal(data["data"], other["data"])
+    assert data["confinement_times"] == other["confinement_times"]
+    np.testing.assert_array_equal(data["recorded_steps"], other["recorded_steps"])
+    np.testing.assert_array_equal(data["wall_events"], other["wall_events"])
+
+def test_escapes_happen():
+    confinement_times = run(tokamak_settings())["confinement_times"]
+    assert any(time is not False for time in confinement_times) and not all(time is not False for time in confinement_times)
+
+def test_batch_matches_particle_loop():
+    settings = tokamak_settings()
+    field = settings["field"]
+    particles = [em.Deuterium_Ion(position=position.copy(), velocity=velocity.copy(), field=field) for (position, velocity) in zip(settings["deuterium_positions"], settings["deuterium_velocities"])]
+    batch = em.Particle_Batch.from_particles(particles, field)
+    steps = round(settings["simulation_time"] / settings["timestep"])
+    escape_steps = [None] * len(particles)
+    batch_escape_steps = [None] * len(particles)
+    for step in range(steps):
+        for (ind, particle) in enumerate(particles):
+            if particle.update(settings["timestep"]):
+                escape_steps[ind] = step
+        for ind in np.flatnonzero(batch.update(settings["timestep"])):
+            batch_escape_steps[ind] = step
+    np.testing.assert_allclose(batch.positions, [particle.position for particle in particles], rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(batch.velocities, [particle.velocity for particle in particles], rtol=1e-12, atol=1e-12)
+    assert batch_escape_steps == escape_steps
+
+@pytest.mark.skipif(not compiled.available, reason="numba is not installed")
+@pytest.mark.parametrize("policy", [{"mode" : "all"}, {"mode" : "every", "interval" : 7}, {"mode" : "window", "length" : 300}, {"mode" : "none"}], ids=recording.recording_modes)
+@pytest.mark.parametrize("retire", [False, True], ids=["kept", "retired"])
+def test_numba_matches_python(policy, retire):
+    settings = dict(tokamak_settings(), recording=policy, retire_escaped=retire)
+    python_data = run(settings, "python")
+    numba_data = run(settings, "numba")
+    np.testing.assert_allclose(numba_data["data"], python_data["data"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(numba_data["recorded_steps"], python_data["recorded_steps"])
+    np.testing.assert_array_equal(numba_data["cutoff_steps"], python_data["cutoff_steps"])
+    assert [time is False for time in numba_data["confinement_times"]] == [time is False for time in python_data["confinement_times"]]
+    np.testing.assert_allclose([time or 0 for time in numba_data["confinement_times"]], [time or 0 for time in python_data["confinement_times"]], rtol=1e-9)
+
+@pytest.mark.skipif(not compiled.available, reason="numba is not installed")
+def test_numba_matches_python_rk45():
+    settings = dict(tokamak_settings(particle_num=4, simulation_time=6), integrator="rk45")
+    python_data = run(settings, "python")
+    numba_data = run(settings, "numba")
+    np.testing.assert_allclose(numba_data["data"], python_data["data"], rtol=1e-9, atol=1e-7)
+    assert [time is False for time in numba_data["confinement_times"]] == [time is False for time in python_data["confinement_times"]]
+    np.testing.assert_allclose([time or 0 for time in numba_data["confinement_times"]], [time or 0 for time in python_data["confinement_times"]], rtol=1e-9)
+
+def test_space_charge_mesh_needs_room_for_margin():
+    field = tokamak_settings()["field"]
+    assert pic.Space_Charge_Mesh.from_settings({"shape" : (2 * pic.margin_cells + 1,) * 3}, field).shape == (2 * pic.margin_cells + 1,) * 3
+    for n in (2 * pic.margin_cells, 2 * pic.margin_cells - 1):
+        with pytest.raises(ValueError):
+            pic.Space_Charge_Mesh.from_settings({"shape" : (16, n, 16)}, field)
+
+class Killed(Exception):
+    pass
+
+@pytest.mark.parametrize("backend", ["python", "numba"])
+@pytest.mark.parametrize("retire", [False, True], ids=["kept", "retired"])
+def test_resumed_run_is_identical(tmp_path, backend, retire):
+    if backend == "numba" and not compiled.available:
+        pytest.skip("numba is not installed")
+    settings = dict(tokamak_settings(), retire_escaped=retire)
+    uninterrupted = run(settings, backend)
+
+    def kill(report): # kills the run once it is more than half done, after checkpoints were saved
+        if report["event"] == "milestone" and report["percent"] > 50:
+            raise Killed
+    checkpoint_path = str(tmp_path / "checkpoint.pkl")
+    with pytest.raises(Killed):
+        run(dict(settings, checkpoint={"path" : checkpoint_path, "every_steps" : 150}), backend, kill)
+    sim = Simulation()
+    sim.resume(checkpoint_path, instrumentation.quiet)
+    assert_same_run(sim.data, uninterrupted)
+    np.testing.assert_array_equal(sim.data["cutoff_steps"], uninterrupted["cutoff_steps"])
+
+def test_resumed_streamed_run_is_identical(tmp_path):
+    settings = dict(tokamak_settings(), stream_output={"path" : str(tmp_path / "reference"), "chunk_steps" : 50})
+    uninterrupted = run(settings)
+
+    def kill(report):
+        if report["event"] == "milestone" and report["percent"] > 50:
+            raise Killed
+    settings["stream_output"] = {"path" : str(tmp_path / "resumed"), "chunk_steps" : 50}
+    with pytest.raises(Killed):
+        run(dict(settings, checkpoint={"path" : str(tmp_path / "checkpoint.pkl"), "every_steps" : 150}), "python", kill)
+    sim = Simulation()
+    sim.resume(str(tmp_path / "checkpoint.pkl"), instrumentation.quiet)
+    streamed = recording.load_streamed_data(str(tmp_path / "resumed"))
+    np.testing.assert_array_equal(np.asarray(streamed["data"]), np.asarray(uninterrupted["data"]))
+    assert streamed["confinement_times"] == uninterrupted["confinement_times"]
+
+def test_streamed_output_loads_from_any_of_its_files(tmp_path, monkeypatch):
+    path = str(tmp_path / "streamed")
+    computed = run(dict(tokamak_settings(), stream_output={"path" : path, "chunk_steps" : 50}))
+    for suffix in (".json", ".npy", recording.wall_events_suffix):
+        sim = Simulation()
+        sim.load_data(absolute_path=path + suffix)
+        assert isinstance(sim.data["data"], np.memmap)
+        np.testing.assert_array_equal(sim.data["wall_events"], computed["wall_events"])
+    monkeypatch.setattr(visualisation, "extent_chunk_points", 7) # several chunks of records
+    lower, upper = visualisation.path_extent(sim.data["data"])
+    np.testing.assert_array_equal(lower, np.nanmin(np.asarray(sim.data["data"]), axis=(0, 1)))
+    np.testing.assert_array_equal(upper, np.nanmax(np.asarray(sim.data["data"]), axis=(0, 1)))
+
+def test_wall_events_log_face_and_energy():
+    settings = dict(tokamak_settings(), integrator="boris") # conserves energy at this timestep, which RK4 does not
+    data = run(settings)
+    events = data["wall_events"]
+    escaped = [ind for (ind, time) in enumerate(data["confinement_times"]) if time is not False]
+    assert len(events) > 0 and sorted(events["id"]) == escaped
+    np.testing.assert_array_equal(events["time"], sorted(data["confinement_times"][ind] for ind in escaped))
+    assert np.all(events["species"] == "Deuterium")
+
+    field = settings["field"]
+    boundaries = {"inner" : (np.hypot(events["position"][:, 0], events["position"][:, 1]), field.inner_radius), "outer" : (np.hypot(events["position"][:, 0], events["position"][:, 1]), field.outer_radius),
+                  "top" : (events["position"][:, 2], field.z_top), "bottom" : (events["position"][:, 2], field.z_bot)}
+    for (ind, face) in enumerate(events["face"]):
+        coordinates, boundary = boundaries[face]
+        np.testing.assert_allclose(coordinates[ind], boundary, rtol=1e-9)
+
+    mass, charge = utility.deuterium_mass, utility.elementary_charge
+    np.testing.assert_allclose(events["kinetic_energy"], 0.5 * mass * (events["velocity"]**2).sum(axis=1), rtol=1e-12)
+    potential_energy = lambda positions: -charge * positions @ field.E_vector - mass * positions @ field.G_vector
+    initial_positions = np.asarray(settings["deuterium_positions"])[events["id"]]
+    initial_energies = 0.5 * mass * (np.asarray(settings["deuterium_velocities"])[events["id"]]**2).sum(axis=1) + potential_energy(initial_positions)
+    np.testing.assert_allclose(events["kinetic_energy"] + potential_energy(events["position"]), initial_energies, rtol=1e-4)
+
+def test_cache_keys_follow_settings(tmp_path):
+    settings = tokamak_settings()
+    key = cache.settings_key(settings)
+    assert cache.settings_key(tokamak_settings()) == key
+    assert cache.settings_key(settings, "numba") != key
+    assert cache.settings_key(dict(settings, timestep=0.02)) != key
+    assert cache.settings_key(tokamak_settings(seed=4)) != key
+    assert cache.settings_key(tokamak_settings(simulation_time=10)) != key
+    assert cache.settings_key(dict(settings, recording={"mode" : "none"})) != key
+    assert cache.settings_key(dict(settings, checkpoint={"path" : "x"}, instrumentation={"profile" : True})) == key
+    gridded = lambda cache_folder: em.Gridded_Field(settings["field"], (1.9, -2.1), (6.1, 2.1), (5, 5), axisymmetric=True, cache_folder=cache_folder)
+    assert cache.settings_key(dict(settings, field=gridded(None))) == cache.settings_key(dict(settings, field=gridded(str(tmp_path))))
+
+def test_cache_hit_and_miss(tmp_path, monkeypatch):
+    settings = dict(tokamak_settings(simulation_time=5), result_cache={"folder" : str(tmp_path)})
+    computed = run(settings)
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+
+    def not_run(self):
+        raise AssertionError("the run was computed instead of loaded from the cache")
+    with monkeypatch.context() as patch:
+        patch.setattr(Simulation, "continue_run", not_run)
+        reports = []
+        cached = run(settings, report=reports.append)
+        assert_same_run(cached, computed)
+        assert [report["event"] for report in reports] == ["cached"] and reports[0]["percent"] == 100
+        assert cached["instrumentation"] == reports[0]
+
+    changed = run(dict(settings, timestep=0.02))
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
+    assert len(changed["data"][0]) != len(computed["data"][0])
+
+def test_serial_and_process_pool_sweeps_match(tmp_path):
+    cases = sweep.design_cases({"coil_num" : {"values" : [1000, 2000]}, "E_field" : {"values" : [1e-7, 1e-3]}}, "grid", {"speed" : 3, "simulation_time" : 5, "timestep" : 0.01})
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "pooled").mkdir()
+    serial = sweep.run_sweep(small_value.generate_small_value_tokamak_settings, cases, str(tmp_path / "serial"), workers=1, seed=11, extra_settings={"recording" : {"mode" : "none"}})
+    pooled = sweep.run_sweep(small_value.generate_small_value_tokamak_settings, cases, str(tmp_path / "pooled"), workers=2, seed=11, extra_settings={"recording" : {"mode" : "none"}})
+    assert serial == pooled
+    serial_table = sweep.load_summary_table(str(tmp_path / "serial"))
+    pooled_table = sweep.load_summary_table(str(tmp_path / "pooled"))
+    assert serial_table.dtype == pooled_table.dtype
+    for name in serial_table.dtype.names:
+        np.testing.assert_array_equal(serial_table[name], pooled_table[name])
@@ -1,4 +1,6 @@
 import numpy as np
+import contextlib
+import os
 
 # All units are standard SI units
 
@@ -32,6 +34,38 @@ def two_eq_rk4(x, x_prime, y, y_prime, h):
     y_result = y + (h/6) * (j1+2*j2+2*j3+j4)
     return (x_result, y_result)
 
+# Butcher tableau of the Dormand-Prince embedded Runge-Kutta 5(4) method: stage coefficients, 5th order weights and differences between 5th and 4th order weights (error weights)
+dormand_prince_a = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+dormand_prince_b = (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0)
+dormand_prince_e = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+def two_eq_dormand_prince(x, x_prime, y, y_prime, h):
+    """Returns numerically computed solution to 2 var coupled 1st order differential after 1 timestep using the Dormand-Prince 5(4) method given starting x, y values and respective derivative functions, along with estimates of the local errors of the solution
+    Args:
+        h: timestep; either a float or an array broadcastable against x and y (e.g. shape (N, 1) for a separate timestep for each row of (N, 3) arrays)
+    Returns tuple (x_result, y_result, x_error, y_error)
+    """
+    k = [] # derivatives of x at each stage
+    j = [] # derivatives of y at each stage
+    for stage_coefficients in dormand_prince_a:
+        x_stage = x + h * sum(coefficient * k_i for (coefficient, k_i) in zip(stage_coefficients, k) if coefficient)
+        y_stage = y + h * sum(coefficient * j_i for (coefficient, j_i) in zip(stage_coefficients, j) if coefficient)
+        k.append(x_prime(x_stage, y_stage))
+        j.append(y_prime(x_stage, y_stage))
+    x_result = x + h * sum(coefficient * k_i for (coefficient, k_i) in zip(dormand_prince_b, k) if coefficient)
+    y_result = y + h * sum(coefficient * j_i for (coefficient, j_i) in zip(dormand_prince_b, j) if coefficient)
+    x_error = h * sum(coefficient * k_i for (coefficient, k_i) in zip(dormand_prince_e, k) if coefficient)
+    y_error = h * sum(coefficient * j_i for (coefficient, j_i) in zip(dormand_prince_e, j) if coefficient)
+    return (x_result, y_result, x_error, y_error)
+
 def generate_field_vectors(vector_num, field_function, x, y, z):
     """Returns lists u, v, w denoting components of field vectors generated via field_function form input positions specified by x,y,z
     Args:
@@ -64,4 +98,63 @@ def cross(x, y):
     a = ((x[1] * y[2]) - (x[2] * y[1]))
     b = ((x[2] * y[0]) - (x[0] * y[2]))
     c = ((x[0] * y[1]) - (x[1] * y[0]))
-    return np.array((a,b,c), dtype)
\ No newline at end of file
+    return np.array((a,b,c), dtype)
+
+def cross_batch(x, y):
+    """Returns row-wise cross products of (N, 3) arrays x, y as a (N, 3) array
+    Uses the same arithmetic as cross so that batched results match the per-vector results exactly
+    """
+    result = np.empty(np.broadcast_shapes(np.shape(x), np.shape(y)), dtype)
+    result[:, 0] = (x[:, 1] * y[:, 2]) - (x[:, 2] * y[:, 1])
+    result[:, 1] = (x[:, 2] * y[:, 0]) - (x[:, 0] * y[:, 2])
+    result[:, 2] = (x[:, 0] * y[:, 1]) - (x[:, 1] * y[:, 0])
+    return result
+
+def as_trajectory_array(data):
+    """Returns trajectory data as a (n_particles, n_steps, 3) array of positions
+    Args:
+        data: either such an array already, or trajectories in the nested list format [[x values, y values, z values], ...] of older data files
+    """
+    if isinstance(data, np.ndarray):
+        return data
+    return np.array(data, dtype).reshape(len(data), 3, -1).transpose(0, 2, 1)
+
+def trajectory_to_nested_lists(trajectory):
+    """Returns (n_particles, n_steps, 3) trajectory array in the nested list format [[x values, y values, z values], ...] used by older data files and notebooks
+    """
+    return np.asarray(trajectory).transpose(0, 2, 1).tolist()
+
+def json_compatible(value):
+    """Returns a version of value which can be saved with json.dump; numpy arrays become lists, numpy scalars and types become Python numbers and type names, and objects with a to_dict method (e.g. fields) become their dictionary descriptions
+    """
+    if isinstance(value, dict):
+        return {str(key) : json_compatible(item) for (key, item) in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_compatible(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, type) and issubclass(value, np.generic):
+        return np.dtype(value).name
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb"):
+    """Returns context manager yielding a file opened with the given mode which replaces the file at path only once fully written,
+    so that readers (and runs resumed after an interruption) never see a partially written file
+    The file is written to path + ".tmp" first and moved into place when the with block ends; if the block raises, the temporary file is removed and path is left unchanged
+    """
+    temporary_path = path + ".tmp"
+    try:
+        with open(temporary_path, mode) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, path)
@@ -4,15 +4,30 @@ from matplotlib.animation import FuncAnimation
 from mpl_toolkits import mplot3d
 import utility
 
+extent_chunk_points = 10**6 # maximum number of positions read at once when finding the extent of the paths
+
+def path_extent(point_sets):
+    """Returns tuple (lower, upper) of (3,) arrays of the smallest and largest x, y and z over the (n_paths, n_points, 3) point_sets argument, ignoring NaN (e.g. records after trajectories were cut off)
+    The positions are read in chunks of records, so that memory mapped trajectories of streamed runs are never read into memory whole
+    """
+    lower = np.full(3, np.inf)
+    upper = np.full(3, -np.inf)
+    chunk = max(1, extent_chunk_points // max(len(point_sets), 1))
+    for start in range(0, point_sets.shape[1], chunk):
+        points = np.asarray(point_sets[:, start:start + chunk]).reshape(-1, 3)
+        lower = np.fmin(lower, np.fmin.reduce(points, axis=0)) # fmin and fmax ignore NaN
+        upper = np.fmax(upper, np.fmax.reduce(points, axis=0))
+    return (lower, upper)
+
 class Visualiser:
     """
     Handles plotting and animation visualisations
     """
     def __init__(self, visualisation_settings, point_sets, field_methods, to_proportion=False, custom_limits=None):
         self.visualisation_settings = visualisation_settings # contains settings such as colour of paths, path labels to appear in legend, etc.
-        self.point_sets = point_sets
+        self.point_sets = utility.as_trajectory_array(point_sets) # (n_paths, n_points, 3) array of path positions
         self.sets_num = len(self.point_sets)
-        self.points_num = len(self.point_sets[0][0])
+        self.points_num = self.point_sets.shape[1]
         self.labels_num = len(self.visualisation_settings["path_labels"])
         self.field_methods = field_methods
         self.field_colors = ["grey", "turquoise", "orange"] # set of colours for different vector fields to use
@@ -25,12 +40,7 @@ class Visualiser:
             self.z_min = custom_limits[2][0]
             self.z_max = custom_limits[2][1]
         else:
-            self.x_max = max([max(sets[0]) for sets in self.point_sets])
-            self.y_max = max([max(sets[1]) for sets in self.point_sets])
-            self.z_max = max([max(sets[2]) for sets in self.point_sets])
-            self.x_min = min([min(sets[0]) for sets in self.point_sets])
-            self.y_min = min([min(sets[1]) for sets in self.point_sets])
-            self.z_min = min([min(sets[2]) for sets in self.point_sets])
+            (self.x_min, self.y_min, self.z_min), (self.x_max, self.y_max, self.z_max) = path_extent(self.point_sets)
 
             if to_proportion:
                 min_limits = min((self.x_min, self.y_min, self.z_min)) 
@@ -59,7 +69,7 @@ class Visualiser:
 
         # Setup path plots
         for ind, sets in enumerate(self.point_sets):
-            ax.plot3D(sets[0], sets[1], sets[2], self.visualisation_settings["path_colors"][self.visualisation_settings["sets_color_ind"][ind]]+",")
+            ax.plot3D(sets[:, 0], sets[:, 1], sets[:, 2], self.visualisation_settings["path_colors"][self.visualisation_settings["sets_color_ind"][ind]]+",")
         # Setup path plot legends via empty plots (for setting legends directly seem to occasionally malfunction)
         for i in range(self.labels_num):
             ax.plot([], [], [], self.visualisation_settings["path_colors"][i]+",", label=self.visualisation_settings["path_labels"][i])
@@ -138,8 +148,8 @@ class Visualiser:
             """
             for ind_path, path_plot in enumerate(path_plots_list):
                 point_ind = round(frame_points * frame)
-                path_plot.set_data(self.point_sets[ind_path][0][:point_ind], self.point_sets[ind_path][1][:point_ind])
-                path_plot.set_3d_properties(self.point_sets[ind_path][2][:point_ind])
+                path_plot.set_data(self.point_sets[ind_path, :point_ind, 0], self.point_sets[ind_path, :point_ind, 1])
+                path_plot.set_3d_properties(self.point_sets[ind_path, :point_ind, 2])
             return path_plots_list
 
         ani = FuncAnimation(fig, update, frames=range(total_frames), init_func=init, interval=1000/fps, blit=True) # Generate animation